@@ -20,5 +20,9 @@ __all__ += [
 __all__ += [
     'get_data_by_pump',
     'get_data_by_date',
+    'get_data_by_date_range',
+    'get_frame_by_pump',
+    'get_frame_by_date',
+    'get_frame_by_date_range',
     'put_sensor_data',
 ]
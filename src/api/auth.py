@@ -1,26 +1,22 @@
 from typing import Tuple, Dict, Any, Optional
-import os
 import requests
 import time
 import base64
+import hashlib
 import json
-
-URL_API_BASE = os.environ.get('URL_API_BASE', 'http://127.0.0.1:8000/api/v1')
-
-
-def _url(path: str) -> str:
-    return URL_API_BASE.rstrip('/') + '/' + path.lstrip('/')
+from . import client
+from .cache import caller_identity, invalidates
 
 
 def register_user(username: str, name: str, password: str) -> Tuple[bool, str]:
     """Đăng ký người dùng mới qua API backend."""
     try:
-        resp = requests.post(_url('auth/dang-ky'), json={
+        resp = client.post('auth/dang-ky', json={
             'ten_dang_nhap': username,
             'ho_ten': name,
             'mat_khau': password,
-        }, timeout=5)
-        data = resp.json() if resp.content else {}
+        })
+        data = client.decode_json(resp)
         if resp.status_code in (200, 201):
             return True, data.get('message', 'Đăng ký thành công')
         else:
@@ -35,11 +31,11 @@ def authenticate_user(username: str, password: str) -> Tuple[bool, str, Optional
     token_exp là thời điểm hết hạn của token dưới dạng dấu thời gian unix (giây) nếu có.
     """
     try:
-        resp = requests.post(_url('auth/dang-nhap'), json={
+        resp = client.post('auth/dang-nhap', json={
             'ten_dang_nhap': username,
             'mat_khau': password,
-        }, timeout=5)
-        data = resp.json() if resp.content else {}
+        })
+        data = client.decode_json(resp)
         if resp.status_code == 200:
             token = (
                 data.get('access_token') or data.get('token') or data.get('jwt') or
@@ -101,26 +97,21 @@ def get_user_info(ma_nguoi_dung: str, token: Optional[str] = None) -> Dict[str,
 
     """
     try:
-        headers = {}
-        if token:
-            headers['Authorization'] = f'Bearer {token}'
-        resp = requests.get(_url(f'nguoi-dung/{ma_nguoi_dung}'), timeout=5, headers=headers)
+        resp = client.get(f'nguoi-dung/{ma_nguoi_dung}', token=token)
         if resp.status_code == 200 and resp.content:
-            return resp.json()
+            return client.decode_json(resp)
         return {}
     except requests.RequestException:
         return {}
 
 
+@invalidates('nguoi-dung')
 def update_user_info(ma_nguoi_dung: str, user_data: Dict[str, Any], token: Optional[str] = None) -> Tuple[bool, str]:
     """Cập nhật thông tin người dùng qua API backend.
 
     """
     try:
-        headers = {}
-        if token:
-            headers['Authorization'] = f'Bearer {token}'
-        resp = requests.put(_url(f'nguoi-dung/{ma_nguoi_dung}'), json=user_data, timeout=5, headers=headers)
+        resp = client.put(f'nguoi-dung/{ma_nguoi_dung}', json=user_data, token=token)
         data = None
         try:
             data = resp.json() if resp.content else {}
@@ -147,14 +138,11 @@ def change_password(current_password: str, new_password: str, token: Optional[st
 
     """
     try:
-        headers = {}
-        if token:
-            headers['Authorization'] = f'Bearer {token}'
-        resp = requests.post(_url('auth/doi-mat-khau'), json={
+        resp = client.post('auth/doi-mat-khau', json={
             'mat_khau_cu': current_password,
             'mat_khau_moi': new_password,
-        }, timeout=5, headers=headers)
-        data = resp.json() if resp.content else {}
+        }, token=token)
+        data = client.decode_json(resp)
         if resp.status_code == 200:
             return True, data.get('message', 'Đổi mật khẩu thành công')
         return False, data.get('message', data.get('error', 'Đổi mật khẩu thất bại'))
@@ -166,12 +154,12 @@ def forgot_password_verify(ten_dang_nhap: str, ten_may_bom: str, ngay_tuoi_gan_n
 
     """
     try:
-        resp = requests.post(_url('auth/quen-mat-khau/verify'), json={
+        resp = client.post('auth/quen-mat-khau/verify', json={
             'ten_dang_nhap': ten_dang_nhap,
             'ten_may_bom': ten_may_bom,
             'ngay_tuoi_gan_nhat': ngay_tuoi_gan_nhat,
-        }, timeout=5)
-        data = resp.json() if resp.content else {}
+        })
+        data = client.decode_json(resp)
         if resp.status_code == 200:
             return True, data.get('message', 'Xác thực thành công')
         return False, data.get('message', data.get('error', 'Xác thực thất bại'))
@@ -184,11 +172,11 @@ def forgot_password_reset(ten_dang_nhap: str, mat_khau_moi: str) -> Tuple[bool,
 
     """
     try:
-        resp = requests.post(_url('auth/quen-mat-khau/reset'), json={
+        resp = client.post('auth/quen-mat-khau/reset', json={
             'ten_dang_nhap': ten_dang_nhap,
             'mat_khau_moi': mat_khau_moi,
-        }, timeout=5)
-        data = resp.json() if resp.content else {}
+        })
+        data = client.decode_json(resp)
         if resp.status_code == 200:
             return True, data.get('message', 'Đặt lại mật khẩu thành công')
         return False, data.get('message', data.get('error', 'Đặt lại mật khẩu thất bại'))
@@ -217,3 +205,38 @@ def is_token_expired(token: Optional[str]) -> bool:
     except Exception:
         return True
 
+
+
+def decode_token(token: Optional[str]) -> Dict[str, Any]:
+    """Payload của token JWT (không kiểm tra chữ ký); {} khi không đọc được."""
+    if not token:
+        return {}
+    try:
+        parts = token.split('.')
+        if len(parts) < 2:
+            return {}
+        payload = parts[1] + '=' * (-len(parts[1]) % 4)
+        claims = json.loads(base64.urlsafe_b64decode(payload))
+        return claims if isinstance(claims, dict) else {}
+    except Exception:
+        return {}
+
+
+def token_user_id(token: Optional[str]) -> Optional[str]:
+    """Mã người dùng trong token (sub / id / user_id / ma_nguoi_dung), None nếu không có."""
+    claims = decode_token(token)
+    user_id = claims.get('sub') or claims.get('id') or claims.get('user_id') or claims.get('ma_nguoi_dung')
+    return str(user_id) if user_id is not None else None
+
+
+def session_key(token: Optional[str]) -> str:
+    """Khoá của một phiên đăng nhập (băm token); 'anonymous' khi không có token."""
+    if not token:
+        return 'anonymous'
+    return hashlib.blake2b(str(token).encode('utf-8'), digest_size=12).hexdigest()
+
+
+def user_scope(token: Optional[str]) -> str:
+    """Phạm vi dữ liệu của người gọi: 'user:<mã>' khi token có mã người dùng, ngược lại băm token."""
+    user_id = token_user_id(token)
+    return f'user:{user_id}' if user_id is not None else caller_identity(token)
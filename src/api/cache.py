@@ -0,0 +1,252 @@
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import functools
+import hashlib
+import inspect
+import json
+import os
+import threading
+import time
+from . import metrics
+
+CACHE_ENABLED = os.environ.get('API_CACHE_ENABLED', '1') not in ('0', 'false', 'False')
+CACHE_MAX_ENTRIES = int(os.environ.get('API_CACHE_MAX_ENTRIES', '512'))
+CACHE_MAX_BYTES = int(os.environ.get('API_CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+
+# (ttl, stale) theo nhóm endpoint, tính bằng giây. Sau `ttl` giá trị vẫn được trả
+# về thêm `stale` giây trong khi một luồng nền tải lại.
+CACHE_TTLS: Dict[str, Tuple[float, float]] = {
+    'may-bom': (4.0, 30.0),
+    'cam-bien': (30.0, 120.0),
+    'loai-cam-bien': (300.0, 600.0),
+    'mo-hinh-du-bao': (15.0, 60.0),
+    'nguoi-dung': (30.0, 120.0),
+}
+DEFAULT_TTL = (5.0, 30.0)
+
+
+class _Entry:
+    __slots__ = ('value', 'stored_at', 'ttl', 'stale', 'size', 'group')
+
+    def __init__(self, value: Any, ttl: float, stale: float, size: int, group: str):
+        self.value = value
+        self.stored_at = time.monotonic()
+        self.ttl = ttl
+        self.stale = stale
+        self.size = size
+        self.group = group
+
+    def age(self) -> float:
+        return time.monotonic() - self.stored_at
+
+
+class ResponseCache:
+    """Cache LRU cho kết quả đọc từ backend, giới hạn theo số mục và số byte."""
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, max_bytes: int = CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: 'OrderedDict[tuple, _Entry]' = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self._generations: Dict[str, int] = {}
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='api-cache-refresh')
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+    def lookup(self, key: tuple) -> Tuple[Optional[_Entry], bool]:
+        """Trả về (entry, is_fresh); entry là None khi không có hoặc đã hết hạn."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None, False
+            age = entry.age()
+            if age <= entry.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry, True
+            if age <= entry.ttl + entry.stale:
+                self._entries.move_to_end(key)
+                self.stale_hits += 1
+                return entry, False
+            self._drop(key)
+            self.misses += 1
+            return None, False
+
+    def store(self, key: tuple, value: Any, group: str, ttl: float, stale: float,
+              generation: Optional[int] = None) -> None:
+        """Lưu `value`; bỏ qua khi nhóm đã bị invalidate sau lúc bắt đầu tải (`generation` lấy trước khi tải)."""
+        size = _estimate_size(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if generation is not None and self._generations.get(group, 0) != generation:
+                return
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = _Entry(value, ttl, stale, size, group)
+            self._bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+
+    def invalidate(self, *groups: str) -> None:
+        with self._lock:
+            for group in groups:
+                self._generations[group] = self._generations.get(group, 0) + 1
+            for key in [k for k, e in self._entries.items() if e.group in groups]:
+                self._drop(key)
+
+    def generation(self, group: str) -> int:
+        """Số lần nhóm bị xoá do ghi; bộ nhớ đệm khác (ví dụ api.poller) so sánh để biết cần tải lại."""
+        with self._lock:
+            return self._generations.get(group, 0)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def refresh_async(self, key: tuple, loader: Callable[[], Any], group: str, ttl: float, stale: float) -> None:
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+            generation = self._generations.get(group, 0)
+
+        def _run():
+            try:
+                value = loader()
+                if is_cacheable(value):
+                    self.store(key, value, group, ttl, stale, generation)
+            except Exception as e:
+                print(f"Error refreshing cache entry {group}: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        self._executor.submit(_run)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'stale_hits': self.stale_hits,
+                'misses': self.misses,
+            }
+
+    def _drop(self, key: tuple) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+
+def _estimate_size(value: Any) -> int:
+    try:
+        return len(json.dumps(value, default=str, separators=(',', ':')))
+    except (TypeError, ValueError):
+        return 1024
+
+
+def is_cacheable(value: Any) -> bool:
+    """Chỉ cache kết quả thành công: các hàm trong src/api trả về {} / [] hoặc dict có 'error' khi lỗi."""
+    if isinstance(value, dict):
+        return bool(value) and 'error' not in value
+    if isinstance(value, list):
+        return bool(value)
+    return value is not None
+
+
+def caller_identity(token: Optional[str]) -> str:
+    if not token:
+        return 'anon'
+    return hashlib.sha1(token.encode('utf-8')).hexdigest()[:16]
+
+
+response_cache = ResponseCache()
+
+
+def _collect_metrics() -> List[str]:
+    stats = response_cache.stats()
+    lookups = stats['hits'] + stats['stale_hits'] + stats['misses']
+    lines = metrics.sample_lines('api_cache_entries', 'Số mục trong cache response.', [({}, stats['entries'])])
+    lines += metrics.sample_lines('api_cache_bytes', 'Kích thước ước tính của cache response.', [({}, stats['bytes'])])
+    lines += metrics.sample_lines('api_cache_lookups_total', 'Số lần tra cache theo kết quả.', [
+        ({'result': 'hit'}, stats['hits']),
+        ({'result': 'stale'}, stats['stale_hits']),
+        ({'result': 'miss'}, stats['misses']),
+    ], kind='counter')
+    lines += metrics.sample_lines('api_cache_hit_ratio', 'Tỉ lệ tra cache có kết quả (kể cả stale).',
+                                  [({}, (stats['hits'] + stats['stale_hits']) / lookups if lookups else 0.0)])
+    return lines
+
+
+metrics.registry.add_collector(_collect_metrics)
+
+
+def cached(group: str, ttl: Optional[float] = None, stale: Optional[float] = None):
+    """Decorator cache kết quả của một hàm đọc theo (hàm, tham số, người gọi).
+
+    Giá trị trả về được dùng chung giữa các callback nên phải coi là chỉ đọc.
+    """
+    default_ttl, default_stale = CACHE_TTLS.get(group, DEFAULT_TTL)
+    ttl = default_ttl if ttl is None else ttl
+    stale = default_stale if stale is None else stale
+
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not CACHE_ENABLED:
+                return func(*args, **kwargs)
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            arguments = dict(bound.arguments)
+            token = arguments.pop('token', None)
+            key = (func.__module__, func.__qualname__, caller_identity(token),
+                   json.dumps(arguments, sort_keys=True, default=str))
+
+            entry, fresh = response_cache.lookup(key)
+            if entry is not None:
+                if not fresh:
+                    response_cache.refresh_async(key, lambda: func(*args, **kwargs), group, ttl, stale)
+                return entry.value
+
+            # Lấy generation trước khi tải: kết quả tải trước một lần ghi không được đưa lại vào cache.
+            generation = response_cache.generation(group)
+            value = func(*args, **kwargs)
+            if is_cacheable(value):
+                response_cache.store(key, value, group, ttl, stale, generation)
+            return value
+
+        wrapper.cache_group = group
+        return wrapper
+
+    return decorator
+
+
+def invalidates(*groups: str):
+    """Decorator cho hàm ghi trả về (success, message): xoá cache các nhóm khi thành công."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            result = func(*args, **kwargs)
+            ok = result[0] if isinstance(result, tuple) and result else bool(result)
+            if ok:
+                response_cache.invalidate(*groups)
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+def invalidate(*groups: str) -> None:
+    response_cache.invalidate(*groups)
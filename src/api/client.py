@@ -0,0 +1,200 @@
+from typing import Dict, Any, List, Optional
+import os
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from .singleflight import SingleFlight, WaitTimeout
+from . import metrics, resilience
+from .conditional import CONDITIONAL_ENABLED, UNSET, ValidatorStore
+
+URL_API_BASE = os.environ.get('URL_API_BASE', 'http://127.0.0.1:8000/api/v1')
+
+# Số kết nối keep-alive giữ lại cho backend; nên >= số luồng worker của Dash.
+API_POOL_SIZE = int(os.environ.get('API_POOL_SIZE', '20'))
+API_TIMEOUT = float(os.environ.get('API_TIMEOUT', '5'))
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+_get_flight = SingleFlight()
+validators = ValidatorStore()
+
+
+def _url(path: str) -> str:
+    return URL_API_BASE.rstrip('/') + '/' + path.lstrip('/')
+
+
+def _build_session(pool_size: int) -> requests.Session:
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, pool_block=False)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update({'Connection': 'keep-alive', 'Accept': 'application/json'})
+    return session
+
+
+def get_session() -> requests.Session:
+    """Trả về session dùng chung (tạo lần đầu khi cần).
+
+    Session giữ pool kết nối urllib3 nên các lời gọi từ nhiều callback Dash
+    tái sử dụng socket thay vì bắt tay TCP lại mỗi lần.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _build_session(API_POOL_SIZE)
+    return _session
+
+
+def configure(pool_size: Optional[int] = None, base_url: Optional[str] = None) -> None:
+    """Thay đổi kích thước pool hoặc URL backend; session cũ được đóng."""
+    global _session, API_POOL_SIZE, URL_API_BASE
+    with _session_lock:
+        if pool_size is not None:
+            API_POOL_SIZE = int(pool_size)
+        if base_url is not None:
+            URL_API_BASE = base_url
+        old, _session = _session, None
+    if old is not None:
+        old.close()
+
+
+def auth_headers(token: Optional[str] = None, headers: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    merged = dict(headers or {})
+    if token:
+        merged['Authorization'] = f'Bearer {token}'
+    return merged
+
+
+def request(method: str, path: str, token: Optional[str] = None, params: Optional[Dict[str, Any]] = None,
+            json: Any = None, headers: Optional[Dict[str, str]] = None, timeout: Optional[float] = None) -> requests.Response:
+    """Gửi request tới backend qua session dùng chung.
+
+    Các GET giống hệt nhau (cùng URL, tham số và token) đang chạy đồng thời được
+    gộp thành một lời gọi upstream, và được gửi kèm If-None-Match /
+    If-Modified-Since khi đã có validator (xem conditional.ValidatorStore).
+    Timeout được thu nhỏ theo ngân sách của callback hiện tại và mỗi nhóm
+    endpoint có một circuit breaker (xem resilience). Lỗi kết nối, mạch đang mở
+    hay hết ngân sách đều được ném ra dưới dạng requests.RequestException để các
+    hàm trong src/api xử lý như trước.
+    """
+    url = _url(path)
+    merged_headers = auth_headers(token, headers)
+    timeout = API_TIMEOUT if timeout is None else timeout
+    group = resilience.endpoint_group(path)
+    breaker = resilience.get_breaker(group)
+
+    def _send(send_headers: Dict[str, str]) -> requests.Response:
+        started = time.monotonic()
+        try:
+            effective = resilience.bounded_timeout(timeout)
+            breaker.allow()
+        except requests.RequestException as e:
+            metrics.observe_upstream(group, method, started, error=e)
+            raise
+        metrics.upstream_in_flight.inc(group=group)
+        try:
+            resp = get_session().request(method, url, params=params, json=json,
+                                         headers=send_headers, timeout=effective)
+        except requests.Timeout as e:
+            metrics.observe_upstream(group, method, started, error=e)
+            # Timeout do ngân sách callback thu nhỏ không phải lỗi của backend.
+            if effective < timeout:
+                breaker.record_neutral()
+            else:
+                breaker.record_failure()
+            raise
+        except requests.RequestException as e:
+            metrics.observe_upstream(group, method, started, error=e)
+            breaker.record_failure()
+            raise
+        finally:
+            metrics.upstream_in_flight.dec(group=group)
+        metrics.observe_upstream(group, method, started, status=resp.status_code, size=len(resp.content or b''))
+        if resilience.is_failure_status(resp.status_code):
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        return resp
+
+    if method.upper() != 'GET':
+        return _send(merged_headers)
+
+    key = _flight_key(url, params, merged_headers)
+    if not CONDITIONAL_ENABLED:
+        fn = lambda: _send(merged_headers)
+    else:
+        def fn() -> requests.Response:
+            send_headers = dict(merged_headers)
+            send_headers.update(validators.conditional_headers(key))
+            return validators.apply(key, _send(send_headers))
+
+    try:
+        return _get_flight.do(key, fn, wait_timeout=resilience.remaining())
+    except WaitTimeout:
+        raise resilience.DeadlineExceeded('Hết thời gian xử lý cho callback')
+
+
+def _flight_key(url: str, params: Optional[Dict[str, Any]], headers: Dict[str, str]) -> tuple:
+    # requests bỏ qua tham số có giá trị None nên khoá cũng bỏ qua.
+    items = tuple(sorted((str(k), str(v)) for k, v in (params or {}).items() if v is not None))
+    return (url, items, tuple(sorted(headers.items())))
+
+
+def get(path: str, **kwargs) -> requests.Response:
+    return request('GET', path, **kwargs)
+
+
+def post(path: str, **kwargs) -> requests.Response:
+    return request('POST', path, **kwargs)
+
+
+def put(path: str, **kwargs) -> requests.Response:
+    return request('PUT', path, **kwargs)
+
+
+def delete(path: str, **kwargs) -> requests.Response:
+    return request('DELETE', path, **kwargs)
+
+
+def decode_json(resp: requests.Response, default: Any = None) -> Any:
+    """Giải mã body JSON; trả về `default` (mặc định {}) khi body rỗng hoặc lỗi.
+
+    Nếu body không đổi so với lần GET trước (304 hoặc cùng hash), đối tượng đã
+    giải mã lần trước được trả lại nguyên vẹn, nên phải coi là chỉ đọc.
+    """
+    if default is None:
+        default = {}
+    validator = getattr(resp, 'validator', None)
+    if validator is not None and validator.decoded is not UNSET:
+        return validator.decoded
+    if not resp.content:
+        return default
+    try:
+        data = resp.json()
+    except ValueError:
+        return default
+    if validator is not None:
+        validator.decoded = data
+    return data
+
+
+def _collect_metrics() -> List[str]:
+    cond = validators.stats()
+    polls = cond['not_modified'] + cond['identical'] + cond['changed']
+    lines = metrics.sample_lines('api_conditional_get_total', 'Số GET có validator theo kết quả.', [
+        ({'result': 'not_modified'}, cond['not_modified']),
+        ({'result': 'identical'}, cond['identical']),
+        ({'result': 'changed'}, cond['changed']),
+    ], kind='counter')
+    lines += metrics.sample_lines('api_conditional_get_unchanged_ratio', 'Tỉ lệ GET nhận lại dữ liệu không đổi.',
+                                  [({}, (cond['not_modified'] + cond['identical']) / polls if polls else 0.0)])
+    lines += metrics.sample_lines('api_singleflight_shared_total', 'Số GET được gộp vào lời gọi đang chạy.',
+                                  [({}, _get_flight.shared)], kind='counter')
+    lines += metrics.sample_lines('api_singleflight_in_flight', 'Số GET khác nhau đang chạy.',
+                                  [({}, _get_flight.in_flight())])
+    return lines
+
+
+metrics.registry.add_collector(_collect_metrics)
@@ -0,0 +1,136 @@
+from typing import Any, Dict, Hashable, Optional
+from collections import OrderedDict
+import hashlib
+import os
+import threading
+
+CONDITIONAL_ENABLED = os.environ.get('API_CONDITIONAL_GET', '1') not in ('0', 'false', 'False')
+VALIDATOR_MAX_ENTRIES = int(os.environ.get('API_VALIDATOR_MAX_ENTRIES', '256'))
+VALIDATOR_MAX_BYTES = int(os.environ.get('API_VALIDATOR_MAX_BYTES', str(16 * 1024 * 1024)))
+
+UNSET = object()
+
+
+def body_digest(body: bytes) -> bytes:
+    return hashlib.blake2b(body or b'', digest_size=16).digest()
+
+
+class Validator:
+    """Thông tin của lần GET thành công gần nhất cho một URL."""
+
+    __slots__ = ('etag', 'last_modified', 'digest', 'body', 'decoded')
+
+    def __init__(self, etag: Optional[str], last_modified: Optional[str], digest: bytes, body: bytes):
+        self.etag = etag
+        self.last_modified = last_modified
+        self.digest = digest
+        self.body = body
+        self.decoded = UNSET
+
+    def request_headers(self) -> Dict[str, str]:
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class ValidatorStore:
+    """Lưu ETag/Last-Modified (hoặc hash của body) theo URL để gửi GET có điều kiện.
+
+    Khi backend trả 304 hoặc body giống hệt lần trước, response được đánh dấu
+    `unchanged` và mang theo Validator cũ để client.decode_json dùng lại đối
+    tượng đã giải mã thay vì parse JSON lần nữa.
+    """
+
+    def __init__(self, max_entries: int = VALIDATOR_MAX_ENTRIES, max_bytes: int = VALIDATOR_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: 'OrderedDict[Hashable, Validator]' = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.not_modified = 0
+        self.identical = 0
+        self.changed = 0
+
+    def get(self, key: Hashable) -> Optional[Validator]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def conditional_headers(self, key: Hashable) -> Dict[str, str]:
+        entry = self.get(key)
+        return entry.request_headers() if entry is not None else {}
+
+    def apply(self, key: Hashable, resp: Any) -> Any:
+        """Cập nhật validator từ response và gắn `unchanged` / `validator` vào resp."""
+        resp.unchanged = False
+        resp.validator = None
+        entry = self.get(key)
+
+        if resp.status_code == 304:
+            if entry is None:
+                return resp
+            # Trả lại như một 200 để các hàm trong src/api không phải xử lý 304.
+            resp.status_code = 200
+            resp._content = entry.body
+            resp.unchanged = True
+            resp.validator = entry
+            with self._lock:
+                self.not_modified += 1
+            return resp
+
+        if resp.status_code != 200:
+            return resp
+
+        body = resp.content or b''
+        digest = body_digest(body)
+        etag = resp.headers.get('ETag')
+        last_modified = resp.headers.get('Last-Modified')
+        if entry is not None and entry.digest == digest:
+            entry.etag = etag or entry.etag
+            entry.last_modified = last_modified or entry.last_modified
+            resp.unchanged = True
+            resp.validator = entry
+            with self._lock:
+                self.identical += 1
+            return resp
+
+        entry = Validator(etag, last_modified, digest, body)
+        resp.validator = entry
+        self._store(key, entry)
+        with self._lock:
+            self.changed += 1
+        return resp
+
+    def _store(self, key: Hashable, entry: Validator) -> None:
+        size = len(entry.body)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old.body)
+            self._entries[key] = entry
+            self._bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                _, dropped = self._entries.popitem(last=False)
+                self._bytes -= len(dropped.body)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'not_modified': self.not_modified,
+                'identical': self.identical,
+                'changed': self.changed,
+            }
@@ -0,0 +1,115 @@
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import date, datetime, timedelta
+import os
+import threading
+import time
+from . import resilience
+
+# Số luồng tối đa dùng chung cho mọi truy vấn theo khoảng ngày.
+RANGE_MAX_WORKERS = int(os.environ.get('API_RANGE_WORKERS', '8'))
+# Thời gian tối đa (giây) cho cả một truy vấn khoảng ngày.
+RANGE_DEADLINE = float(os.environ.get('API_RANGE_DEADLINE', '10'))
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+DateLike = Union[str, date, datetime]
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=RANGE_MAX_WORKERS, thread_name_prefix='api-range')
+    return _executor
+
+
+def to_date(value: DateLike) -> date:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(str(value)[:10], '%Y-%m-%d').date()
+
+
+def iter_days(start: DateLike, end: DateLike) -> List[str]:
+    """Danh sách ngày 'YYYY-MM-DD' từ start tới end (bao gồm cả hai đầu), mới nhất trước."""
+    start_d, end_d = to_date(start), to_date(end)
+    if start_d > end_d:
+        start_d, end_d = end_d, start_d
+    days = (end_d - start_d).days
+    return [(end_d - timedelta(days=i)).isoformat() for i in range(days + 1)]
+
+
+def _extract_rows(response: Any) -> Tuple[List[Dict[str, Any]], bool]:
+    if isinstance(response, dict):
+        rows = response.get('data') or []
+        return (rows if isinstance(rows, list) else []), 'error' in response
+    if isinstance(response, list):
+        return response, False
+    return [], True
+
+
+def map_days(fetch_one: Callable[[str], Any], days: List[str],
+             deadline: Optional[float] = None) -> Tuple[Dict[str, Any], List[str]]:
+    """Gọi `fetch_one(ngay)` song song cho từng ngày.
+
+    Trả về (kết quả theo ngày, các ngày lỗi hoặc chưa xong khi hết `deadline`).
+    `deadline` không vượt quá ngân sách còn lại của callback đang gọi.
+    """
+    deadline = RANGE_DEADLINE if deadline is None else deadline
+    left = resilience.remaining()
+    if left is not None:
+        deadline = max(0.0, min(deadline, left))
+    executor = _get_executor()
+    futures = {resilience.submit_with_context(executor, fetch_one, day): day for day in days}
+    done, not_done = wait(futures, timeout=deadline)
+    for future in not_done:
+        future.cancel()
+
+    results: Dict[str, Any] = {}
+    missing = [futures[f] for f in not_done]
+    for future in done:
+        day = futures[future]
+        try:
+            results[day] = future.result()
+        except Exception as e:
+            print(f"Error fetching {day}: {e}")
+            missing.append(day)
+    return results, sorted(set(missing), reverse=True)
+
+
+def fetch_days(fetch_one: Callable[[str], Any], start: DateLike, end: DateLike,
+               sort_key: Callable[[Dict[str, Any]], Any], deadline: Optional[float] = None,
+               reverse: bool = False) -> Dict[str, Any]:
+    """Gọi `fetch_one(ngay)` song song cho từng ngày rồi gộp và sắp xếp kết quả.
+
+    Ngày nào lỗi hoặc chưa xong khi hết `deadline` được liệt kê trong
+    'missing_days' và 'partial' là True; dữ liệu các ngày còn lại vẫn được trả về.
+    """
+    days = iter_days(start, end)
+    started = time.monotonic()
+    results, missing = map_days(fetch_one, days, deadline)
+
+    rows: List[Dict[str, Any]] = []
+    for day, response in results.items():
+        day_rows, failed = _extract_rows(response)
+        if failed:
+            missing.append(day)
+        rows.extend(day_rows)
+
+    try:
+        rows.sort(key=sort_key, reverse=reverse)
+    except TypeError:
+        pass
+
+    return {
+        'data': rows,
+        'total': len(rows),
+        'days': days,
+        'missing_days': sorted(set(missing), reverse=True),
+        'partial': bool(missing),
+        'elapsed': round(time.monotonic() - started, 3),
+    }
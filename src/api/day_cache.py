@@ -0,0 +1,132 @@
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from zoneinfo import ZoneInfo
+import hashlib
+import json
+import os
+import threading
+from .sensor_frame import LOCAL_TZ
+
+DAY_CACHE_MAX_ENTRIES = int(os.environ.get('API_DAY_CACHE_MAX_ENTRIES', '2048'))
+# Thư mục lưu các ngày đã đóng; chuỗi rỗng để chỉ dùng bộ nhớ.
+DAY_CACHE_DIR = os.environ.get('API_DAY_CACHE_DIR',
+                               os.path.join(os.path.expanduser('~'), '.cache', 'predict-water-flow', 'days'))
+# Một ngày chỉ được coi là đã đóng sau nửa đêm thêm số giây này (bản ghi ghi muộn).
+DAY_CACHE_GRACE = float(os.environ.get('API_DAY_CACHE_GRACE', '600'))
+
+
+def local_now() -> datetime:
+    """Thời điểm hiện tại theo giờ Asia/Bangkok (ngày của backend)."""
+    return datetime.now(ZoneInfo(LOCAL_TZ))
+
+
+def is_closed_day(day: str, now: Optional[datetime] = None, grace: float = DAY_CACHE_GRACE) -> bool:
+    """Ngày 'YYYY-MM-DD' đã kết thúc theo giờ Asia/Bangkok (cộng thêm `grace` giây)."""
+    tz = ZoneInfo(LOCAL_TZ)
+    now = now.astimezone(tz) if now is not None else local_now()
+    try:
+        start = datetime.combine(date.fromisoformat(str(day)[:10]), datetime.min.time(), tzinfo=tz)
+    except ValueError:
+        return False
+    return now >= start + timedelta(days=1, seconds=grace)
+
+
+class DayPartitionCache:
+    """Cache response theo (scope, ngày) cho các ngày đã đóng.
+
+    Ngày đã qua không còn thay đổi nên được giữ vĩnh viễn trên đĩa và trong bộ
+    nhớ (LRU giới hạn số mục); ngày hiện tại luôn được tải lại. Giá trị trả về
+    được dùng chung giữa các callback nên coi là chỉ đọc.
+    """
+
+    def __init__(self, namespace: str, directory: Optional[str] = DAY_CACHE_DIR,
+                 max_entries: int = DAY_CACHE_MAX_ENTRIES):
+        self.namespace = namespace
+        self.directory = os.path.join(directory, namespace) if directory else None
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: 'OrderedDict[Tuple[Hashable, str], Any]' = OrderedDict()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.bypass = 0
+
+    def _path(self, scope: Hashable, day: str) -> Optional[str]:
+        if not self.directory:
+            return None
+        digest = hashlib.blake2b(repr(scope).encode('utf-8'), digest_size=10).hexdigest()
+        return os.path.join(self.directory, digest, f'{day}.json')
+
+    def _remember(self, key: Tuple[Hashable, str], value: Any) -> None:
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _load(self, scope: Hashable, day: str) -> Any:
+        path = self._path(scope, day)
+        if not path or not os.path.exists(path):
+            return None
+        try:
+            with open(path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Error reading day cache {path}: {e}")
+            return None
+
+    def _store(self, scope: Hashable, day: str, value: Any) -> None:
+        path = self._path(scope, day)
+        if not path:
+            return
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(value, f, ensure_ascii=False)
+            os.replace(tmp, path)
+        except (OSError, TypeError, ValueError) as e:
+            print(f"Error writing day cache {path}: {e}")
+
+    def get(self, scope: Hashable, day: str) -> Any:
+        key = (scope, day)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+        value = self._load(scope, day)
+        if value is not None:
+            self.disk_hits += 1
+            self._remember(key, value)
+        return value
+
+    def get_or_fetch(self, scope: Hashable, day: str, fetch: Callable[[], Any],
+                     cacheable: Callable[[Any], bool] = lambda value: True) -> Any:
+        """Trả về giá trị đã lưu của ngày đã đóng, nếu chưa có thì gọi `fetch` và lưu lại."""
+        if not is_closed_day(day):
+            self.bypass += 1
+            return fetch()
+        value = self.get(scope, day)
+        if value is not None:
+            return value
+        self.misses += 1
+        value = fetch()
+        if value is not None and cacheable(value):
+            self._remember((scope, day), value)
+            self._store(scope, day, value)
+        return value
+
+    def clear(self, disk: bool = False) -> None:
+        with self._lock:
+            self._entries.clear()
+        if disk and self.directory and os.path.isdir(self.directory):
+            import shutil
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            entries = len(self._entries)
+        return {'entries': entries, 'hits': self.hits, 'disk_hits': self.disk_hits,
+                'misses': self.misses, 'bypass': self.bypass}
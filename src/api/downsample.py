@@ -0,0 +1,141 @@
+from typing import Any, Callable, Dict, Hashable, Optional, Sequence, Tuple
+from collections import OrderedDict
+import os
+import threading
+import time
+import numpy as np
+import pandas as pd
+from .sensor_frame import LOCAL_TZ, NAT, SensorFrame
+
+# Số điểm tối đa mỗi trace gửi xuống trình duyệt.
+CHART_MAX_POINTS = int(os.environ.get('API_CHART_MAX_POINTS', '1500'))
+# Thời gian (giây) giữ frame đầy đủ để phóng to không phải tải lại từ backend.
+CHART_CACHE_TTL = float(os.environ.get('API_CHART_CACHE_TTL', '300'))
+CHART_CACHE_MAX_ENTRIES = int(os.environ.get('API_CHART_CACHE_MAX_ENTRIES', '64'))
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """Chỉ số các điểm được giữ theo Largest-Triangle-Three-Buckets.
+
+    `x` tăng dần, không có NaN trong `y`. Điểm đầu/cuối luôn được giữ; mỗi bucket
+    giữa chọn điểm tạo tam giác lớn nhất với điểm đã chọn trước đó và trung bình
+    bucket kế tiếp, nên đỉnh/đáy không bị làm phẳng như khi lấy mẫu đều.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64) - float(x[0])
+    y = np.asarray(y, dtype=np.float64)
+    buckets = threshold - 2
+    edges = np.linspace(1, n - 1, buckets + 1).astype(np.int64)
+
+    # Trung bình từng bucket bằng tổng tích luỹ; bucket "kế tiếp" của bucket cuối là điểm cuối.
+    cx, cy = np.concatenate(([0.0], np.cumsum(x))), np.concatenate(([0.0], np.cumsum(y)))
+    counts = np.maximum(edges[1:] - edges[:-1], 1)
+    mean_x = (cx[edges[1:]] - cx[edges[:-1]]) / counts
+    mean_y = (cy[edges[1:]] - cy[edges[:-1]]) / counts
+    next_x = np.append(mean_x[1:], x[-1])
+    next_y = np.append(mean_y[1:], y[-1])
+
+    out = np.empty(threshold, dtype=np.int64)
+    out[0], out[-1] = 0, n - 1
+    a = 0
+    for i in range(buckets):
+        lo, hi = edges[i], edges[i + 1]
+        ax, ay = x[a], y[a]
+        area = np.abs((ax - next_x[i]) * (y[lo:hi] - ay) - (ax - x[lo:hi]) * (next_y[i] - ay))
+        a = lo + int(area.argmax()) if hi > lo else lo
+        out[i + 1] = a
+    return out
+
+
+def downsample_series(timestamps: np.ndarray, values: np.ndarray,
+                      max_points: int = CHART_MAX_POINTS) -> Tuple[np.ndarray, np.ndarray]:
+    """(timestamps, values) đã bỏ điểm thiếu và giảm còn tối đa `max_points` bằng LTTB."""
+    keep = (timestamps != NAT) & np.isfinite(values)
+    timestamps, values = timestamps[keep], values[keep]
+    index = lttb_indices(timestamps, values, max_points)
+    return timestamps[index], values[index]
+
+
+def chart_series(frame: SensorFrame, columns: Sequence[str], max_points: int = CHART_MAX_POINTS,
+                 window: Optional[Tuple[int, int]] = None,
+                 tz: str = LOCAL_TZ) -> Dict[str, Tuple[pd.DatetimeIndex, np.ndarray]]:
+    """Các trace sẵn sàng cho plotly: cột -> (thời gian theo `tz`, giá trị), mỗi trace tối đa `max_points`.
+
+    `frame` đã sắp theo thời gian. `window` (ns UTC) chỉ lấy phần đang hiển thị, nên khi
+    phóng to độ phân giải được tính lại từ dữ liệu đầy đủ.
+    """
+    timestamps = frame.timestamps
+    lo, hi = 0, len(timestamps)
+    if window is not None:
+        lo, hi = np.searchsorted(timestamps, window[0], 'left'), np.searchsorted(timestamps, window[1], 'right')
+        # Giữ một điểm ngoài mỗi biên để đường nối tới mép biểu đồ.
+        lo, hi = max(lo - 1, 0), min(hi + 1, len(timestamps))
+    series = {}
+    for name in columns:
+        if name not in frame.values:
+            continue
+        x, y = downsample_series(timestamps[lo:hi], frame.values[name][lo:hi], max_points)
+        series[name] = (pd.to_datetime(x, unit='ns', utc=True).tz_convert(tz), y)
+    return series
+
+
+def relayout_window(relayout_data: Any, tz: str = LOCAL_TZ) -> Tuple[bool, Optional[Tuple[int, int]]]:
+    """Đọc relayoutData của dcc.Graph: (có đổi trục x không, khoảng (ns UTC) đang xem hoặc None = toàn bộ).
+
+    Plotly trả về thời gian theo giờ hiển thị (không có múi giờ), nên được hiểu theo `tz`.
+    """
+    if not isinstance(relayout_data, dict):
+        return False, None
+    if relayout_data.get('xaxis.autorange'):
+        return True, None
+    bounds = relayout_data.get('xaxis.range')
+    if not isinstance(bounds, (list, tuple)) or len(bounds) != 2:
+        bounds = (relayout_data.get('xaxis.range[0]'), relayout_data.get('xaxis.range[1]'))
+    if bounds[0] is None or bounds[1] is None:
+        return False, None
+    try:
+        start, end = (pd.Timestamp(b) for b in bounds)
+        start = start.tz_localize(tz) if start.tzinfo is None else start
+        end = end.tz_localize(tz) if end.tzinfo is None else end
+    except (ValueError, TypeError):
+        return False, None
+    return True, (int(start.value), int(end.value))
+
+
+class FrameCache:
+    """Giữ frame đầy đủ độ phân giải theo khoá trong `ttl` giây (LRU), dùng khi phóng to biểu đồ."""
+
+    def __init__(self, ttl: float = CHART_CACHE_TTL, max_entries: int = CHART_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[Hashable, Tuple[float, SensorFrame]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_load(self, key: Hashable, load: Callable[[], SensorFrame], reload: bool = False) -> SensorFrame:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and not reload and now - entry[0] <= self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+        self.misses += 1
+        frame = load()
+        if 'error' not in frame.meta:
+            with self._lock:
+                self._entries[key] = (now, frame)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return frame
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+chart_frames = FrameCache()
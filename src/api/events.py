@@ -0,0 +1,358 @@
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set
+from collections import OrderedDict
+import json
+import os
+import queue
+import secrets
+import threading
+import time
+import requests
+from . import metrics
+from .auth import is_token_expired, session_key, token_user_id
+
+# Bật kênh đẩy (SSE) thay cho dcc.Interval; tắt bằng API_PUSH=0 để quay lại polling.
+PUSH_ENABLED = os.environ.get('API_PUSH', '1') not in ('0', 'false', 'False')
+# Số kết nối SSE mở cùng lúc tối đa (mỗi kết nối giữ một luồng của server); vượt quá trả 503.
+PUSH_MAX_CONNECTIONS = int(os.environ.get('API_PUSH_MAX_CONNECTIONS', '200'))
+# Đường dẫn (tương đối URL_API_BASE) của luồng SSE do backend phát; rỗng nếu backend không hỗ trợ.
+PUSH_UPSTREAM_PATH = os.environ.get('API_PUSH_UPSTREAM', '')
+PUSH_UPSTREAM_TOKEN = os.environ.get('API_PUSH_UPSTREAM_TOKEN', '')
+PUSH_KEEPALIVE = 15.0
+# Số phiên đẩy giữ token phía server; phiên cũ nhất bị bỏ trước (tab đó quay lại poll cho tới khi gửi lại token).
+PUSH_MAX_SESSIONS = int(os.environ.get('API_PUSH_MAX_SESSIONS', '1024'))
+
+CHANNELS = ('sensor', 'pump', 'notification')
+
+
+class Subscriber:
+    __slots__ = ('queue', 'channels', 'user_id', 'key', 'dropped')
+
+    def __init__(self, channels: Set[str], user_id: Optional[str], key: str, maxsize: int = 100):
+        self.queue: 'queue.Queue' = queue.Queue(maxsize=maxsize)
+        self.channels = channels
+        self.user_id = user_id
+        self.key = key
+        self.dropped = 0
+
+
+class EventHub:
+    """Phân phát sự kiện tới các kết nối SSE đang mở.
+
+    Sự kiện chỉ là tín hiệu "dữ liệu đã đổi" (kênh + vài id), trình duyệt nhận
+    được sẽ kích hoạt callback Dash tương ứng để tải dữ liệu qua đường thường.
+    `user` / `key` giới hạn sự kiện cho một người dùng / một phiên.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers: List[Subscriber] = []
+        self._next_id = 0
+        self.published = 0
+        self.rejected = 0
+
+    def subscribe(self, channels=CHANNELS, user_id: Optional[str] = None, key: str = '',
+                  limit: Optional[int] = None) -> Optional[Subscriber]:
+        """Mở một kết nối; None khi đã có `limit` kết nối."""
+        sub = Subscriber(set(channels), user_id, key)
+        with self._lock:
+            if limit is not None and len(self._subscribers) >= limit:
+                self.rejected += 1
+                return None
+            self._subscribers.append(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscriber) -> None:
+        with self._lock:
+            if sub in self._subscribers:
+                self._subscribers.remove(sub)
+
+    def keys(self) -> Set[str]:
+        with self._lock:
+            return {s.key for s in self._subscribers}
+
+    def publish(self, channel: str, data: Optional[Dict[str, Any]] = None, user_id: Optional[str] = None,
+                key: Optional[str] = None) -> int:
+        """Gửi sự kiện; trả về số kết nối nhận được."""
+        with self._lock:
+            self._next_id += 1
+            event = (self._next_id, channel, data or {})
+            targets = [s for s in self._subscribers
+                       if channel in s.channels
+                       and (user_id is None or s.user_id == str(user_id))
+                       and (key is None or s.key == key)]
+        self.published += 1
+        for sub in targets:
+            try:
+                sub.queue.put_nowait(event)
+            except queue.Full:
+                # Trình duyệt chậm: bỏ sự kiện, lần sau nó vẫn nhận tín hiệu mới hơn.
+                sub.dropped += 1
+        return len(targets)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            subs = list(self._subscribers)
+        return {'subscribers': len(subs), 'sessions': len({s.key for s in subs}),
+                'published': self.published, 'dropped': sum(s.dropped for s in subs), 'rejected': self.rejected}
+
+
+hub = EventHub()
+
+
+class PushSessions:
+    """Token của các phiên đẩy, giữ trong bộ nhớ server theo id phiên ngẫu nhiên; cookie chỉ mang id."""
+
+    def __init__(self, max_entries: int = PUSH_MAX_SESSIONS):
+        self.max_entries = max_entries
+        self._tokens: 'OrderedDict[str, str]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, sid: str, token: str) -> None:
+        with self._lock:
+            self._tokens[sid] = token
+            self._tokens.move_to_end(sid)
+            while len(self._tokens) > self.max_entries:
+                self._tokens.popitem(last=False)
+
+    def get(self, sid: Optional[str]) -> Optional[str]:
+        """Token của phiên `sid`; None (và bỏ luôn) khi không có hoặc đã hết hạn."""
+        if not sid:
+            return None
+        with self._lock:
+            token = self._tokens.get(sid)
+            if token is not None and is_token_expired(token):
+                del self._tokens[sid]
+                token = None
+            return token
+
+    def drop(self, sid: Optional[str]) -> None:
+        with self._lock:
+            self._tokens.pop(sid, None)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._tokens)
+
+
+push_sessions = PushSessions()
+
+
+def format_sse(event_id: int, channel: str, data: Dict[str, Any]) -> str:
+    return f'id: {event_id}\nevent: {channel}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n'
+
+
+def stream(sub: Subscriber, keepalive: float = PUSH_KEEPALIVE,
+           renew: Optional[Callable[[], None]] = None) -> Iterator[str]:
+    """Luồng SSE của một kết nối; gọi `renew` mỗi `keepalive` giây để giữ các job nguồn sự kiện."""
+    yield 'retry: 3000\n\n'
+    yield format_sse(0, 'hello', {'channels': sorted(sub.channels)})
+    renewed = None
+    try:
+        while True:
+            if renew is not None and (renewed is None or time.monotonic() - renewed >= keepalive):
+                renewed = time.monotonic()
+                try:
+                    renew()
+                except Exception as e:
+                    print(f"Error checking live updates: {e}")
+            try:
+                event = sub.queue.get(timeout=keepalive)
+            except queue.Empty:
+                yield ': keepalive\n\n'
+                continue
+            yield format_sse(*event)
+    finally:
+        hub.unsubscribe(sub)
+
+
+# ---------------------------------------------------------------- nguồn sự kiện
+
+class SessionFeeds:
+    """Giữ các job của api.poller.live_poller phát sự kiện cho một phiên đang nghe /events.
+
+    Không có luồng riêng cho mỗi phiên: máy bơm và bản ghi mới nhất đi qua ảnh chụp
+    dùng chung `live_pumps` (một job mỗi máy bơm), thông báo là một job theo phiên
+    dùng chung giữa các tab. `renew()` được luồng SSE gọi lại sau mỗi PUSH_KEEPALIVE
+    giây để các job không hết hạn (POLL_VIEW_TTL).
+    """
+
+    def __init__(self, token: str, key: str):
+        self.token = token
+        self.key = key
+        self._pump_ids: Optional[List[str]] = None
+
+    def renew(self) -> None:
+        from .pump import list_pumps
+        from .poller import live_poller, live_pumps
+
+        if upstream.active:
+            return
+        # Danh sách máy bơm đi qua cache nhóm 'may-bom' nên thường không gọi backend.
+        pumps = list_pumps(limit=50, offset=0, token=self.token)
+        if isinstance(pumps, dict) and 'error' not in pumps:
+            ids = sorted(str(p.get('ma_may_bom')) for p in pumps.get('data') or [] if isinstance(p, dict))
+            if self._pump_ids is not None and ids != self._pump_ids:
+                hub.publish('pump', {'ids': sorted(set(ids) ^ set(self._pump_ids))}, key=self.key)
+            self._pump_ids = ids
+            for pump_id in ids:
+                live_pumps.view(pump_id, self.token)
+        live_poller.touch(('notification', self.key), _notification_job(self.token, self.key),
+                          audience=('notification', self.key))
+
+
+def _notification_job(token: str, key: str):
+    """Job của live_poller: phát 'notification' khi trang đầu thông báo (navbar dùng để đếm chưa đọc) đổi."""
+    state: Dict[str, Any] = {}
+
+    def job() -> None:
+        from .notification import get_notifications
+
+        notifications = get_notifications(limit=100, offset=0, token=token)
+        if not isinstance(notifications, dict) or 'error' in notifications:
+            return
+        items = notifications.get('data') or []
+        current = (items[0].get('id') if items else None, sum(1 for n in items if not n.get('is_read', False)))
+        previous = state.get('notification', _MISSING)
+        state['notification'] = current
+        if previous is not _MISSING and previous != current:
+            hub.publish('notification', {}, key=key)
+
+    return job
+
+
+_MISSING = object()
+
+
+class UpstreamRelay:
+    """Nghe luồng SSE của backend (API_PUSH_UPSTREAM) và phát lại cho trình duyệt.
+
+    Khi chạy được thì không cần SessionFeeds: sự kiện có 'ma_nguoi_dung' chỉ gửi
+    cho người dùng đó, các sự kiện khác gửi cho mọi phiên.
+    """
+
+    def __init__(self, path: str = PUSH_UPSTREAM_PATH, token: str = PUSH_UPSTREAM_TOKEN):
+        self.path = path
+        self.token = token
+        self.connected = False
+        self.thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @property
+    def active(self) -> bool:
+        return bool(self.path) and self.connected
+
+    def start(self) -> None:
+        if not self.path or self.thread is not None:
+            return
+        self.thread = threading.Thread(target=self._run, name='push-upstream', daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _dispatch(self, channel: str, payload: str) -> None:
+        if channel not in CHANNELS:
+            return
+        try:
+            data = json.loads(payload) if payload else {}
+        except ValueError:
+            data = {}
+        user_id = data.pop('ma_nguoi_dung', None) if isinstance(data, dict) else None
+        hub.publish(channel, data if isinstance(data, dict) else {}, user_id=user_id)
+
+    def _run(self) -> None:
+        from .client import URL_API_BASE
+        url = f"{URL_API_BASE.rstrip('/')}/{self.path.lstrip('/')}"
+        headers = {'Accept': 'text/event-stream'}
+        if self.token:
+            headers['Authorization'] = f'Bearer {self.token}'
+        backoff = 1.0
+        while not self._stop.is_set():
+            try:
+                with requests.get(url, headers=headers, stream=True, timeout=(5, PUSH_KEEPALIVE * 3)) as resp:
+                    resp.raise_for_status()
+                    self.connected, backoff = True, 1.0
+                    channel, data = 'message', []
+                    for line in resp.iter_lines(decode_unicode=True):
+                        if self._stop.is_set():
+                            return
+                        if line is None or line.startswith(':'):
+                            continue
+                        if line == '':
+                            self._dispatch(channel, '\n'.join(data))
+                            channel, data = 'message', []
+                        elif line.startswith('event:'):
+                            channel = line[6:].strip()
+                        elif line.startswith('data:'):
+                            data.append(line[5:].strip())
+            except requests.RequestException as e:
+                print(f"Upstream event stream error: {e}")
+            self.connected = False
+            self._stop.wait(backoff)
+            backoff = min(backoff * 2, 30.0)
+
+
+upstream = UpstreamRelay()
+
+
+# ---------------------------------------------------------------- Flask
+
+def install(server, path: str = '/events') -> None:
+    """Thêm `POST {path}/session` (giữ token của tab phía server, cookie phiên chỉ mang id ngẫu nhiên)
+    và `GET {path}` (luồng SSE)."""
+    from flask import Response, jsonify, request, session, stream_with_context
+
+    if not PUSH_ENABLED:
+        return
+    upstream.start()
+
+    @server.route(f'{path}/session', methods=['POST'])
+    def _events_session():
+        body = request.get_json(silent=True) or {}
+        token = body.get('token')
+        sid = session.get('push_sid')
+        if token:
+            sid = sid or secrets.token_urlsafe(24)
+            push_sessions.put(sid, token)
+            session['push_sid'] = sid
+        else:
+            push_sessions.drop(sid)
+            session.pop('push_sid', None)
+        return jsonify({'enabled': True, 'upstream': upstream.active})
+
+    @server.route(path)
+    def _events_stream():
+        token = push_sessions.get(session.get('push_sid'))
+        if not token:
+            return jsonify({'detail': 'Chưa đăng nhập'}), 401
+        channels = [c for c in (request.args.get('channels') or ','.join(CHANNELS)).split(',') if c in CHANNELS]
+        key = session_key(token)
+        sub = hub.subscribe(channels or CHANNELS, user_id=token_user_id(token), key=key, limit=PUSH_MAX_CONNECTIONS)
+        if sub is None:
+            # Trình duyệt quay lại poll theo chu kỳ (assets/live_updates.js).
+            resp = jsonify({'detail': 'Quá nhiều kết nối'})
+            resp.status_code = 503
+            resp.headers['Retry-After'] = '60'
+            return resp
+        feeds = SessionFeeds(token, key)
+        resp = Response(stream_with_context(stream(sub, renew=feeds.renew)), mimetype='text/event-stream')
+        resp.headers['Cache-Control'] = 'no-cache'
+        resp.headers['X-Accel-Buffering'] = 'no'
+        return resp
+
+
+def _collect_metrics() -> List[str]:
+    stats = hub.stats()
+    lines = metrics.sample_lines('api_push_subscribers', 'Số kết nối SSE /events đang mở.', [({}, stats['subscribers'])])
+    lines += metrics.sample_lines('api_push_events_total', 'Số sự kiện đã phát / bị bỏ do trình duyệt đọc chậm.', [
+        ({'result': 'published'}, stats['published']),
+        ({'result': 'dropped'}, stats['dropped']),
+    ], kind='counter')
+    lines += metrics.sample_lines('api_push_rejected_total', 'Số kết nối /events bị từ chối vì vượt API_PUSH_MAX_CONNECTIONS.',
+                                  [({}, stats['rejected'])], kind='counter')
+    lines += metrics.sample_lines('api_push_upstream_connected',
+                                  'Đang nhận luồng sự kiện từ backend (1) hay tự kiểm tra (0).', [({}, int(upstream.active))])
+    return lines
+
+
+metrics.registry.add_collector(_collect_metrics)
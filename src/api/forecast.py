@@ -0,0 +1,392 @@
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Sequence, Tuple
+from collections import OrderedDict
+import math
+import os
+import threading
+import numpy as np
+import pandas as pd
+from . import metrics
+from .sensor_frame import LOCAL_TZ, NAT, SensorFrame
+from .singleflight import SingleFlight
+
+# Hệ số làm mịn EMA của đường xu hướng trên trang dự đoán.
+FIT_ALPHA = 0.7
+# Độ dốc dự báo giảm dần theo hệ số này mỗi bước để đường dự báo không bay quá xa.
+FORECAST_DAMPING = 0.9
+# Số kết quả dự báo (theo phiên bản store) được giữ lại.
+FORECAST_CACHE_MAX_ENTRIES = int(os.environ.get('API_FORECAST_CACHE_MAX_ENTRIES', '64'))
+# Số phiên bản tính sẵn (api.forecast_schedule) được ghim; cũ nhất bị bỏ trước, trang đó tự tính lại.
+FORECAST_PINNED_MAX = int(os.environ.get('API_FORECAST_PINNED_MAX', '256'))
+# d ** -k trong một khối EMA không vượt quá 10 ** _EMA_BLOCK_EXPONENT.
+_EMA_BLOCK_EXPONENT = 150.0
+
+
+def ema(values: Sequence[float], alpha: float) -> np.ndarray:
+    """EMA theo trục cuối, giá trị khởi đầu là phần tử đầu tiên: e[t] = alpha * v[t] + (1 - alpha) * e[t-1].
+
+    Tính theo từng khối bằng tổng tích luỹ đã chia tỉ lệ (d ** -k), khối đủ ngắn để
+    d ** -k không tràn số; mỗi khối nhận giá trị cuối của khối trước làm điểm xuất phát.
+    Mảng 2-D được tính cho mọi hàng cùng lúc.
+    """
+    v = np.asarray(values, dtype=np.float64)
+    n = v.shape[-1]
+    if n == 0:
+        return v.copy()
+    decay = 1.0 - alpha
+    if decay <= 0.0:
+        return v.copy()
+    if decay >= 1.0:
+        return np.repeat(v[..., :1], n, axis=-1)
+    block = max(1, min(n, int(_EMA_BLOCK_EXPONENT / -math.log10(decay))))
+    k = np.arange(block, dtype=np.float64)
+    grow, shrink = decay ** -k, decay ** k
+    out = np.empty_like(v)
+    carry = v[..., 0]
+    for start in range(0, n, block):
+        chunk = v[..., start:start + block]
+        m = chunk.shape[-1]
+        out[..., start:start + m] = shrink[:m] * (
+            decay * carry[..., None] + alpha * np.cumsum(chunk * grow[:m], axis=-1))
+        carry = out[..., start + m - 1]
+    return out
+
+
+def linear_coefficients(values: Sequence[float]) -> Tuple[float, float]:
+    """Hệ số (slope, intercept) của hồi quy y = slope * x + intercept với x = 0..n-1."""
+    y = np.asarray(values, dtype=np.float64)
+    n = y.shape[0]
+    if n == 0:
+        return 0.0, 0.0
+    if n == 1:
+        return 0.0, float(y[-1])
+    x = np.arange(n, dtype=np.float64)
+    sum_x, sum_y = x.sum(), y.sum()
+    denominator = n * (x * x).sum() - sum_x ** 2
+    slope = 0.0 if denominator == 0 else float((n * (x * y).sum() - sum_x * sum_y) / denominator)
+    return slope, float((sum_y - slope * sum_x) / n)
+
+
+def damped_paths(last: np.ndarray, slope: np.ndarray, steps: int,
+                 damping: float = FORECAST_DAMPING) -> np.ndarray:
+    """max(0, last + slope * damping ** i * i) với i = 1..steps; `last`, `slope` cùng kích thước, thêm một trục bước."""
+    i = np.arange(1, steps + 1, dtype=np.float64)
+    return np.maximum(0.0, np.asarray(last)[..., None] + np.asarray(slope)[..., None] * (damping ** i * i))
+
+
+def damped_forecast(fit: np.ndarray, steps: int, damping: float = FORECAST_DAMPING) -> np.ndarray:
+    """Dự báo `steps` bước từ điểm cuối của đường fit theo độ dốc 5 điểm cuối, giảm dần theo `damping`."""
+    if fit.shape[0] == 0 or steps <= 0:
+        return np.empty(0, dtype=np.float64)
+    slope = (fit[-1] - fit[-5]) / 4 if fit.shape[0] >= 5 else 0.0
+    return damped_paths(fit[-1], slope, steps, damping)
+
+
+def horizon_steps(horizon_minutes: float, interval: float) -> int:
+    return int(math.ceil(max(interval, horizon_minutes * 60.0) / interval))
+
+
+def series_stats(flows: Sequence[float]) -> Dict[str, Any]:
+    """Trung bình, xu hướng (%), độ lệch chuẩn tổng thể và số điểm lệch quá 2.5 độ lệch chuẩn."""
+    flows = np.asarray(flows, dtype=np.float64)
+    if flows.shape[0] == 0:
+        return {'count': 0, 'average': None, 'trend_pct': None, 'std_dev': 0.0, 'anomalies': 0}
+    average = float(flows.mean())
+    first, last = float(flows[0]), float(flows[-1])
+    std_dev = float(flows.std()) if flows.shape[0] > 1 else 0.0
+    return {
+        'count': int(flows.shape[0]),
+        'average': average,
+        'trend_pct': ((last - first) / first * 100) if first else 0.0,
+        'std_dev': std_dev,
+        'anomalies': int(np.count_nonzero(np.abs(flows - average) > std_dev * 2.5)),
+    }
+
+
+def confidence_score(stats: Dict[str, Any]) -> float:
+    if not stats.get('count'):
+        return 0.0
+    avg = stats.get('average') or 0.0
+    std_dev = stats.get('std_dev') or 0.0
+    variability_penalty = 0.0 if avg <= 0 else min(40.0, (std_dev / avg) * 45.0)
+    anomaly_penalty = min(25.0, (stats.get('anomalies') or 0) * 5.0)
+    return round(max(55.0, min(98.0, 95.0 - variability_penalty - anomaly_penalty)), 1)
+
+
+def sample_interval_seconds(timestamps: np.ndarray) -> float:
+    """Trung vị khoảng cách dương giữa các mốc (ns), giới hạn trong [60, 3600] giây; 300 khi không đủ dữ liệu."""
+    if timestamps.shape[0] < 2:
+        return 300.0
+    diffs = np.diff(timestamps)
+    diffs = diffs[diffs > 0]
+    if diffs.shape[0] == 0:
+        return 300.0
+    return max(60.0, min(3600.0, float(np.median(diffs)) / 1e9))
+
+
+def parse_times(values: Sequence[Any]) -> pd.DatetimeIndex:
+    """Chuỗi ISO -> DatetimeIndex (NaT khi không đọc được).
+
+    Chuỗi có múi giờ được đọc theo UTC (nhanh hơn nhiều so với giữ từng offset) rồi đổi
+    về múi giờ của phần tử đầu tiên; chuỗi không có múi giờ giữ nguyên giờ ghi.
+    """
+    values = list(values)
+    first = next((v for v in values if v), None)
+    try:
+        zone = pd.Timestamp(first).tzinfo if first is not None else None
+    except (ValueError, TypeError):
+        zone = None
+    if zone is None:
+        try:
+            return pd.DatetimeIndex(pd.to_datetime(values, errors='coerce', format='ISO8601'))
+        except (ValueError, TypeError):
+            pass
+    parsed = pd.DatetimeIndex(pd.to_datetime(values, errors='coerce', format='ISO8601', utc=True))
+    return parsed.tz_convert(zone) if zone is not None else parsed
+
+
+def residual_band(flows: np.ndarray, fit: np.ndarray) -> float:
+    """Nửa độ rộng vùng tin cậy: trung bình + 2 độ lệch chuẩn của |thực tế - fit|."""
+    if flows.shape[0] == 0:
+        return 0.0
+    residuals = np.abs(flows - fit)
+    spread = float(residuals.std()) if residuals.shape[0] > 1 else 0.0
+    return float(residuals.mean()) + 2 * spread
+
+
+def compute_forecasts(series: Sequence[Dict[str, Any]], horizons: Iterable[float], alpha: float = FIT_ALPHA,
+                      seasonal: Optional[Any] = None) -> Dict[float, Dict[str, Any]]:
+    """compute_forecast cho nhiều horizon (phút) một lượt: đọc chuỗi, EMA và thống kê chỉ tính một lần.
+
+    Các kết quả dùng chung mảng times/flows/fit.
+    """
+    flows = pd.to_numeric(pd.Series([p.get('flow_rate') for p in series], dtype='object'), errors='coerce')
+    flows = flows.to_numpy(dtype=np.float64, na_value=np.nan)
+    times = parse_times([p.get('time') for p in series])
+    keep = np.isfinite(flows) & ~times.isna()
+    flows, times = flows[keep], times[keep]
+
+    stats = series_stats(flows)
+    base = {'times': times, 'flows': flows, 'stats': stats, 'confidence': confidence_score(stats), 'model': 'ema'}
+    horizons = [float(h) for h in horizons]
+    if flows.shape[0] == 0:
+        return {h: dict(base, fit=flows, forecast=flows, forecast_times=times, band=0.0, interval=300.0)
+                for h in horizons}
+
+    fit = ema(flows, alpha)
+    base['fit'] = fit
+    results = {}
+    if seasonal is not None:
+        for h in horizons:
+            values, slots = seasonal.forecast(horizon_steps(h, seasonal.interval))
+            forecast_times = pd.DatetimeIndex(pd.to_datetime(slots * seasonal.step, unit='ns'))
+            if times.tz is not None:
+                forecast_times = forecast_times.tz_localize(LOCAL_TZ).tz_convert(times.tz)
+            results[h] = dict(base, forecast=values, forecast_times=forecast_times, band=seasonal.band,
+                              interval=seasonal.interval, model='holt_winters')
+        return results
+
+    interval = sample_interval_seconds(times.asi8)
+    band = residual_band(flows, fit)
+    for h in horizons:
+        steps = horizon_steps(h, interval)
+        offsets = pd.to_timedelta(30 + interval * np.arange(steps), unit='s')
+        results[h] = dict(base, forecast=damped_forecast(fit, steps), forecast_times=times[-1] + offsets,
+                          band=band, interval=interval)
+    return results
+
+
+def compute_forecast(series: Sequence[Dict[str, Any]], horizon_minutes: float,
+                     alpha: float = FIT_ALPHA, seasonal: Optional[Any] = None) -> Dict[str, Any]:
+    """Toàn bộ kết quả dự báo của một chuỗi [{'time', 'flow_rate'}, ...] dưới dạng mảng NumPy.
+
+    Điểm thiếu lưu lượng hoặc thời gian bị bỏ. Khi có `seasonal` (api.seasonal.HoltWinters đã khớp
+    với chuỗi này) phần dự báo và vùng tin cậy lấy từ mô hình mùa vụ; đường fit vẫn là EMA.
+    Kết quả dùng chung giữa các callback nên coi là chỉ đọc.
+    """
+    return compute_forecasts(series, [horizon_minutes], alpha, seasonal)[float(horizon_minutes)]
+
+
+def align_frame(frame: SensorFrame, interval: float, column: str = 'luu_luong_nuoc',
+                start_ns: Optional[int] = None) -> Tuple[List[Any], np.ndarray, np.ndarray]:
+    """Gom `column` của mọi máy bơm trong `frame` về cùng một lưới thời gian bước `interval` giây.
+
+    Trả về (mã máy bơm, mốc đầu mỗi ô (ns UTC), ma trận máy bơm × ô); ô không có dữ liệu là NaN,
+    ô có nhiều bản ghi lấy trung bình.
+    """
+    timestamps = frame.timestamps
+    values = frame.values.get(column, np.full(len(frame), np.nan, dtype=np.float32)).astype(np.float64)
+    keep = (timestamps != NAT) & np.isfinite(values)
+    if start_ns is not None:
+        keep &= timestamps >= start_ns
+    if not keep.any():
+        return [], np.empty(0, dtype=np.int64), np.empty((0, 0), dtype=np.float64)
+    step = int(interval * 1e9)
+    timestamps, values = timestamps[keep], values[keep]
+    origin = (int(start_ns if start_ns is not None else timestamps.min()) // step) * step
+    cells = (timestamps - origin) // step
+    width = int(cells.max()) + 1
+    codes, rows = np.unique(np.asarray(frame.pump_ids.codes)[keep], return_inverse=True)
+    flat = rows * width + cells
+    size = codes.shape[0] * width
+    sums = np.bincount(flat, weights=values, minlength=size)
+    counts = np.bincount(flat, minlength=size)
+    matrix = np.full(size, np.nan)
+    np.divide(sums, counts, out=matrix, where=counts > 0)
+    pumps = list(np.asarray(frame.pump_ids.categories)[codes])
+    return pumps, origin + step * np.arange(width, dtype=np.int64), matrix.reshape(codes.shape[0], width)
+
+
+def batch_forecast(values: np.ndarray, interval: float, horizons: Dict[Hashable, float],
+                   alpha: float = FIT_ALPHA) -> Dict[str, Any]:
+    """compute_forecast cho cả ma trận máy bơm × thời gian (ô NaN bị bỏ như điểm thiếu) trong một lượt.
+
+    `horizons` là tên -> số phút. Mỗi hàng cho cùng kết quả như compute_forecast trên các điểm
+    hợp lệ của hàng đó với bước `interval` giây; mọi khoá trả về là mảng theo hàng
+    ('horizons' là tên -> giá trị dự báo cuối khoảng, NaN khi hàng không có dữ liệu).
+    """
+    v = np.asarray(values, dtype=np.float64)
+    if v.ndim != 2 or v.shape[1] == 0:
+        v = np.full((v.shape[0] if v.ndim else 0, 1), np.nan)
+    rows = np.arange(v.shape[0])
+    valid = np.isfinite(v)
+    count = valid.sum(axis=1)
+    has = count > 0
+    # Dồn các điểm hợp lệ về đầu hàng (giữ thứ tự) để EMA/độ dốc giống như khi bỏ điểm thiếu.
+    order = np.argsort(~valid, axis=1, kind='stable')
+    packed = np.take_along_axis(v, order, axis=1)
+    last = np.maximum(count - 1, 0)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        average = np.where(has, np.nansum(packed, axis=1) / count, np.nan)
+        deviation = packed - average[:, None]
+        std_dev = np.where(count > 1, np.sqrt(np.nansum(deviation ** 2, axis=1) / count), 0.0)
+        anomalies = (np.abs(deviation) > std_dev[:, None] * 2.5).sum(axis=1)
+        first, final = packed[:, 0], packed[rows, last]
+        trend_pct = np.where(has, np.where(first != 0, (final - first) / first * 100, 0.0), np.nan)
+
+        variability = np.where(average > 0, np.minimum(40.0, std_dev / average * 45.0), 0.0)
+        confidence = np.clip(95.0 - variability - np.minimum(25.0, anomalies * 5.0), 55.0, 98.0)
+        confidence = np.where(has, np.round(confidence, 1), 0.0)
+
+        fit = ema(packed, alpha)
+        fit_last = fit[rows, last]
+        slope = np.where(count >= 5, (fit_last - fit[rows, np.maximum(count - 5, 0)]) / 4, 0.0)
+        residuals = np.abs(packed - fit)
+        residual_mean = np.where(has, np.nansum(residuals, axis=1) / count, 0.0)
+        residual_std = np.where(count > 1, np.sqrt(
+            np.nansum((residuals - residual_mean[:, None]) ** 2, axis=1) / count), 0.0)
+
+    steps = {key: horizon_steps(minutes, interval) for key, minutes in horizons.items()}
+    paths = damped_paths(fit_last, slope, max(steps.values(), default=0))
+    paths[~has] = np.nan
+    fit_grid = np.full_like(v, np.nan)
+    np.put_along_axis(fit_grid, order, fit, axis=1)
+    return {
+        'count': count,
+        'average': average,
+        'trend_pct': trend_pct,
+        'std_dev': std_dev,
+        'anomalies': anomalies,
+        'confidence': confidence,
+        'fit': fit_grid,
+        'forecast': paths,
+        'horizons': {key: paths[:, n - 1] for key, n in steps.items()},
+        'band': np.where(has, residual_mean + 2 * residual_std, 0.0),
+        # Cột (trên lưới) của điểm hợp lệ cuối mỗi hàng; dự báo bắt đầu sau mốc này.
+        'last_index': order[rows, last],
+    }
+
+
+class ForecastCache:
+    """Kết quả compute_forecast theo (phiên bản store, horizon, alpha), LRU.
+
+    Các callback cùng đọc một store gọi đồng thời sau mỗi lần cập nhật; lời gọi
+    đầu tiên tính, các lời gọi khác chờ và nhận cùng kết quả. Mô hình mùa vụ của
+    một phiên bản được gắn phía server (attach_model) khi tải dữ liệu, nên store
+    gửi lên từ trình duyệt không thể thay đổi nó. Kết quả tính sẵn (pin) không bị
+    LRU kết quả thường đẩy ra; chúng có giới hạn riêng `max_pinned`.
+    """
+
+    def __init__(self, max_entries: int = FORECAST_CACHE_MAX_ENTRIES, max_pinned: int = FORECAST_PINNED_MAX):
+        self.max_entries = max_entries
+        self.max_pinned = max_pinned
+        self._entries: 'OrderedDict[Hashable, Dict[str, Any]]' = OrderedDict()
+        self._models: 'OrderedDict[str, Any]' = OrderedDict()
+        self._pinned: 'OrderedDict[str, Dict[float, Dict[str, Any]]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._flight = SingleFlight()
+        self.hits = 0
+        self.misses = 0
+
+    def attach_model(self, version: str, model: Optional[Any]) -> None:
+        if model is None:
+            return
+        with self._lock:
+            self._models[version] = model
+            while len(self._models) > self.max_entries:
+                self._models.popitem(last=False)
+
+    def pin(self, version: str, results: Dict[float, Dict[str, Any]]) -> None:
+        """Giữ kết quả theo horizon (phút, alpha mặc định) của một phiên bản đã tính sẵn."""
+        with self._lock:
+            self._pinned[version] = results
+            self._pinned.move_to_end(version)
+            while len(self._pinned) > self.max_pinned:
+                self._pinned.popitem(last=False)
+
+    def unpin(self, version: Optional[str]) -> None:
+        with self._lock:
+            self._pinned.pop(version, None)
+
+    def is_pinned(self, version: Optional[str]) -> bool:
+        with self._lock:
+            return version in self._pinned
+
+    def get(self, store: Optional[Dict[str, Any]], horizon_minutes: float, alpha: float = FIT_ALPHA) -> Dict[str, Any]:
+        store = store or {}
+        series = store.get('series') or []
+        version = store.get('version')
+        if not version:
+            return compute_forecast(series, horizon_minutes, alpha)
+        key = (version, float(horizon_minutes), alpha)
+        with self._lock:
+            pinned = self._pinned.get(version)
+            result = pinned.get(float(horizon_minutes)) if pinned is not None and alpha == FIT_ALPHA else None
+            if result is None:
+                result = self._entries.get(key)
+                if result is not None:
+                    self._entries.move_to_end(key)
+            if result is not None:
+                self.hits += 1
+                return result
+            model = self._models.get(version)
+
+        def compute() -> Dict[str, Any]:
+            self.misses += 1
+            computed = compute_forecast(series, horizon_minutes, alpha, seasonal=model)
+            with self._lock:
+                self._entries[key] = computed
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            return computed
+
+        return self._flight.do(key, compute)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'entries': len(self._entries), 'models': len(self._models), 'pinned': len(self._pinned),
+                    'hits': self.hits, 'misses': self.misses}
+
+
+forecast_cache = ForecastCache()
+
+
+def _collect_metrics() -> List[str]:
+    stats = forecast_cache.stats()
+    return metrics.sample_lines('api_forecast_cache_lookups_total', 'Số lần lấy kết quả dự báo theo phiên bản store.', [
+        ({'result': 'hit'}, stats['hits']),
+        ({'result': 'miss'}, stats['misses']),
+    ], kind='counter')
+
+
+metrics.registry.add_collector(_collect_metrics)
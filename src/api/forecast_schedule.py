@@ -0,0 +1,178 @@
+from typing import Any, Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+from collections import OrderedDict
+import os
+import threading
+import time
+import uuid
+from . import metrics
+from .auth import user_scope
+from .cache import caller_identity
+from .forecast import compute_forecasts, forecast_cache
+from .poller import BackgroundPoller
+from .seasonal import seasonal_models
+
+# Chu kỳ (giây) tính lại dự báo của mọi máy bơm đang theo dõi.
+FORECAST_SCHEDULE_INTERVAL = float(os.environ.get('API_FORECAST_SCHEDULE_INTERVAL', '60'))
+# Người dùng không mở trang dự đoán trong khoảng này (giây) thì ngừng tính cho các máy bơm của họ.
+FORECAST_SCHEDULE_TTL = float(os.environ.get('API_FORECAST_SCHEDULE_TTL', '3600'))
+FORECAST_SCHEDULE_WORKERS = int(os.environ.get('API_FORECAST_SCHEDULE_WORKERS', '2'))
+# Số token gần nhất giữ cho mỗi (người dùng, máy bơm); job thử token mới nhất trước.
+FORECAST_SCHEDULE_TOKENS = int(os.environ.get('API_FORECAST_SCHEDULE_TOKENS', '3'))
+
+forecast_poller = BackgroundPoller(interval=FORECAST_SCHEDULE_INTERVAL, view_ttl=FORECAST_SCHEDULE_TTL,
+                                   workers=FORECAST_SCHEDULE_WORKERS)
+
+
+def watermark(series: Sequence[Dict[str, Any]]) -> Optional[Tuple[Any, ...]]:
+    """Mốc dữ liệu của một chuỗi đã sắp theo thời gian: (số điểm, thời gian và giá trị điểm đầu/cuối)."""
+    if not series:
+        return None
+    first, last = series[0], series[-1]
+    return len(series), first.get('time'), last.get('time'), last.get('flow_rate')
+
+
+class ForecastSchedule:
+    """Dự báo tính sẵn theo (người dùng, máy bơm) cho mọi horizon, trên một luồng nền riêng.
+
+    Job giữ nguyên qua các lần đăng nhập lại: `watch` chỉ cập nhật token mới nhất của
+    người dùng. Vì mã người dùng trong token chưa được kiểm tra, một phiên chỉ đọc được
+    kết quả sau khi chính token của nó tải thành công chuỗi (như api.poller.LivePumps).
+    Mỗi chu kỳ job của máy bơm tải lại chuỗi bằng token của người dùng; nếu mốc dữ liệu
+    (watermark) không đổi thì giữ kết quả cũ, ngược lại tính mọi horizon một lượt và ghim
+    vào forecast_cache theo phiên bản mới. Phiên bản trước vẫn được ghim thêm một chu kỳ
+    cho các trang đang mở. Trang chỉ nhận các dòng cuối của chuỗi (`rows`); phần còn lại đọc
+    từ kết quả đã ghim.
+    """
+
+    def __init__(self, poller: BackgroundPoller = forecast_poller):
+        self.poller = poller
+        self._entries: Dict[Hashable, Dict[str, Any]] = {}
+        # key -> caller_identity(token) -> token, mới nhất cuối.
+        self._tokens: Dict[Hashable, 'OrderedDict[str, Optional[str]]'] = {}
+        self._lock = threading.Lock()
+        self.computed = 0
+        self.unchanged = 0
+        self.failed = 0
+
+    @staticmethod
+    def _key(token: Optional[str], pump_id: Any) -> Tuple[str, str, str]:
+        return 'forecast', user_scope(token), str(pump_id)
+
+    def watch(self, token: Optional[str], pump_id: Any, load: Callable[[Optional[str]], List[Dict[str, Any]]],
+              horizons: Sequence[float], rows: int = 50) -> None:
+        """Đăng ký / gia hạn việc tính sẵn cho một máy bơm; `load(token)` trả về chuỗi [{'time', 'flow_rate', 'raw'}, ...]."""
+        key = self._key(token, pump_id)
+        identity = caller_identity(token)
+        horizons = tuple(float(h) for h in horizons)
+        self._prune()
+        with self._lock:
+            tokens = self._tokens.setdefault(key, OrderedDict())
+            tokens.pop(identity, None)
+            tokens[identity] = token
+            while len(tokens) > FORECAST_SCHEDULE_TOKENS:
+                tokens.popitem(last=False)
+        self.poller.touch(key, lambda: self.refresh(key, load, horizons, rows))
+
+    def refresh(self, key: Hashable, load: Callable[[Optional[str]], List[Dict[str, Any]]],
+                horizons: Tuple[float, ...], rows: int) -> bool:
+        """Job của poller: True nếu đã tính phiên bản mới."""
+        self._prune()
+        with self._lock:
+            tokens = list(self._tokens.get(key, {}).items())
+        series, loaded_by, rejected = [], None, set()
+        for identity, token in reversed(tokens):
+            series = load(token)
+            if series:
+                loaded_by = identity
+                break
+            rejected.add(identity)
+        mark = watermark(series)
+        with self._lock:
+            entry = self._entries.get(key)
+            # Chỉ giữ các token còn được theo dõi và chưa bị backend từ chối.
+            viewers = (entry['viewers'] if entry is not None else set()) & set(self._tokens.get(key, {})) - rejected
+            if loaded_by is not None:
+                viewers.add(loaded_by)
+            if entry is not None:
+                entry['viewers'] = viewers
+        if mark is None:
+            # Tải lỗi hoặc rỗng: không gia hạn 'checked', kết quả cũ hết hạn sau max_age như bình thường.
+            self.failed += 1
+            return False
+        if entry is not None and entry['watermark'] == mark and entry['horizons'] == horizons:
+            entry['checked'] = time.time()
+            self.unchanged += 1
+            return False
+
+        version = uuid.uuid4().hex
+        model = seasonal_models.update(key[1:], series)
+        forecast_cache.attach_model(version, model)
+        results = compute_forecasts(series, horizons, seasonal=model)
+        forecast_cache.pin(version, results)
+        stats = next(iter(results.values()))['stats']
+        now = time.time()
+        fresh = {
+            'version': version,
+            'watermark': mark,
+            'horizons': horizons,
+            'rows': [dict(point) for point in series[-rows:]] if rows else [],
+            'updated': now,
+            'checked': now,
+            'previous': entry['version'] if entry is not None else None,
+            # caller_identity của các token đã tải được chuỗi: chỉ các phiên này được đọc kết quả.
+            'viewers': viewers,
+            # Dùng cho cảnh báo (api.metrics): số điểm bất thường trong chuỗi vừa tính.
+            'anomalies': int(stats['anomalies']),
+        }
+        with self._lock:
+            self._entries[key] = fresh
+        if entry is not None:
+            forecast_cache.unpin(entry['previous'])
+        self.computed += 1
+        return True
+
+    def get(self, token: Optional[str], pump_id: Any, max_age: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Kết quả tính sẵn của phiên `token` cho máy bơm, nếu đã kiểm tra trong `max_age` giây (mặc định 2 chu kỳ)."""
+        max_age = 2 * self.poller.interval if max_age is None else max_age
+        with self._lock:
+            entry = self._entries.get(self._key(token, pump_id))
+            allowed = entry is not None and caller_identity(token) in entry['viewers']
+        if not allowed or time.time() - entry['checked'] > max_age or not forecast_cache.is_pinned(entry['version']):
+            return None
+        return entry
+
+    def _prune(self) -> None:
+        with self._lock:
+            for key in [k for k in self._tokens if not self.poller.is_active(k)]:
+                del self._tokens[key]
+            idle = [key for key in self._entries if not self.poller.is_active(key)]
+            dropped = [self._entries.pop(key) for key in idle]
+        for entry in dropped:
+            forecast_cache.unpin(entry['version'])
+            forecast_cache.unpin(entry['previous'])
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            entries = list(self._entries.values())
+        return {'pumps': len(entries), 'computed': self.computed, 'unchanged': self.unchanged, 'failed': self.failed,
+                'anomalous': sum(1 for e in entries if e['anomalies'] > 0)}
+
+
+forecast_schedule = ForecastSchedule()
+
+
+def _collect_metrics() -> List[str]:
+    stats = forecast_schedule.stats()
+    lines = metrics.sample_lines('api_forecast_schedule_pumps', 'Số máy bơm có dự báo tính sẵn trong nền.',
+                                 [({}, stats['pumps'])])
+    lines += metrics.sample_lines('api_forecast_schedule_anomalous_pumps',
+                                  'Số máy bơm có điểm bất thường trong lần tính sẵn gần nhất.', [({}, stats['anomalous'])])
+    lines += metrics.sample_lines('api_forecast_schedule_runs_total', 'Số lần job tính sẵn chạy theo kết quả.', [
+        ({'result': 'computed'}, stats['computed']),
+        ({'result': 'unchanged'}, stats['unchanged']),
+        ({'result': 'failed'}, stats['failed']),
+    ], kind='counter')
+    return lines
+
+
+metrics.registry.add_collector(_collect_metrics)
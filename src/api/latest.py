@@ -0,0 +1,191 @@
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from collections import OrderedDict
+import os
+import threading
+import time
+import numpy as np
+import pandas as pd
+from . import metrics
+from .cache import caller_identity
+from .sensor_frame import DEFAULT_TIME_KEYS, LOCAL_TZ, NAT, SensorFrame, _parse_timestamps
+
+# Bản ghi cũ hơn số giây này (tính từ lần cập nhật gần nhất) sẽ được hỏi lại backend.
+LATEST_MAX_AGE = float(os.environ.get('API_LATEST_MAX_AGE', '5'))
+# Số (người gọi, máy bơm) được giữ trong chỉ mục.
+LATEST_MAX_ENTRIES = int(os.environ.get('API_LATEST_MAX_ENTRIES', '4096'))
+
+
+class _Reading:
+    __slots__ = ('timestamp', 'row', 'seen_at')
+
+    def __init__(self, timestamp: int, row: Dict[str, Any]):
+        self.timestamp = timestamp
+        self.row = row
+        self.seen_at = time.monotonic()
+
+
+class LatestReadings:
+    """Bản ghi cảm biến mới nhất theo (người gọi, ma_may_bom), LRU.
+
+    Được nạp từ mọi dữ liệu cảm biến mà các hàm trong api.sensor_data đã tải bằng
+    token của người gọi (observe_rows / observe_frame), nên tra cứu là O(1) và thường
+    không cần gọi backend. Khoá là băm của token (caller_identity), nên mỗi token chỉ
+    thấy bản ghi đã tải bằng chính nó. Chỉ giữ bản ghi có thời gian mới hơn hoặc bằng bản đang có.
+    """
+
+    def __init__(self, max_entries: int = LATEST_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._readings: 'OrderedDict[Tuple[str, str], _Reading]' = OrderedDict()
+        self.refreshes = 0
+        # None: chưa biết; False: backend trả dòng cũ trước nên một dòng đầu không phải bản mới nhất.
+        self.newest_first: Optional[bool] = None
+
+    def __len__(self) -> int:
+        return len(self._readings)
+
+    def _offer(self, scope: str, pump_id: Any, timestamp: int, row: Dict[str, Any], derived: bool = False) -> None:
+        # Bản ghi dựng lại từ SensorFrame (derived) không thay bản ghi gốc cùng thời điểm.
+        key = (scope, str(pump_id))
+        with self._lock:
+            current = self._readings.get(key)
+            if current is None or timestamp > current.timestamp or (timestamp == current.timestamp and not derived):
+                self._readings[key] = _Reading(timestamp, row)
+            elif timestamp == current.timestamp:
+                # Cùng bản mới nhất: xác nhận bản đang có vẫn mới; dòng cũ hơn (trang lịch sử) không tính.
+                current.seen_at = time.monotonic()
+            self._readings.move_to_end(key)
+            while len(self._readings) > self.max_entries:
+                self._readings.popitem(last=False)
+
+    def observe_rows(self, rows: Sequence[Dict[str, Any]], token: Optional[str] = None, naive_tz: str = LOCAL_TZ,
+                     time_keys: Sequence[str] = DEFAULT_TIME_KEYS) -> None:
+        """Ghi các dòng vừa tải bằng `token` vào chỉ mục của người gọi đó."""
+        rows = [r for r in (rows or []) if isinstance(r, dict) and r.get('ma_may_bom') is not None]
+        if not rows:
+            return
+        time_key = next((k for k in time_keys if any(r.get(k) for r in rows)), time_keys[0])
+        timestamps = _parse_timestamps([r.get(time_key) for r in rows], naive_tz)
+        newest: Dict[str, Tuple[int, Dict[str, Any]]] = {}
+        for ts, row in zip(timestamps.tolist(), rows):
+            if ts == NAT:
+                continue
+            key = str(row['ma_may_bom'])
+            if key not in newest or ts >= newest[key][0]:
+                newest[key] = (ts, row)
+        scope = caller_identity(token)
+        for key, (ts, row) in newest.items():
+            self._offer(scope, key, ts, row)
+
+    def observe_frame(self, frame: SensorFrame, token: Optional[str] = None) -> None:
+        if frame is None or frame.empty:
+            return
+        valid = np.flatnonzero(frame.timestamps != NAT)
+        if not valid.size:
+            return
+        codes = np.asarray(frame.pump_ids.codes)[valid]
+        timestamps = frame.timestamps[valid]
+        keep = codes >= 0
+        if not keep.any():
+            return
+        valid, codes, timestamps = valid[keep], codes[keep], timestamps[keep]
+        scope = caller_identity(token)
+        # Sắp theo (máy bơm, thời gian); phần tử cuối của mỗi nhóm là bản mới nhất.
+        order = np.lexsort((timestamps, codes))
+        last = np.flatnonzero(np.append(codes[order][1:] != codes[order][:-1], True))
+        categories = frame.pump_ids.categories
+        stamps = pd.to_datetime(timestamps[order][last], unit='ns', utc=True).tz_convert(LOCAL_TZ)
+        for position, index, stamp in zip(last.tolist(), valid[order][last].tolist(), stamps):
+            pump_id = categories[codes[order][position]]
+            pump_id = pump_id.item() if isinstance(pump_id, np.generic) else pump_id
+            row = {'ma_may_bom': pump_id, frame.time_key: stamp.isoformat()}
+            for name, column in frame.values.items():
+                value = column[index]
+                # str() của float32 cho dạng ngắn nhất (8.38 thay vì 8.380000114...).
+                row[name] = float(str(value)) if np.isfinite(value) else None
+            self._offer(scope, pump_id, int(timestamps[order][position]), row, derived=True)
+
+    def peek(self, pump_id: Any, token: Optional[str] = None) -> Optional[Tuple[int, Dict[str, Any], float]]:
+        """(timestamp ns, bản ghi, tuổi giây) trong chỉ mục của người gọi hoặc None; không gọi backend."""
+        with self._lock:
+            reading = self._readings.get((caller_identity(token), str(pump_id)))
+            if reading is None:
+                return None
+            return reading.timestamp, reading.row, time.monotonic() - reading.seen_at
+
+    def get(self, pump_id: Any, token: Optional[str] = None, max_age: float = LATEST_MAX_AGE,
+            since: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """Bản ghi mới nhất của máy bơm; hỏi backend một dòng khi chưa có hoặc đã cũ.
+
+        `since` (ns UTC) bỏ qua bản ghi cũ hơn mốc, ví dụ đầu ngày hôm nay.
+        """
+        if pump_id is None:
+            return None
+        entry = self.peek(pump_id, token)
+        if entry is None or entry[2] > max_age:
+            self._refresh(pump_id, token)
+            entry = self.peek(pump_id, token)
+        if entry is None or (since is not None and entry[0] < since):
+            return None
+        return entry[1]
+
+    def _refresh(self, pump_id: Any, token: Optional[str]) -> None:
+        """Hỏi backend bản ghi mới nhất; các dòng nhận được được ghi vào chỉ mục của `token`."""
+        from .sensor_data import get_data_by_date, get_data_by_pump
+        from .day_cache import local_now
+        self.refreshes += 1
+        if self.newest_first is not False:
+            # Hai dòng đầu cho biết backend có trả dòng mới nhất trước không (như sensor_feed._fetch_newer).
+            response = get_data_by_pump(ma_may_bom=pump_id, limit=2, offset=0, token=token)
+            order = self._newest_first(response.get('data') if isinstance(response, dict) else None)
+            if order is not None:
+                self.newest_first = order
+            if self.newest_first is not False:
+                return
+        # Backend trả dòng cũ trước: quét dữ liệu hôm nay của máy bơm (kho cục bộ không tự ghi vào chỉ mục).
+        response = get_data_by_date(local_now().date().isoformat(), token=token, limit=1000, offset=0,
+                                    ma_may_bom=pump_id)
+        rows = response.get('data') if isinstance(response, dict) else None
+        if isinstance(rows, list):
+            self.observe_rows(rows, token=token)
+
+    @staticmethod
+    def _newest_first(rows: Any, time_keys: Sequence[str] = DEFAULT_TIME_KEYS) -> Optional[bool]:
+        rows = [r for r in rows or [] if isinstance(r, dict)]
+        if len(rows) < 2:
+            return None
+        time_key = next((k for k in time_keys if any(r.get(k) for r in rows)), time_keys[0])
+        timestamps = _parse_timestamps([r.get(time_key) for r in rows], LOCAL_TZ)
+        valid = timestamps[timestamps != NAT]
+        if valid.size < 2 or valid[0] == valid[-1]:
+            return None
+        return bool(valid[0] > valid[-1])
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'entries': len(self._readings), 'pumps': len({pump for _, pump in self._readings}),
+                    'refreshes': self.refreshes}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._readings.clear()
+
+
+latest_readings = LatestReadings()
+
+
+def _collect_metrics() -> List[str]:
+    stats = latest_readings.stats()
+    lines = metrics.sample_lines('api_latest_index_pumps', 'Số máy bơm có bản ghi mới nhất trong chỉ mục.',
+                                 [({}, stats['pumps'])])
+    lines += metrics.sample_lines('api_latest_index_refreshes_total', 'Số lần chỉ mục phải hỏi lại backend.',
+                                  [({}, stats['refreshes'])], kind='counter')
+    return lines
+
+
+metrics.registry.add_collector(_collect_metrics)
+
+
+def get_latest_reading(ma_may_bom: Any, token: Optional[str] = None, max_age: float = LATEST_MAX_AGE,
+                       since: Optional[int] = None) -> Optional[Dict[str, Any]]:
+    return latest_readings.get(ma_may_bom, token=token, max_age=max_age, since=since)
@@ -1,37 +1,72 @@
-from typing import Optional, Dict, Any
-import os
+from typing import Optional, Dict, Any, List
 import requests
+from . import client, metrics
+from .cache import caller_identity
+from .daterange import fetch_days, DateLike
+from .day_cache import DayPartitionCache
 
-URL_API_BASE = os.environ.get('URL_API_BASE', 'http://127.0.0.1:8000/api/v1')
+# Nhật ký của các ngày đã qua không đổi: giữ trên đĩa + bộ nhớ theo từng token, chỉ tải lại ngày hôm nay.
+memory_log_days = DayPartitionCache('nhat-ky-may-bom')
 
 
-def _url(path: str) -> str:
-    return URL_API_BASE.rstrip('/') + '/' + path.lstrip('/')
+def _collect_metrics() -> List[str]:
+    stats = memory_log_days.stats()
+    lines = metrics.sample_lines('api_day_cache_entries', 'Số ngày nhật ký máy bơm giữ trong bộ nhớ.',
+                                 [({}, stats['entries'])])
+    lines += metrics.sample_lines('api_day_cache_lookups_total', 'Số lần tra cache theo ngày theo kết quả.', [
+        ({'result': 'hit'}, stats['hits']),
+        ({'result': 'disk'}, stats['disk_hits']),
+        ({'result': 'miss'}, stats['misses']),
+        ({'result': 'today'}, stats['bypass']),
+    ], kind='counter')
+    return lines
 
 
-def get_pump_memory_logs(ma_may_bom: int, token: Optional[str] = None, limit: Optional[int] = None, offset: int = 0, date: Optional[str] = None) -> Dict[str, Any]:
+metrics.registry.add_collector(_collect_metrics)
 
 
+def _get_logs(endpoint: str, params: Dict[str, Any], token: Optional[str]) -> Dict[str, Any]:
     try:
-        headers = {}
-        if token:
-            headers['Authorization'] = f'Bearer {token}'
-
-        params = {'limit': limit, 'offset': offset, 'ma_may_bom': ma_may_bom}
-
-        if date:
-            endpoint = f'nhat-ky-may-bom/ngay/{date}'
-            resp = requests.get(_url(endpoint), params=params, timeout=5, headers=headers)
-        else:
-            resp = requests.get(_url('nhat-ky-may-bom'), params=params, timeout=5, headers=headers)
-
-        try:
-            data = resp.json() if resp.content else {}
-        except Exception:
-            data = {}
+        resp = client.get(endpoint, params=params, token=token)
+        data = client.decode_json(resp)
         if resp.status_code == 200:
             return data
-        return {'data': [], 'limit': limit, 'offset': offset, 'total': 0, 'error': data}
+        return {'data': [], 'limit': params.get('limit'), 'offset': params.get('offset'), 'total': 0, 'error': data}
     except requests.RequestException as e:
-        return {'data': [], 'limit': limit, 'offset': offset, 'total': 0, 'error': str(e)}
-    
\ No newline at end of file
+        return {'data': [], 'limit': params.get('limit'), 'offset': params.get('offset'), 'total': 0, 'error': str(e)}
+
+
+def get_pump_memory_logs(ma_may_bom: int, token: Optional[str] = None, limit: Optional[int] = None, offset: int = 0, date: Optional[str] = None) -> Dict[str, Any]:
+    """Nhật ký máy bơm; khi có `date`, ngày đã qua được lấy từ memory_log_days.
+
+    Khoá cache gồm băm của token (caller_identity), không dựa vào nội dung token chưa được kiểm
+    chữ ký, nên nhật ký tải bằng token này chỉ được trả lại cho đúng token đó.
+    """
+    params = {'limit': limit, 'offset': offset, 'ma_may_bom': ma_may_bom}
+    if date:
+        endpoint = f'nhat-ky-may-bom/ngay/{date}'
+        return memory_log_days.get_or_fetch(
+            (caller_identity(token), str(ma_may_bom), limit, offset), str(date)[:10],
+            lambda: _get_logs(endpoint, params, token),
+            cacheable=lambda data: isinstance(data, dict) and 'error' not in data,
+        )
+    return _get_logs('nhat-ky-may-bom', params, token)
+
+
+def log_sort_key(log: Dict[str, Any]) -> str:
+    return str(log.get('thoi_gian_bat') or log.get('thoi_gian_tat') or log.get('thoi_gian_tao') or '')
+
+
+def get_pump_memory_logs_range(ma_may_bom: int, start: DateLike, end: DateLike, token: Optional[str] = None,
+                               limit: Optional[int] = 100, deadline: Optional[float] = None) -> Dict[str, Any]:
+    """Lấy nhật ký máy bơm cho mọi ngày trong [start, end], tải song song theo ngày.
+
+    Kết quả sắp xếp mới nhất trước theo thoi_gian_bat (hoặc thoi_gian_tat/thoi_gian_tao).
+    """
+    return fetch_days(
+        lambda ngay: get_pump_memory_logs(ma_may_bom, token=token, limit=limit, offset=0, date=ngay),
+        start, end,
+        sort_key=log_sort_key,
+        deadline=deadline,
+        reverse=True,
+    )
@@ -0,0 +1,249 @@
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+import bisect
+import contextvars
+import hmac
+import os
+import threading
+import time
+
+# Địa chỉ được đọc /metrics không cần token (phân tách bởi dấu phẩy); request đi qua proxy
+# (có X-Forwarded-For / Forwarded) không được tính là cục bộ. Rỗng: chỉ đọc được bằng token.
+METRICS_ALLOW = [a.strip() for a in os.environ.get('API_METRICS_ALLOW', '127.0.0.1,::1').split(',') if a.strip()]
+# Token cho Prometheus (Authorization: Bearer ...) khi đọc /metrics từ nơi khác.
+METRICS_TOKEN = os.environ.get('API_METRICS_TOKEN', '')
+
+# Mốc (giây) của histogram độ trễ gọi backend.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+# Callback Dash đang chạy (id output), dùng để biết dashboard nào gọi backend nhiều.
+current_callback: contextvars.ContextVar = contextvars.ContextVar('api_current_callback', default='')
+
+
+def _labels(**labels) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in items) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self._lock = threading.Lock()
+
+    def header(self) -> List[str]:
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, name: str, help_text: str):
+        super().__init__(name, help_text)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = _labels(**labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [f'{self.name}{_format_labels(k)} {_format_value(v)}' for k, v in items]
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def __init__(self, name: str, help_text: str):
+        super().__init__(name, help_text)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = _labels(**labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[_labels(**labels)] = value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [f'{self.name}{_format_labels(k)} {_format_value(v)}' for k, v in items]
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, help_text: str, buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help_text)
+        self.buckets = tuple(sorted(buckets))
+        self._counts: Dict[Labels, List[int]] = {}
+        self._sums: Dict[Labels, float] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = _labels(**labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._counts.get(key)
+            if counts is None:
+                counts = self._counts[key] = [0] * (len(self.buckets) + 1)
+                self._sums[key] = 0.0
+            counts[index] += 1
+            self._sums[key] += value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, list(v), self._sums[k]) for k, v in self._counts.items())
+        lines = self.header()
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{_format_labels(key, ("le", _format_value(bound)))} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(key)} {total!r}')
+            lines.append(f'{self.name}_count{_format_labels(key)} {cumulative}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], List[str]]] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], List[str]]) -> None:
+        """Hàm trả về các dòng exposition, gọi lúc render; mỗi module tự đăng ký số liệu của mình."""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            try:
+                lines.extend(collector())
+            except Exception as e:
+                print(f"Error collecting metrics: {e}")
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+upstream_latency = registry.register(Histogram(
+    'api_upstream_request_duration_seconds', 'Độ trễ gọi backend theo nhóm endpoint.'))
+upstream_responses = registry.register(Counter(
+    'api_upstream_responses_total', 'Số response từ backend theo mã trạng thái.'))
+upstream_errors = registry.register(Counter(
+    'api_upstream_errors_total', 'Số lời gọi backend lỗi theo loại lỗi.'))
+upstream_bytes = registry.register(Counter(
+    'api_upstream_response_bytes_total', 'Số byte body nhận từ backend.'))
+upstream_in_flight = registry.register(Gauge(
+    'api_upstream_in_flight', 'Số request tới backend đang chạy.'))
+upstream_by_callback = registry.register(Counter(
+    'api_upstream_requests_by_callback_total', 'Số request tới backend theo callback Dash gây ra.'))
+callback_latency = registry.register(Histogram(
+    'dash_callback_duration_seconds', 'Thời gian xử lý callback Dash.'))
+
+
+def observe_upstream(group: str, method: str, started: float, status: Optional[int] = None,
+                     size: int = 0, error: Optional[BaseException] = None) -> None:
+    elapsed = time.monotonic() - started
+    upstream_latency.observe(elapsed, group=group, method=method)
+    if error is not None:
+        upstream_errors.inc(group=group, method=method, error=type(error).__name__)
+    else:
+        upstream_responses.inc(group=group, method=method, status=status)
+        upstream_bytes.inc(size, group=group)
+    upstream_by_callback.inc(callback=current_callback.get() or 'none', group=group)
+
+
+def sample_lines(name: str, help_text: str, samples: List[Tuple[Dict[str, Any], float]],
+                 kind: str = 'gauge') -> List[str]:
+    """Các dòng exposition của một số liệu đọc lúc render: samples là [({nhãn: giá trị}, số), ...]."""
+    lines = [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+    lines.extend(f'{name}{_format_labels(_labels(**labels))} {_format_value(v)}' for labels, v in samples)
+    return lines
+
+
+def render() -> str:
+    return registry.render()
+
+
+def _callback_name(payload: Optional[dict]) -> str:
+    if not isinstance(payload, dict):
+        return 'unknown'
+    output = payload.get('output') or ''
+    # Output nhiều thành phần có dạng "..a.children...b.figure.."; giữ tối đa 120 ký tự.
+    return output.strip('.')[:120] or 'unknown'
+
+
+def _allowed(request) -> bool:
+    if METRICS_TOKEN:
+        header = request.headers.get('Authorization', '')
+        if header.startswith('Bearer ') and hmac.compare_digest(header[7:].strip(), METRICS_TOKEN):
+            return True
+    proxied = request.headers.get('X-Forwarded-For') or request.headers.get('Forwarded')
+    return not proxied and request.remote_addr in METRICS_ALLOW
+
+
+def install(server, path: str = '/metrics', prefix: str = '/_dash-update-component') -> None:
+    """Thêm route `path` trả về số liệu dạng Prometheus và đo thời gian callback Dash.
+
+    Chỉ trả lời request cục bộ (METRICS_ALLOW) hoặc có token METRICS_TOKEN; nơi khác nhận 404.
+    """
+    from flask import Response, g, request
+
+    @server.route(path)
+    def _metrics_endpoint():
+        if not _allowed(request):
+            return Response('Not Found', status=404, content_type='text/plain; charset=utf-8')
+        return Response(render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+    @server.before_request
+    def _start_callback_timer():
+        if request.path.endswith(prefix):
+            name = _callback_name(request.get_json(silent=True))
+            g.api_metrics_callback = (name, time.monotonic(), current_callback.set(name))
+
+    @server.teardown_request
+    def _stop_callback_timer(exc=None):
+        state = g.pop('api_metrics_callback', None)
+        if state is None:
+            return
+        name, started, token = state
+        callback_latency.observe(time.monotonic() - started, callback=name)
+        try:
+            current_callback.reset(token)
+        except ValueError:
+            current_callback.set('')
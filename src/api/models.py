@@ -1,24 +1,15 @@
 from typing import Tuple, Dict, Any, Optional
-import os
 import requests
-
-URL_API_BASE = os.environ.get('URL_API_BASE', 'http://127.0.0.1:8000/api/v1')
-
-def _url(path: str) -> str:
-    return URL_API_BASE.rstrip('/') + '/' + path.lstrip('/')
+from . import client
+from .cache import cached, invalidates
 
 
+@cached('mo-hinh-du-bao')
 def list_models(limit: int = 50, offset: int = 0, token: Optional[str] = None) -> Dict[str, Any]:
     """Lấy danh sách mô hình dự báo từ API."""
     try:
-        headers = {}
-        if token:
-            headers['Authorization'] = f'Bearer {token}'
-        resp = requests.get(_url('mo-hinh-du-bao'), params={'limit': limit, 'offset': offset}, timeout=5, headers=headers)
-        try:
-            data = resp.json() if resp.content else {}
-        except Exception:
-            data = {}
+        resp = client.get('mo-hinh-du-bao', params={'limit': limit, 'offset': offset}, token=token)
+        data = client.decode_json(resp)
         if resp.status_code == 200:
             return data
         return {'data': [], 'limit': limit, 'offset': offset, 'total': 0, 'error': data}
@@ -26,17 +17,12 @@ def list_models(limit: int = 50, offset: int = 0, token: Optional[str] = None) -
         return {'data': [], 'limit': limit, 'offset': offset, 'total': 0, 'error': str(e)}
 
 
+@cached('mo-hinh-du-bao')
 def get_model(ma_mo_hinh: int, token: Optional[str] = None) -> Dict[str, Any]:
     """Lấy thông tin một mô hình dự báo theo mã."""
     try:
-        headers = {}
-        if token:
-            headers['Authorization'] = f'Bearer {token}'
-        resp = requests.get(_url(f'mo-hinh-du-bao/{ma_mo_hinh}'), timeout=5, headers=headers)
-        try:
-            data = resp.json() if resp.content else {}
-        except Exception:
-            data = {}
+        resp = client.get(f'mo-hinh-du-bao/{ma_mo_hinh}', token=token)
+        data = client.decode_json(resp)
         if resp.status_code == 200:
             return data
         return {}
@@ -44,14 +30,10 @@ def get_model(ma_mo_hinh: int, token: Optional[str] = None) -> Dict[str, Any]:
         return {}
 
 
+@invalidates('mo-hinh-du-bao')
 def create_model(metadata: Dict[str, Any], token: Optional[str] = None) -> Tuple[bool, str]:
     """Tạo mô hình dự báo mới."""
     try:
-        headers = {
-            'Authorization': f'Bearer {token}' if token else '',
-            'Content-Type': 'application/json'
-        }
-        
         # Prepare the data
         data = {
             'ten_mo_hinh': metadata.get('ten_mo_hinh', ''),
@@ -59,11 +41,9 @@ def create_model(metadata: Dict[str, Any], token: Optional[str] = None) -> Tuple
             'trang_thai': metadata.get('trang_thai', False)
         }
             
-        resp = requests.post(_url('mo-hinh-du-bao'), json=data, timeout=30, headers=headers)
-        try:
-            msg = resp.json() if resp.content else {}
-        except Exception:
-            msg = {}
+        resp = client.post('mo-hinh-du-bao', json=data, token=token, timeout=30,
+                           headers={'Content-Type': 'application/json'})
+        msg = client.decode_json(resp)
             
         if resp.status_code == 201:
             return True, 'Tạo mô hình thành công'
@@ -72,18 +52,12 @@ def create_model(metadata: Dict[str, Any], token: Optional[str] = None) -> Tuple
         return False, str(e)
 
 
+@invalidates('mo-hinh-du-bao')
 def update_model(ma_mo_hinh: int, data: Dict[str, Any], token: Optional[str] = None) -> Tuple[bool, str]:
     """Cập nhật thông tin mô hình dự báo."""
     try:
-        headers = {}
-        if token:
-            headers['Authorization'] = f'Bearer {token}'
-        
-        resp = requests.put(_url(f'mo-hinh-du-bao/{ma_mo_hinh}'), json=data, timeout=5, headers=headers)
-        try:
-            msg = resp.json() if resp.content else {}
-        except Exception:
-            msg = {}
+        resp = client.put(f'mo-hinh-du-bao/{ma_mo_hinh}', json=data, token=token)
+        msg = client.decode_json(resp)
             
         if resp.status_code == 200:
             return True, 'Cập nhật mô hình thành công'
@@ -92,21 +66,15 @@ def update_model(ma_mo_hinh: int, data: Dict[str, Any], token: Optional[str] = N
         return False, str(e)
 
 
+@invalidates('mo-hinh-du-bao')
 def delete_model(ma_mo_hinh: int, token: Optional[str] = None) -> Tuple[bool, str]:
     """Xóa một mô hình dự báo."""
     try:
-        headers = {}
-        if token:
-            headers['Authorization'] = f'Bearer {token}'
-        
-        resp = requests.delete(_url(f'mo-hinh-du-bao/{ma_mo_hinh}'), timeout=5, headers=headers)
-        try:
-            msg = resp.json() if resp.content else {}
-        except Exception:
-            msg = {}
+        resp = client.delete(f'mo-hinh-du-bao/{ma_mo_hinh}', token=token)
+        msg = client.decode_json(resp)
             
         if resp.status_code == 200:
             return True, 'Xóa mô hình thành công'
         return False, msg.get('detail', 'Lỗi không xác định')
     except requests.RequestException as e:
-        return False, str(e)
\ No newline at end of file
+        return False, str(e)
@@ -1,51 +1,27 @@
-from typing import List, Dict, Any, Optional
-import os
-import requests
-import json
-import base64
+from typing import List, Optional
 from datetime import datetime, timedelta
-
-URL_API_BASE = os.environ.get('URL_API_BASE', 'http://127.0.0.1:8000/api/v1')
-
-def _url(path: str) -> str:
-    return URL_API_BASE.rstrip('/') + '/' + path.lstrip('/')
-
-def _decode_token(token: str) -> Dict[str, Any]:
-    try:
-        # JWT has 3 parts: header.payload.signature
-        parts = token.split('.')
-        if len(parts) < 2:
-            return {}
-        payload = parts[1]
-        # Add padding if needed
-        payload += '=' * (-len(payload) % 4)
-        decoded_bytes = base64.urlsafe_b64decode(payload)
-        return json.loads(decoded_bytes)
-    except Exception:
-        return {}
+from . import client
+from .auth import token_user_id
 
 def get_notifications(limit=50, offset=0, status=None, token=None):
     """Lấy danh sách thông báo từ API"""
     if not token:
         return {'data': [], 'total': 0}
 
-    user_info = _decode_token(token)
-    # Try to find user ID in common claims
-    user_id = user_info.get('sub') or user_info.get('id') or user_info.get('user_id') or user_info.get('ma_nguoi_dung')
+    user_id = token_user_id(token)
     
     if not user_id:
         return {'data': [], 'total': 0}
 
     try:
-        headers = {'Authorization': f'Bearer {token}'}
         params = {'limit': limit, 'offset': offset}
         if status is not None:
             params['status'] = status
             
-        resp = requests.get(_url(f'thong-bao/user/{user_id}'), headers=headers, params=params, timeout=5)
+        resp = client.get(f'thong-bao/user/{user_id}', params=params, token=token)
         
         if resp.status_code == 200:
-            data = resp.json()
+            data = client.decode_json(resp)
             
             raw_notifications = []
             if isinstance(data, list):
@@ -111,8 +87,7 @@ def mark_notification_as_read(notification_id, token=None):
         return None
         
     try:
-        headers = {'Authorization': f'Bearer {token}'}
-        resp = requests.post(_url(f'thong-bao/{notification_id}/mark-as-read'), headers=headers, timeout=5)
+        resp = client.post(f'thong-bao/{notification_id}/mark-as-read', token=token)
         
         if resp.status_code in (200, 204):
             return resp.json() if resp.content else {'id': notification_id, 'is_read': True}
@@ -128,8 +103,7 @@ def mark_all_as_read(token=None):
         return {'message': 'Token required'}
         
     try:
-        headers = {'Authorization': f'Bearer {token}'}
-        requests.post(_url('thong-bao/mark-all-as-read'), headers=headers, timeout=5)
+        client.post('thong-bao/mark-all-as-read', token=token)
     except Exception as e:
         print(f"Error marking all as read: {e}")
         pass
@@ -142,9 +116,8 @@ def delete_notification(notification_id, token=None):
         return {'message': 'Token required'}
         
     try:
-        headers = {'Authorization': f'Bearer {token}'}
         # Use DELETE /api/v1/thong-bao/{ma_thong_bao}
-        requests.delete(_url(f'thong-bao/{notification_id}'), headers=headers, timeout=5)
+        client.delete(f'thong-bao/{notification_id}', token=token)
     except Exception as e:
         print(f"Error deleting notification: {e}")
         pass
@@ -157,9 +130,8 @@ def delete_all_notifications(token=None):
         return {'message': 'Token required'}
         
     try:
-        headers = {'Authorization': f'Bearer {token}'}
         # Use DELETE /api/v1/thong-bao/delete-all
-        requests.delete(_url('thong-bao/delete-all'), headers=headers, timeout=5)
+        client.delete('thong-bao/delete-all', token=token)
     except Exception as e:
         print(f"Error deleting all notifications: {e}")
         pass
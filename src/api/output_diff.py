@@ -0,0 +1,127 @@
+from typing import Any, Iterable, List, Optional, Tuple
+from collections import OrderedDict
+import functools
+import hashlib
+import os
+import threading
+import dash
+from dash import Patch, State
+from plotly.io.json import to_json_plotly
+from dash.exceptions import PreventUpdate
+from .metrics import Counter, registry
+
+OUTPUT_DIFF_ENABLED = os.environ.get('API_OUTPUT_DIFF', '1') not in ('0', 'false', 'False')
+# Số (tab, callback) được nhớ giá trị đã gửi; cũ nhất bị bỏ trước (lần sau gửi đầy đủ).
+OUTPUT_DIFF_MAX_ENTRIES = int(os.environ.get('API_OUTPUT_DIFF_MAX_ENTRIES', '4096'))
+
+# Các input chỉ mang nghĩa "làm mới định kỳ"; các trigger khác (chọn máy bơm, đổi trang,
+# lần gọi đầu khi trang vừa render) luôn gửi đủ vì trình duyệt có thể đang hiện giá trị mặc định.
+POLL_TRIGGERS = frozenset({
+    'interval-component', 'device-refresh-interval', 'notifications-refresh-interval',
+    'live-sensor-signal', 'live-pump-signal', 'live-notification-signal',
+})
+
+# Id ngẫu nhiên của mỗi lần tải trang (app.py); thêm vào cuối danh sách State của callback dùng diff_outputs.
+TAB_STATE = State('client-tab', 'data')
+
+outputs_total = registry.register(Counter(
+    'dash_callback_outputs_total', 'Số output callback đã gửi / bỏ qua vì không đổi so với lần gửi trước.'))
+output_bytes = registry.register(Counter(
+    'dash_callback_output_bytes_total', 'Số byte JSON output đã gửi / tiết kiệm được nhờ bỏ output không đổi.'))
+
+
+def _encode(value: Any) -> Optional[bytes]:
+    try:
+        return to_json_plotly(value).encode('utf-8')
+    except Exception:
+        return None
+
+
+class OutputDiffer:
+    """Nhớ hash các output đã gửi cho từng (tab, callback) để bỏ output không đổi."""
+
+    def __init__(self, max_entries: int = OUTPUT_DIFF_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._sent: 'OrderedDict[Tuple[str, str], List[Optional[bytes]]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def apply(self, name: str, tab: str, outputs: List[Any], diff: bool) -> List[Any]:
+        """Trả về `outputs` với các phần không đổi thay bằng dash.no_update; ghi lại hash đã gửi."""
+        key = (tab, name)
+        with self._lock:
+            previous = self._sent.get(key)
+            if previous is not None:
+                self._sent.move_to_end(key)
+        previous = list(previous) if previous is not None and len(previous) == len(outputs) else [None] * len(outputs)
+
+        result, sent_bytes, saved_bytes, suppressed = [], 0, 0, 0
+        for index, value in enumerate(outputs):
+            if value is dash.no_update:
+                result.append(value)
+                continue
+            if isinstance(value, Patch):
+                # Không biết giá trị đầy đủ phía trình duyệt sau Patch: lần sau gửi lại.
+                previous[index] = None
+                result.append(value)
+                continue
+            encoded = _encode(value)
+            digest = hashlib.blake2b(encoded, digest_size=16).digest() if encoded is not None else None
+            if diff and digest is not None and digest == previous[index]:
+                result.append(dash.no_update)
+                saved_bytes += len(encoded)
+                suppressed += 1
+                continue
+            previous[index] = digest
+            sent_bytes += len(encoded) if encoded is not None else 0
+            result.append(value)
+
+        with self._lock:
+            self._sent[key] = previous
+            self._sent.move_to_end(key)
+            while len(self._sent) > self.max_entries:
+                self._sent.popitem(last=False)
+        outputs_total.inc(len(outputs) - suppressed, callback=name, result='sent')
+        outputs_total.inc(suppressed, callback=name, result='suppressed')
+        output_bytes.inc(sent_bytes, callback=name, result='sent')
+        output_bytes.inc(saved_bytes, callback=name, result='saved')
+        return result
+
+    def clear(self) -> None:
+        with self._lock:
+            self._sent.clear()
+
+
+output_differ = OutputDiffer()
+
+
+def diff_outputs(poll_triggers: Iterable[str] = POLL_TRIGGERS):
+    """Decorator (đặt dưới @callback) bỏ các output không đổi so với lần gửi trước cho cùng tab.
+
+    Callback phải khai báo TAB_STATE là State cuối cùng; giá trị này được tách ra
+    trước khi gọi hàm gốc. Chỉ so sánh khi trigger nằm trong `poll_triggers`;
+    nếu mọi output đều không đổi thì trả về 204 (PreventUpdate).
+    """
+    poll_triggers = frozenset(poll_triggers)
+
+    def decorator(func):
+        name = func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args):
+            *args, tab = args
+            result = func(*args)
+            if not OUTPUT_DIFF_ENABLED or not tab:
+                return result
+            ctx = dash.callback_context
+            triggered = ctx.triggered_id
+            # Callback một output: kết quả có thể chính là một list (children).
+            single = not isinstance(ctx.outputs_list, list)
+            outputs = [result] if single else list(result)
+            outputs = output_differ.apply(name, str(tab), outputs, diff=triggered in poll_triggers)
+            if all(value is dash.no_update for value in outputs):
+                raise PreventUpdate
+            return outputs[0] if single else outputs
+
+        return wrapper
+
+    return decorator
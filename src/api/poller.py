@@ -0,0 +1,315 @@
+from typing import Any, Callable, Dict, Hashable, List, Optional, Set, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+import os
+import threading
+import time
+from . import metrics
+from .auth import session_key
+from .cache import caller_identity, response_cache
+
+# Chu kỳ (giây) của luồng nền; mỗi job đang có người xem chạy một lần mỗi chu kỳ.
+POLL_INTERVAL = float(os.environ.get('API_POLL_INTERVAL', '5'))
+# Job không được callback nào nhắc tới trong khoảng này (giây) thì ngừng chạy.
+POLL_VIEW_TTL = float(os.environ.get('API_POLL_VIEW_TTL', '30'))
+POLL_WORKERS = int(os.environ.get('API_POLL_WORKERS', '4'))
+# Số ngày nhật ký bật/tắt giữ trong ảnh chụp máy bơm (khung "hoạt động gần đây" ở trang chủ).
+POLL_LOG_DAYS = int(os.environ.get('API_POLL_LOG_DAYS', '5'))
+
+
+class _Job:
+    __slots__ = ('run', 'audience', 'last_seen', 'last_run', 'errors')
+
+    def __init__(self, run: Callable[[], Any]):
+        self.run = run
+        self.audience: Dict[Tuple[str, str], float] = {}
+        self.last_seen = time.monotonic()
+        self.last_run = 0.0
+        self.errors = 0
+
+
+class BackgroundPoller:
+    """Một luồng nền chạy lại các job (tải dữ liệu dùng chung) đang có người xem.
+
+    Callback chỉ gọi `touch(key, job)` rồi đọc kết quả trong bộ nhớ; dù bao nhiêu
+    tab cùng xem, mỗi job chỉ gọi backend một lần mỗi chu kỳ. `audience` ghi
+    (kênh, phiên) đang xem job.
+    """
+
+    def __init__(self, interval: float = POLL_INTERVAL, view_ttl: float = POLL_VIEW_TTL,
+                 workers: int = POLL_WORKERS):
+        self.interval = interval
+        self.view_ttl = view_ttl
+        self.workers = max(int(workers), 1)
+        self._jobs: Dict[Hashable, _Job] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.cycles = 0
+        self.runs = 0
+        self.errors = 0
+
+    def touch(self, key: Hashable, job: Callable[[], Any], audience: Optional[Tuple[str, str]] = None) -> bool:
+        """Đăng ký / gia hạn job. True nếu người gọi nên tự chạy job ngay (job mới hoặc luồng nền đang chậm)."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._jobs.get(key)
+            if entry is None:
+                entry = self._jobs[key] = _Job(job)
+            entry.last_seen = now
+            if audience is not None:
+                entry.audience[audience] = now
+            stale = now - entry.last_run > 2 * self.interval
+        self._ensure_started()
+        return stale
+
+    def mark_run(self, key: Hashable) -> None:
+        with self._lock:
+            entry = self._jobs.get(key)
+            if entry is not None:
+                entry.last_run = time.monotonic()
+
+    def is_active(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._jobs
+
+    def audience(self, key: Hashable) -> Set[str]:
+        """Các phiên đang xem job `key`."""
+        cutoff = time.monotonic() - self.view_ttl
+        with self._lock:
+            job = self._jobs.get(key)
+            return {session for (_, session), seen in job.audience.items() if seen >= cutoff} if job else set()
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='api-poller', daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _active(self) -> List[Tuple[Hashable, _Job]]:
+        now = time.monotonic()
+        cutoff = now - self.view_ttl
+        with self._lock:
+            for key in [k for k, j in self._jobs.items() if j.last_seen < cutoff]:
+                del self._jobs[key]
+            for job in self._jobs.values():
+                for viewer in [a for a, seen in job.audience.items() if seen < cutoff]:
+                    del job.audience[viewer]
+            return list(self._jobs.items())
+
+    def run_once(self) -> int:
+        """Chạy mọi job đang hoạt động một lần (song song tối đa `workers`), trả về số job đã chạy."""
+        jobs = self._active()
+        if not jobs:
+            return 0
+
+        def _run(item):
+            key, job = item
+            try:
+                job.run()
+            except Exception as e:
+                job.errors += 1
+                self.errors += 1
+                print(f"Error polling {key}: {e}")
+            finally:
+                job.last_run = time.monotonic()
+
+        if len(jobs) == 1 or self.workers == 1:
+            for item in jobs:
+                _run(item)
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.workers, len(jobs)),
+                                    thread_name_prefix='api-poller-job') as pool:
+                list(pool.map(_run, jobs))
+        self.cycles += 1
+        self.runs += len(jobs)
+        return len(jobs)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            started = time.monotonic()
+            self.run_once()
+            with self._lock:
+                if not self._jobs:
+                    self._thread = None
+                    return
+            self._stop.wait(max(0.0, self.interval - (time.monotonic() - started)))
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            jobs = len(self._jobs)
+        return {'jobs': jobs, 'cycles': self.cycles, 'runs': self.runs, 'errors': self.errors}
+
+
+live_poller = BackgroundPoller()
+
+
+class _PumpState:
+    __slots__ = ('snapshot', 'viewers', 'generation', 'lock')
+
+    def __init__(self):
+        self.snapshot: Optional[Dict[str, Any]] = None
+        # caller_identity(token) -> token của các phiên đã được backend cho xem máy bơm này.
+        self.viewers: Dict[str, str] = {}
+        self.generation = -1
+        self.lock = threading.Lock()
+
+
+class LivePumps:
+    """Ảnh chụp dùng chung theo máy bơm: thông tin/trạng thái, bản ghi mới nhất và nhật ký gần đây.
+
+    Mỗi máy bơm đang được xem được `live_poller` tải lại mỗi chu kỳ bằng token của
+    một người đang xem, nên số request tới backend tỉ lệ với số máy bơm chứ không
+    với số tab. Một phiên chỉ được đọc ảnh chụp sau khi chính token của nó tải
+    thành công máy bơm đó (backend đã cho phép). Khi có ghi vào nhóm 'may-bom'
+    (api.cache.invalidates) ảnh chụp được tải lại ngay ở lần đọc kế tiếp.
+    """
+
+    def __init__(self, poller: BackgroundPoller = live_poller, log_days: int = POLL_LOG_DAYS):
+        self.poller = poller
+        self.log_days = log_days
+        self._pumps: Dict[str, _PumpState] = {}
+        self._lock = threading.Lock()
+        self.refreshes = 0
+
+    def _state(self, pump_id: Any) -> _PumpState:
+        with self._lock:
+            state = self._pumps.get(str(pump_id))
+            if state is None:
+                # Bỏ ảnh chụp (và token) của các máy bơm không còn ai xem.
+                for idle in [p for p in self._pumps if not self.poller.is_active(('pump', p))]:
+                    del self._pumps[idle]
+                state = self._pumps[str(pump_id)] = _PumpState()
+            return state
+
+    def _load(self, pump_id: Any, token: Optional[str]) -> Optional[Dict[str, Any]]:
+        from .pump import get_pump
+        from .latest import latest_readings
+        from .memory_pump import get_pump_memory_logs_range
+        from .day_cache import local_now
+
+        generation = response_cache.generation('may-bom')
+        # Bỏ qua cache kết quả của get_pump: trạng thái phải mới, client vẫn dùng conditional GET.
+        pump = get_pump.__wrapped__(pump_id, token=token)
+        if not pump or not isinstance(pump, dict) or 'error' in pump:
+            return None
+        latest = latest_readings.get(pump_id, token=token, max_age=self.poller.interval / 2)
+        now = local_now()
+        logs = get_pump_memory_logs_range(pump_id, now - timedelta(days=self.log_days - 1), now,
+                                          token=token, limit=100)
+        self.refreshes += 1
+        return {'pump': pump, 'latest': latest, 'logs': logs.get('data', []) if isinstance(logs, dict) else [],
+                'generation': generation, 'updated': time.time()}
+
+    def refresh(self, pump_id: Any) -> bool:
+        """Job của poller: tải lại bằng token của người xem gần nhất; bỏ token bị backend từ chối."""
+        from .events import hub
+
+        state = self._state(pump_id)
+        with state.lock:
+            viewers = list(state.viewers.items())
+        for identity, token in reversed(viewers):
+            snapshot = self._load(pump_id, token)
+            if snapshot is None:
+                with state.lock:
+                    state.viewers.pop(identity, None)
+                continue
+            with state.lock:
+                previous = state.snapshot
+                state.snapshot, state.generation = snapshot, snapshot['generation']
+                tokens = list(state.viewers.values())
+            self.poller.mark_run(('pump', str(pump_id)))
+            if previous is not None and (previous['pump'], previous['latest'], previous['logs']) != \
+                    (snapshot['pump'], snapshot['latest'], snapshot['logs']):
+                for viewer_token in tokens:
+                    hub.publish('pump', {'ids': [str(pump_id)]}, key=session_key(viewer_token))
+            # Bản ghi mới nhất đổi: các biểu đồ cảm biến ngoài trang chủ (không có feed) cũng cần tải lại.
+            if previous is not None and previous['latest'] != snapshot['latest']:
+                for viewer_token in tokens:
+                    hub.publish('sensor', {'ma_may_bom': str(pump_id)}, key=session_key(viewer_token))
+            return True
+        return False
+
+    def view(self, pump_id: Any, token: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Ảnh chụp hiện tại cho phiên `token` (đọc bộ nhớ); tải đồng bộ khi phiên mới, dữ liệu cũ hoặc vừa có ghi."""
+        if pump_id is None:
+            return None
+
+        key = ('pump', str(pump_id))
+        identity = caller_identity(token)
+        state = self._state(pump_id)
+        run_now = self.poller.touch(key, lambda: self.refresh(pump_id), audience=('pump', session_key(token)))
+        with state.lock:
+            allowed = identity in state.viewers
+            if allowed:
+                # Giữ token mới nhất của người xem cho các lần tải nền.
+                state.viewers.pop(identity)
+                state.viewers[identity] = token
+            stale = state.snapshot is None or state.generation != response_cache.generation('may-bom')
+            snapshot = state.snapshot
+        if allowed and not stale and not run_now:
+            return snapshot
+
+        loaded = self._load(pump_id, token)
+        if loaded is None:
+            return None
+        with state.lock:
+            state.viewers.pop(identity, None)
+            state.viewers[identity] = token
+            state.snapshot, state.generation = loaded, loaded['generation']
+        self.poller.mark_run(key)
+        return loaded
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            states = list(self._pumps.values())
+        return {'pumps': sum(1 for s in states if s.snapshot is not None),
+                'viewers': sum(len(s.viewers) for s in states), 'refreshes': self.refreshes}
+
+
+live_pumps = LivePumps()
+
+
+def keep_feed_fresh(feed, token: Optional[str]) -> None:
+    """Để luồng nền cập nhật feed cảm biến dùng chung (api.sensor_feed); chỉ tự cập nhật khi feed chưa có hoặc đã cũ.
+
+    Một job cho mỗi feed (người dùng, ngày) dù có bao nhiêu phiên; khi có dòng mới,
+    sự kiện 'sensor' được gửi tới mọi phiên đang xem job.
+    """
+    from .events import hub
+
+    key = ('feed', feed.feed_id, feed.date_str)
+
+    def job():
+        if feed.refresh():
+            for session in live_poller.audience(key):
+                hub.publish('sensor', {}, key=session)
+
+    if live_poller.touch(key, job, audience=('sensor', session_key(token))) or not feed.loaded:
+        feed.refresh()
+        live_poller.mark_run(key)
+
+
+def _collect_metrics() -> List[str]:
+    polled = live_poller.stats()
+    pumps = live_pumps.stats()
+    lines = metrics.sample_lines('api_poller_jobs', 'Số job đang được luồng nền cập nhật (máy bơm, feed cảm biến).',
+                                 [({}, polled['jobs'])])
+    lines += metrics.sample_lines('api_poller_runs_total', 'Số lần chạy job của luồng nền theo kết quả.', [
+        ({'result': 'ok'}, polled['runs'] - polled['errors']),
+        ({'result': 'error'}, polled['errors']),
+    ], kind='counter')
+    lines += metrics.sample_lines('api_live_pumps', 'Số máy bơm có ảnh chụp dùng chung.', [({}, pumps['pumps'])])
+    lines += metrics.sample_lines('api_live_pump_viewers', 'Số phiên được phép đọc ảnh chụp máy bơm.',
+                                  [({}, pumps['viewers'])])
+    return lines
+
+
+metrics.registry.add_collector(_collect_metrics)
@@ -0,0 +1,212 @@
+from typing import Any, Callable, Dict, List, Optional
+from contextlib import contextmanager
+import contextvars
+import functools
+import os
+import threading
+import time
+import requests
+from . import metrics
+
+BREAKER_FAILURE_THRESHOLD = int(os.environ.get('API_BREAKER_FAILURES', '5'))
+# Số giây mạch ở trạng thái mở trước khi cho một request thăm dò (half-open).
+BREAKER_RESET_TIMEOUT = float(os.environ.get('API_BREAKER_RESET', '15'))
+# Ngân sách thời gian mặc định (giây) cho mỗi lần gọi callback Dash.
+CALLBACK_BUDGET = float(os.environ.get('API_CALLBACK_BUDGET', '8'))
+# Timeout nhỏ nhất còn đáng để gửi request.
+MIN_TIMEOUT = 0.05
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(requests.RequestException):
+    """Backend của nhóm endpoint đang bị ngắt mạch; request không được gửi."""
+
+
+class DeadlineExceeded(requests.Timeout):
+    """Ngân sách thời gian của callback đã hết."""
+
+
+class CircuitBreaker:
+    """Ngắt mạch cho một nhóm endpoint.
+
+    Sau `failure_threshold` lỗi liên tiếp mạch mở và mọi request bị từ chối
+    ngay; hết `reset_timeout` giây thì một request thăm dò được đi qua, thành
+    công thì đóng mạch, lỗi thì mở lại.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 reset_timeout: float = BREAKER_RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> None:
+        with self._lock:
+            if self.state == CLOSED:
+                return
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+                self._probing = False
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return
+            self.rejected += 1
+        raise CircuitOpenError(f'Backend tạm ngắt cho nhóm {self.name}')
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self._probing = False
+
+    def record_neutral(self) -> None:
+        """Request kết thúc mà không nói lên gì về backend (vd hết ngân sách)."""
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+            self._probing = False
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'state': self.state, 'failures': self.failures, 'rejected': self.rejected}
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def endpoint_group(path: str) -> str:
+    """Nhóm endpoint là đoạn đầu tiên của đường dẫn, vd 'may-bom/3' -> 'may-bom'."""
+    return path.strip('/').split('/', 1)[0] or '/'
+
+
+def get_breaker(group: str) -> CircuitBreaker:
+    breaker = _breakers.get(group)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.setdefault(group, CircuitBreaker(group))
+    return breaker
+
+
+def breaker_stats() -> Dict[str, Dict[str, Any]]:
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {b.name: b.stats() for b in breakers}
+
+
+def reset_breakers() -> None:
+    with _breakers_lock:
+        _breakers.clear()
+
+
+def is_failure_status(status_code: int) -> bool:
+    return status_code >= 500
+
+
+# ---------------------------------------------------------------- deadline
+
+_deadline: contextvars.ContextVar = contextvars.ContextVar('api_deadline', default=None)
+
+
+def remaining() -> Optional[float]:
+    """Số giây còn lại của ngân sách hiện tại, None nếu không có ngân sách."""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def bounded_timeout(timeout: float) -> float:
+    """Thu nhỏ `timeout` theo ngân sách còn lại; ném DeadlineExceeded khi đã hết."""
+    left = remaining()
+    if left is None:
+        return timeout
+    if left < MIN_TIMEOUT:
+        raise DeadlineExceeded('Hết thời gian xử lý cho callback')
+    return min(timeout, left)
+
+
+def start_budget(seconds: float) -> contextvars.Token:
+    """Đặt ngân sách mới (không nới rộng ngân sách đang có)."""
+    deadline = time.monotonic() + seconds
+    current = _deadline.get()
+    if current is not None:
+        deadline = min(deadline, current)
+    return _deadline.set(deadline)
+
+
+def end_budget(token: contextvars.Token) -> None:
+    _deadline.reset(token)
+
+
+@contextmanager
+def deadline_budget(seconds: float = CALLBACK_BUDGET):
+    token = start_budget(seconds)
+    try:
+        yield
+    finally:
+        end_budget(token)
+
+
+def with_deadline(seconds: float = CALLBACK_BUDGET):
+    """Decorator đặt ngân sách thời gian cho toàn bộ một callback."""
+    def decorator(func: Callable):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with deadline_budget(seconds):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def submit_with_context(executor, fn: Callable, *args, **kwargs):
+    """executor.submit nhưng giữ ngân sách (contextvars) của luồng gọi."""
+    return executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+def install_budget(server, seconds: float = CALLBACK_BUDGET, prefix: str = '/_dash-update-component') -> None:
+    """Gắn ngân sách `seconds` cho mọi request callback Dash trên Flask `server`."""
+    from flask import g, request
+
+    @server.before_request
+    def _start_callback_budget():
+        if request.path.endswith(prefix):
+            g.api_budget_token = start_budget(seconds)
+
+    @server.teardown_request
+    def _end_callback_budget(exc=None):
+        token = g.pop('api_budget_token', None)
+        if token is not None:
+            try:
+                end_budget(token)
+            except ValueError:
+                # teardown chạy trong context khác với before_request
+                _deadline.set(None)
+
+
+def _collect_metrics() -> List[str]:
+    states = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+    breakers = sorted(breaker_stats().items())
+    lines = metrics.sample_lines('api_circuit_state', 'Trạng thái circuit breaker (0 đóng, 1 half-open, 2 mở).',
+                                 [({'group': g}, states.get(b['state'], 0)) for g, b in breakers])
+    lines += metrics.sample_lines('api_circuit_rejected_total', 'Số request bị từ chối do mạch mở.',
+                                  [({'group': g}, b['rejected']) for g, b in breakers], kind='counter')
+    return lines
+
+
+metrics.registry.add_collector(_collect_metrics)
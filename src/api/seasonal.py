@@ -0,0 +1,248 @@
+from typing import Any, Dict, Hashable, List, Optional, Sequence, Tuple
+from collections import OrderedDict
+import os
+import threading
+import numpy as np
+import pandas as pd
+from . import metrics
+from .forecast import parse_times, sample_interval_seconds
+from .sensor_frame import LOCAL_TZ
+
+# Chu kỳ mùa vụ: lịch tưới lặp lại theo ngày.
+SEASON_SECONDS = 86_400
+# Hệ số làm mịn Holt-Winters cộng tính: mức, xu hướng, mùa vụ; PHI làm tắt dần xu hướng khi dự báo xa.
+HW_ALPHA = 0.2
+HW_BETA = 0.01
+HW_GAMMA = 0.1
+HW_PHI = 0.98
+# Trọng số trung bình trượt của bình phương sai số một bước (độ rộng vùng tin cậy).
+HW_ERROR_DECAY = 0.02
+# Số điểm cuối chuỗi đọc trước khi cập nhật tăng dần (nhân 4 tới khi phủ được trạng thái đã lưu).
+TAIL_CHUNK = 256
+# Số (người gọi, máy bơm) được giữ trạng thái mô hình.
+SEASONAL_MAX_ENTRIES = int(os.environ.get('API_SEASONAL_MAX_ENTRIES', '256'))
+
+
+def season_grid(interval: float) -> Tuple[int, int]:
+    """(số ô mỗi ngày, độ dài ô ns) gần `interval` giây nhất sao cho một ngày chia hết thành ô."""
+    m = max(2, int(round(SEASON_SECONDS / max(interval, 1.0))))
+    while SEASON_SECONDS % m:
+        m -= 1
+    return m, SEASON_SECONDS // m * 10 ** 9
+
+
+def wall_clock_ns(times: pd.DatetimeIndex) -> np.ndarray:
+    """Giờ ghi trên đồng hồ Asia/Bangkok (ns); thời gian không có múi giờ được coi là giờ địa phương."""
+    if times.tz is not None:
+        times = times.tz_convert(LOCAL_TZ).tz_localize(None)
+    return times.as_unit('ns').asi8
+
+
+class HoltWinters:
+    """Trạng thái Holt-Winters cộng tính, xu hướng tắt dần, trên lưới ô cố định theo giờ địa phương.
+
+    Ô thứ `s` bắt đầu lúc s * step (ns, giờ đồng hồ); thành phần mùa vụ của ô là season[s % m].
+    Ô không có dữ liệu chỉ tiến mức theo xu hướng, không cập nhật mùa vụ.
+    """
+
+    __slots__ = ('m', 'step', 'level', 'trend', 'season', 'last_slot', 'mse', 'points')
+
+    def __init__(self, m: int, step: int, level: float, trend: float, season: List[float], last_slot: int):
+        self.m = m
+        self.step = step
+        self.level = level
+        self.trend = trend
+        self.season = season
+        self.last_slot = last_slot
+        self.mse = 0.0
+        self.points = 0
+
+    @property
+    def interval(self) -> float:
+        return self.step / 1e9
+
+    @property
+    def band(self) -> float:
+        return 2.0 * float(np.sqrt(self.mse))
+
+    @classmethod
+    def fit(cls, slots: np.ndarray, values: np.ndarray, m: int, step: int) -> 'HoltWinters':
+        """Khởi tạo từ hai ngày đầu (trung bình theo vị trí trong ngày) rồi làm mịn qua toàn bộ dữ liệu."""
+        first = int(slots[0])
+        window = slots < first + 2 * m
+        phase_sum = np.bincount(slots[window] % m, weights=values[window], minlength=m)
+        phase_count = np.bincount(slots[window] % m, minlength=m)
+        day_one, day_two = slots < first + m, window & (slots >= first + m)
+        level = float(values[day_one].mean())
+        trend = float(values[day_two].mean() - level) / m if day_two.any() else 0.0
+        season = np.zeros(m)
+        np.divide(phase_sum, phase_count, out=season, where=phase_count > 0)
+        season = np.where(phase_count > 0, season - float(values[window].mean()), 0.0)
+        state = cls(m, step, level - trend, trend, season.tolist(), first - 1)
+        state.update(slots, values)
+        return state
+
+    def update(self, slots: np.ndarray, values: np.ndarray) -> int:
+        """Cập nhật theo các ô mới hơn last_slot (đã sắp xếp, mỗi ô một giá trị); trả về số ô đã dùng."""
+        start = int(np.searchsorted(slots, self.last_slot, side='right'))
+        if start >= len(slots):
+            return 0
+        m, season = self.m, self.season
+        level, trend, last, mse = self.level, self.trend, self.last_slot, self.mse
+        alpha, beta, gamma, phi, decay = HW_ALPHA, HW_BETA, HW_GAMMA, HW_PHI, HW_ERROR_DECAY
+        for slot, y in zip(slots[start:].tolist(), values[start:].tolist()):
+            # Các ô trống xen giữa: chỉ tiến theo xu hướng tắt dần.
+            for _ in range(slot - last - 1):
+                level += phi * trend
+                trend *= phi
+            index = slot % m
+            base = level + phi * trend
+            error = y - base - season[index]
+            new_level = alpha * (y - season[index]) + (1 - alpha) * base
+            trend = beta * (new_level - level) + (1 - beta) * phi * trend
+            season[index] = gamma * (y - new_level) + (1 - gamma) * season[index]
+            level, last = new_level, slot
+            mse += decay * (error * error - mse)
+        used = len(slots) - start
+        self.level, self.trend, self.last_slot, self.mse = level, trend, last, mse
+        self.points += used
+        return used
+
+    def forecast(self, steps: int) -> Tuple[np.ndarray, np.ndarray]:
+        """(giá trị, ô) của `steps` ô sau last_slot; giá trị không âm."""
+        k = np.arange(1, steps + 1)
+        damped = np.cumsum(HW_PHI ** k)
+        slots = self.last_slot + k
+        season = np.asarray(self.season)[slots % self.m]
+        return np.maximum(0.0, self.level + damped * self.trend + season), slots
+
+    def copy(self) -> 'HoltWinters':
+        state = HoltWinters(self.m, self.step, self.level, self.trend, list(self.season), self.last_slot)
+        state.mse, state.points = self.mse, self.points
+        return state
+
+
+def slot_series(series: Sequence[Dict[str, Any]], step: Optional[int] = None
+                ) -> Tuple[int, int, np.ndarray, np.ndarray]:
+    """(m, step, ô, giá trị trung bình mỗi ô) của chuỗi [{'time', 'flow_rate'}, ...], ô tăng dần.
+
+    Không truyền `step` thì bước lưới suy ra từ khoảng cách lấy mẫu (season_grid).
+    """
+    flows = pd.to_numeric(pd.Series([p.get('flow_rate') for p in series], dtype='object'), errors='coerce')
+    flows = flows.to_numpy(dtype=np.float64, na_value=np.nan)
+    times = parse_times([p.get('time') for p in series])
+    keep = np.isfinite(flows) & ~times.isna()
+    flows, times = flows[keep], times[keep]
+    wall = wall_clock_ns(times)
+    if step is None:
+        m, step = season_grid(sample_interval_seconds(np.sort(wall)))
+    else:
+        m = SEASON_SECONDS * 10 ** 9 // step
+    slots, inverse = np.unique(wall // step, return_inverse=True)
+    sums = np.bincount(inverse, weights=flows, minlength=slots.shape[0])
+    counts = np.bincount(inverse, minlength=slots.shape[0])
+    return m, step, slots, sums / np.maximum(counts, 1)
+
+
+def _tail_slots(series: Sequence[Dict[str, Any]], state: HoltWinters) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    """Các ô cuối của `series` (đã sắp theo thời gian) đủ phủ từ last_slot trở đi, chỉ đọc phần đuôi.
+
+    None khi dữ liệu không nối tiếp được trạng thái (quay lui hoặc trống hơn một ngày).
+    """
+    size = TAIL_CHUNK
+    while True:
+        _, _, slots, values = slot_series(series[-size:], state.step)
+        if not slots.shape[0] or slots[0] <= state.last_slot or size >= len(series):
+            break
+        size *= 4
+    if not slots.shape[0] or slots[-1] < state.last_slot:
+        return None
+    following = int(np.searchsorted(slots, state.last_slot, side='right'))
+    if following < slots.shape[0] and slots[following] - state.last_slot > state.m:
+        return None
+    return slots, values
+
+
+class SeasonalModels:
+    """Trạng thái Holt-Winters theo (người gọi, máy bơm), LRU.
+
+    Mỗi lần tải lại chỉ các ô mới hơn trạng thái đã lưu được đưa vào mô hình (O(số điểm mới));
+    mô hình được khớp lại từ đầu khi dữ liệu không nối tiếp (quay lui hoặc trống hơn một ngày).
+    Ô mới nhất có thể còn đang nhận dữ liệu nên chưa được đưa vào.
+    """
+
+    def __init__(self, max_entries: int = SEASONAL_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._states: 'OrderedDict[Hashable, HoltWinters]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks: Dict[Hashable, threading.Lock] = {}
+        self.fits = 0
+        self.updates = 0
+        self.points = 0
+
+    def _key_lock(self, key: Hashable) -> threading.Lock:
+        with self._lock:
+            lock = self._key_locks.get(key)
+            if lock is None:
+                lock = self._key_locks[key] = threading.Lock()
+            return lock
+
+    def update(self, key: Hashable, series: Sequence[Dict[str, Any]]) -> Optional[HoltWinters]:
+        """Bản sao trạng thái đã cập nhật theo `series` (sắp theo thời gian); None khi chưa đủ hai ngày dữ liệu."""
+        if not series:
+            return None
+        with self._key_lock(key):
+            with self._lock:
+                state = self._states.get(key)
+            tail = _tail_slots(series, state) if state is not None else None
+            if tail is not None:
+                self.points += state.update(tail[0][:-1], tail[1][:-1])
+                self.updates += 1
+            else:
+                m, step, slots, values = slot_series(series)
+                slots, values = slots[:-1], values[:-1]
+                if slots.shape[0] < m or slots[-1] - slots[0] + 1 < 2 * m:
+                    # Chưa có trạng thái cho khoá này: bỏ luôn khoá để _key_locks không lớn dần theo số token.
+                    with self._lock:
+                        if key not in self._states:
+                            self._key_locks.pop(key, None)
+                    return None
+                state = HoltWinters.fit(slots, values, m, step)
+                self.fits += 1
+                self.points += state.points
+            snapshot = state.copy()
+            with self._lock:
+                self._states[key] = state
+                self._states.move_to_end(key)
+                while len(self._states) > self.max_entries:
+                    old, _ = self._states.popitem(last=False)
+                    self._key_locks.pop(old, None)
+        return snapshot
+
+    def clear(self) -> None:
+        with self._lock:
+            self._states.clear()
+            self._key_locks.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'entries': len(self._states), 'fits': self.fits, 'updates': self.updates, 'points': self.points}
+
+
+seasonal_models = SeasonalModels()
+
+
+def _collect_metrics() -> List[str]:
+    stats = seasonal_models.stats()
+    lines = metrics.sample_lines('api_seasonal_models', 'Số mô hình Holt-Winters (người gọi, máy bơm) đang giữ.',
+                                 [({}, stats['entries'])])
+    lines += metrics.sample_lines('api_seasonal_runs_total', 'Số lần khớp mô hình mùa vụ theo cách cập nhật.', [
+        ({'kind': 'fit'}, stats['fits']),
+        ({'kind': 'update'}, stats['updates']),
+    ], kind='counter')
+    lines += metrics.sample_lines('api_seasonal_points_total', 'Số ô dữ liệu đã đưa vào mô hình mùa vụ.',
+                                  [({}, stats['points'])], kind='counter')
+    return lines
+
+
+metrics.registry.add_collector(_collect_metrics)
@@ -1,29 +1,16 @@
 from typing import Tuple, Dict, Any, Optional
-import os
 import requests
-import time
-import base64
-import json
-
-URL_API_BASE = os.environ.get('URL_API_BASE', 'http://127.0.0.1:8000/api/v1')
-
-
-def _url(path: str) -> str:
-    return URL_API_BASE.rstrip('/') + '/' + path.lstrip('/')
+from . import client
+from .cache import cached, invalidates
 
 
+@cached('cam-bien')
 def list_sensors(limit: int = 50, offset: int = 0, token: Optional[str] = None) -> Dict[str, Any]:
     """Lấy danh sách cảm biến từ API.
     """
     try:
-        headers = {}
-        if token:
-            headers['Authorization'] = f'Bearer {token}'
-        resp = requests.get(_url('cam-bien'), params={'limit': limit, 'offset': offset}, timeout=5, headers=headers)
-        try:
-            data = resp.json() if resp.content else {}
-        except Exception:
-            data = {}
+        resp = client.get('cam-bien', params={'limit': limit, 'offset': offset}, token=token)
+        data = client.decode_json(resp)
         if resp.status_code == 200:
             # print(data)
             return data
@@ -32,16 +19,11 @@ def list_sensors(limit: int = 50, offset: int = 0, token: Optional[str] = None)
         return {'data': [], 'limit': limit, 'offset': offset, 'total': 0, 'error': str(e)}
 
 
+@cached('cam-bien')
 def get_sensor(ma_cam_bien: int, token: Optional[str] = None) -> Dict[str, Any]:
     try:
-        headers = {}
-        if token:
-            headers['Authorization'] = f'Bearer {token}'
-        resp = requests.get(_url(f'cam-bien/{ma_cam_bien}'), timeout=5, headers=headers)
-        try:
-            data = resp.json() if resp.content else {}
-        except Exception:
-            data = {}
+        resp = client.get(f'cam-bien/{ma_cam_bien}', token=token)
+        data = client.decode_json(resp)
         if resp.status_code == 200:
             return data
         return {}
@@ -49,16 +31,11 @@ def get_sensor(ma_cam_bien: int, token: Optional[str] = None) -> Dict[str, Any]:
         return {}
 
 
+@invalidates('cam-bien')
 def create_sensor(sensor: Dict[str, Any], token: Optional[str] = None) -> Tuple[bool, str]:
     try:
-        headers = {}
-        if token:
-            headers['Authorization'] = f'Bearer {token}'
-        resp = requests.post(_url('cam-bien/'), json=sensor, timeout=5, headers=headers)
-        try:
-            data = resp.json() if resp.content else {}
-        except Exception:
-            data = {}
+        resp = client.post('cam-bien/', json=sensor, token=token)
+        data = client.decode_json(resp)
         if resp.status_code in (200, 201):
             return True, data.get('message', 'Tạo cảm biến thành công')
         return False, data.get('message', data.get('error', 'Tạo cảm biến thất bại'))
@@ -66,16 +43,11 @@ def create_sensor(sensor: Dict[str, Any], token: Optional[str] = None) -> Tuple[
         return False, f'Lỗi kết nối tới server: {e}'
 
 
+@invalidates('cam-bien')
 def update_sensor(ma_cam_bien: int, sensor: Dict[str, Any], token: Optional[str] = None) -> Tuple[bool, str]:
     try:
-        headers = {}
-        if token:
-            headers['Authorization'] = f'Bearer {token}'
-        resp = requests.put(_url(f'cam-bien/{ma_cam_bien}'), json=sensor, timeout=5, headers=headers)
-        try:
-            data = resp.json() if resp.content else {}
-        except Exception:
-            data = {}
+        resp = client.put(f'cam-bien/{ma_cam_bien}', json=sensor, token=token)
+        data = client.decode_json(resp)
         if resp.status_code in (200, 204):
             return True, data.get('message', 'Cập nhật cảm biến thành công')
         return False, data.get('message', data.get('error', 'Cập nhật cảm biến thất bại'))
@@ -83,16 +55,11 @@ def update_sensor(ma_cam_bien: int, sensor: Dict[str, Any], token: Optional[str]
         return False, f'Lỗi kết nối tới server: {e}'
 
 
+@invalidates('cam-bien')
 def delete_sensor(ma_cam_bien: int, token: Optional[str] = None) -> Tuple[bool, str]:
     try:
-        headers = {}
-        if token:
-            headers['Authorization'] = f'Bearer {token}'
-        resp = requests.delete(_url(f'cam-bien/{ma_cam_bien}'), timeout=5, headers=headers)
-        try:
-            data = resp.json() if resp.content else {}
-        except Exception:
-            data = {}
+        resp = client.delete(f'cam-bien/{ma_cam_bien}', token=token)
+        data = client.decode_json(resp)
         if resp.status_code in (200, 204):
             return True, data.get('message', 'Xóa cảm biến thành công')
         return False, data.get('message', data.get('error', 'Xóa cảm biến thất bại'))
@@ -100,19 +67,14 @@ def delete_sensor(ma_cam_bien: int, token: Optional[str] = None) -> Tuple[bool,
         return False, f'Lỗi kết nối tới server: {e}'
 
 
+@cached('loai-cam-bien')
 def get_sensor_types(token: Optional[str] = None) -> Dict[str, Any]:
     """Lấy danh sách loại cảm biến từ API: GET /loai_cam_bien
 
     """
     try:
-        headers = {}
-        if token:
-            headers['Authorization'] = f'Bearer {token}'
-        resp = requests.get(_url('loai-cam-bien'), timeout=5, headers=headers)
-        try:
-            data = resp.json() if resp.content else {}
-        except Exception:
-            data = {}
+        resp = client.get('loai-cam-bien', token=token)
+        data = client.decode_json(resp)
         if resp.status_code == 200:
             return data
         return {'data': [], 'error': data}
@@ -120,48 +82,33 @@ def get_sensor_types(token: Optional[str] = None) -> Dict[str, Any]:
         return {'data': [], 'error': str(e)}
 
 # thêm loại cảm biến, cập nhật, xóa loại cảm biến có thể được thêm tương tự khi cần thiết
+@invalidates('loai-cam-bien', 'cam-bien')
 def create_sensor_type(sensor_type: Dict[str, Any], token: Optional[str] = None) -> Tuple[bool, str]:
     try:
-        headers = {}
-        if token:
-            headers['Authorization'] = f'Bearer {token}'
-        resp = requests.post(_url('loai-cam-bien/'), json=sensor_type, timeout=5, headers=headers)
-        try:
-            data = resp.json() if resp.content else {}
-        except Exception:
-            data = {}
+        resp = client.post('loai-cam-bien/', json=sensor_type, token=token)
+        data = client.decode_json(resp)
         if resp.status_code in (200, 201):
             return True, data.get('message', 'Tạo loại cảm biến thành công')
         return False, data.get('message', data.get('error', 'Tạo loại cảm biến thất bại'))
     except requests.RequestException as e:
         return False, f'Lỗi kết nối tới server: {e}'
     
+@invalidates('loai-cam-bien', 'cam-bien')
 def delete_sensor_type(ma_loai_cam_bien: int, token: Optional[str] = None) -> Tuple[bool, str]:
     try:
-        headers = {}
-        if token:
-            headers['Authorization'] = f'Bearer {token}'
-        resp = requests.delete(_url(f'loai-cam-bien/{ma_loai_cam_bien}'), timeout=5, headers=headers)
-        try:
-            data = resp.json() if resp.content else {}
-        except Exception:
-            data = {}
+        resp = client.delete(f'loai-cam-bien/{ma_loai_cam_bien}', token=token)
+        data = client.decode_json(resp)
         if resp.status_code in (200, 204):
             return True, data.get('message', 'Xóa loại cảm biến thành công')
         return False, data.get('message', data.get('error', 'Xóa loại cảm biến thất bại'))
     except requests.RequestException as e:
         return False, f'Lỗi kết nối tới server: {e}'
     
+@invalidates('loai-cam-bien', 'cam-bien')
 def update_sensor_type(ma_loai_cam_bien: int, sensor_type: Dict[str, Any], token: Optional[str] = None) -> Tuple[bool, str]:
     try:
-        headers = {}
-        if token:
-            headers['Authorization'] = f'Bearer {token}'
-        resp = requests.put(_url(f'loai-cam-bien/{ma_loai_cam_bien}'), json=sensor_type, timeout=5, headers=headers)
-        try:
-            data = resp.json() if resp.content else {}
-        except Exception:
-            data = {}
+        resp = client.put(f'loai-cam-bien/{ma_loai_cam_bien}', json=sensor_type, token=token)
+        data = client.decode_json(resp)
         if resp.status_code in (200, 204):
             return True, data.get('message', 'Cập nhật loại cảm biến thành công')
         return False, data.get('message', data.get('error', 'Cập nhật loại cảm biến thất bại'))
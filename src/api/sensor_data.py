@@ -1,68 +1,239 @@
-from typing import Tuple, Dict, Any, Optional
-import os
+from typing import Tuple, Dict, Any, Iterator, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import time
 import requests
+from . import client, resilience
+from .daterange import fetch_days, iter_days, map_days, DateLike
+from .latest import latest_readings
+from .sensor_frame import (DEFAULT_TIME_KEYS, LOCAL_TZ, SensorFrame, decode_sensor_body)
+from .sensor_store import sensor_store
 
-URL_API_BASE = os.environ.get('URL_API_BASE', 'http://127.0.0.1:8000/api/v1')
 
-
-def _url(path: str) -> str:
-    return URL_API_BASE.rstrip('/') + '/' + path.lstrip('/')
+def _observe(response: Any, token: Optional[str]) -> None:
+    """Ghi các bản ghi vừa tải bằng `token` vào chỉ mục bản ghi mới nhất theo máy bơm của người gọi."""
+    rows = response.get('data') if isinstance(response, dict) else response
+    if isinstance(rows, list):
+        try:
+            latest_readings.observe_rows(rows, token=token)
+        except Exception as e:
+            print(f"Error indexing latest sensor data: {e}")
 
 
 def get_data_by_pump(ma_may_bom: Optional[int] = None, limit: int = 20, offset: int = 0, token: Optional[str] = None) -> Dict[str, Any]:
 
     try:
-        headers = {}
-        if token:
-            headers['Authorization'] = f'Bearer {token}'
         params = {'limit': limit, 'offset': offset}
         if ma_may_bom is not None:
             params['ma_may_bom'] = ma_may_bom
-        resp = requests.get(_url('du-lieu-cam-bien'), params=params, timeout=5, headers=headers)
-        try:
-            data = resp.json() if resp.content else {}
-        except Exception:
-            data = {}
+        resp = client.get('du-lieu-cam-bien', params=params, token=token)
+        data = client.decode_json(resp)
         if resp.status_code == 200:
+            _observe(data, token)
             return data
         return {'data': [], 'limit': limit, 'offset': offset, 'total': 0, 'error': data}
     except requests.RequestException as e:
         return {'data': [], 'limit': limit, 'offset': offset, 'total': 0, 'error': str(e)}
 
 
-def get_data_by_date(ngay: str, token: Optional[str] = None, limit: Optional[int] = None, offset: Optional[int] = None, ma_may_bom: Optional[int] = None) -> Dict[str, Any]:
-    """Get sensor data for a given date (ngay in YYYY-MM-DD)."""
+def _row_time(item: Dict[str, Any]) -> Optional[datetime]:
+    value = item.get('thoi_gian_tao') if isinstance(item, dict) else None
+    if not value:
+        return None
+    text = str(value).strip()
+    if text.endswith('Z'):
+        text = text[:-1] + '+00:00'
+    try:
+        return datetime.fromisoformat(text)
+    except ValueError:
+        return None
+
+
+def _is_before(dt: Optional[datetime], cutoff: datetime) -> bool:
+    if dt is None:
+        return False
+    if (dt.tzinfo is None) != (cutoff.tzinfo is None):
+        dt = dt.replace(tzinfo=None) if dt.tzinfo is not None else dt.replace(tzinfo=cutoff.tzinfo)
+    return dt < cutoff
+
+
+def iter_data_pages(ma_may_bom: Optional[int] = None, token: Optional[str] = None, page_size: int = 200,
+                    since: Optional[datetime] = None, max_pages: Optional[int] = None) -> Iterator[List[Dict[str, Any]]]:
+    """Duyệt lần lượt các trang của /du-lieu-cam-bien, tải trước trang kế tiếp.
+
+    Trong lúc người gọi xử lý trang N, trang N+1 đã được yêu cầu ở luồng nền.
+    Khi có `since`, các dòng cũ hơn mốc bị loại; nếu backend trả dữ liệu mới
+    nhất trước thì việc duyệt dừng ngay ở trang đầu tiên chạm tới mốc.
+    """
+    def fetch(offset: int) -> Dict[str, Any]:
+        return get_data_by_pump(ma_may_bom=ma_may_bom, limit=page_size, offset=offset, token=token)
+
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='api-page-prefetch')
+    try:
+        offset = 0
+        pages = 0
+        pending = resilience.submit_with_context(executor, fetch, offset)
+        while pending is not None:
+            response = pending.result()
+            pending = None
+            if isinstance(response, dict):
+                rows = response.get('data') or []
+                total = response.get('total')
+            elif isinstance(response, list):
+                rows, total = response, None
+            else:
+                rows, total = [], None
+            if not isinstance(rows, list):
+                rows = [rows]
+            if not rows:
+                return
+
+            pages += 1
+            if since is not None:
+                kept = [row for row in rows if not _is_before(_row_time(row), since)]
+                first, last = _row_time(rows[0]), _row_time(rows[-1])
+                newest_first = first is not None and last is not None and not _is_before(first, last)
+                reached_cutoff = newest_first and _is_before(last, since)
+            else:
+                kept, reached_cutoff = rows, False
+
+            has_more = len(rows) >= page_size and not reached_cutoff
+            if total is not None:
+                try:
+                    has_more = has_more and offset + page_size < int(total)
+                except (TypeError, ValueError):
+                    pass
+            if max_pages is not None and pages >= max_pages:
+                has_more = False
+
+            if has_more:
+                offset += page_size
+                pending = resilience.submit_with_context(executor, fetch, offset)
+            if kept:
+                yield kept
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def iter_data_rows(ma_may_bom: Optional[int] = None, token: Optional[str] = None, page_size: int = 200,
+                   since: Optional[datetime] = None, max_pages: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    """Như iter_data_pages nhưng trả về từng dòng."""
+    for page in iter_data_pages(ma_may_bom, token=token, page_size=page_size, since=since, max_pages=max_pages):
+        yield from page
+
+
+def _fetch_data_by_date(ngay: str, token: Optional[str] = None, limit: Optional[int] = None, offset: Optional[int] = None,
+                        ma_may_bom: Optional[int] = None) -> Dict[str, Any]:
     try:
-        headers = {}
-        if token:
-            headers['Authorization'] = f'Bearer {token}'
-        
         params = {'limit': limit, 'offset': offset}
         if ma_may_bom is not None:
             params['ma_may_bom'] = ma_may_bom
-        resp = requests.get(_url(f'du-lieu-cam-bien/ngay/{ngay}'), timeout=5, headers=headers, params=params)
-        try:
-            data = resp.json() if resp.content else {}
-        except Exception:
-            data = {}
+        resp = client.get(f'du-lieu-cam-bien/ngay/{ngay}', params=params, token=token)
+        data = client.decode_json(resp)
         if resp.status_code == 200:
+            _observe(data, token)
             return data
         return {'data': [], 'error': data}
     except requests.RequestException as e:
         return {'data': [], 'error': str(e)}
 
 
+def get_data_by_date(ngay: str, token: Optional[str] = None, limit: Optional[int] = None, offset: Optional[int] = None, ma_may_bom: Optional[int] = None) -> Dict[str, Any]:
+    """Get sensor data for a given date (ngay in YYYY-MM-DD).
+
+    Khi bật api.sensor_store, ngày đã đóng được đọc từ đĩa, ngày hiện tại chỉ tải các dòng mới.
+    """
+    if sensor_store.enabled:
+        return sensor_store.day_rows(ngay, token=token, ma_may_bom=ma_may_bom, limit=limit, offset=offset)
+    return _fetch_data_by_date(ngay, token=token, limit=limit, offset=offset, ma_may_bom=ma_may_bom)
+
+
+def get_data_by_date_range(start: DateLike, end: DateLike, ma_may_bom: Optional[int] = None, token: Optional[str] = None,
+                           limit: Optional[int] = 1000, deadline: Optional[float] = None) -> Dict[str, Any]:
+    """Lấy dữ liệu cảm biến cho mọi ngày trong [start, end], tải song song theo ngày.
+
+    Kết quả được gộp và sắp xếp tăng dần theo thoi_gian_tao; xem fetch_days về
+    'partial' / 'missing_days' khi có ngày lỗi hoặc quá hạn.
+    """
+    return fetch_days(
+        lambda ngay: get_data_by_date(ngay, token=token, limit=limit, offset=0, ma_may_bom=ma_may_bom),
+        start, end,
+        sort_key=lambda item: str(item.get('thoi_gian_tao') or ''),
+        deadline=deadline,
+    )
+
+
+def _get_frame(path: str, params: Dict[str, Any], token: Optional[str], naive_tz: str,
+               time_keys=DEFAULT_TIME_KEYS) -> SensorFrame:
+    try:
+        resp = client.get(path, params=params, token=token)
+        if resp.status_code == 200:
+            frame = decode_sensor_body(resp.content, naive_tz=naive_tz, time_keys=time_keys)
+            if naive_tz == LOCAL_TZ:
+                latest_readings.observe_frame(frame, token=token)
+            return frame
+        return SensorFrame.empty_frame({'error': client.decode_json(resp)})
+    except requests.RequestException as e:
+        return SensorFrame.empty_frame({'error': str(e)})
+
+
+def get_frame_by_pump(ma_may_bom: Optional[int] = None, limit: int = 20, offset: int = 0, token: Optional[str] = None,
+                      naive_tz: str = LOCAL_TZ, time_keys=DEFAULT_TIME_KEYS) -> SensorFrame:
+    """Như get_data_by_pump nhưng trả về SensorFrame; meta giữ total/limit/offset."""
+    params = {'limit': limit, 'offset': offset}
+    if ma_may_bom is not None:
+        params['ma_may_bom'] = ma_may_bom
+    return _get_frame('du-lieu-cam-bien', params, token, naive_tz, time_keys)
+
+
+def get_frame_by_date(ngay: str, token: Optional[str] = None, limit: Optional[int] = None, offset: Optional[int] = None,
+                      ma_may_bom: Optional[int] = None, naive_tz: str = LOCAL_TZ) -> SensorFrame:
+    """Như get_data_by_date nhưng trả về SensorFrame (ghi nhớ theo hash của body, hoặc đọc từ api.sensor_store)."""
+    if sensor_store.enabled:
+        return sensor_store.day_frame(ngay, token=token, ma_may_bom=ma_may_bom, limit=limit, offset=offset,
+                                      naive_tz=naive_tz)
+    params = {'limit': limit, 'offset': offset}
+    if ma_may_bom is not None:
+        params['ma_may_bom'] = ma_may_bom
+    return _get_frame(f'du-lieu-cam-bien/ngay/{ngay}', params, token, naive_tz)
+
+
+def get_frame_by_date_range(start: DateLike, end: DateLike, ma_may_bom: Optional[int] = None, token: Optional[str] = None,
+                            limit: Optional[int] = 1000, deadline: Optional[float] = None,
+                            naive_tz: str = LOCAL_TZ) -> SensorFrame:
+    """SensorFrame cho mọi ngày trong [start, end], sắp xếp tăng dần theo thời gian.
+
+    meta có 'days', 'missing_days', 'partial' và 'elapsed' như get_data_by_date_range.
+    """
+    days = iter_days(start, end)
+    started = time.monotonic()
+    if sensor_store.enabled:
+        # Một truy vấn SQLite cho cả khoảng; chỉ các ngày chưa có / chưa đóng gọi backend.
+        frame, missing = sensor_store.range_frame(days, token=token, ma_may_bom=ma_may_bom, limit=limit,
+                                                  deadline=deadline, naive_tz=naive_tz)
+    else:
+        results, missing = map_days(
+            lambda ngay: get_frame_by_date(ngay, token=token, limit=limit, offset=0,
+                                           ma_may_bom=ma_may_bom, naive_tz=naive_tz),
+            days, deadline,
+        )
+        missing.extend(day for day, frame in results.items() if 'error' in frame.meta)
+        frame = SensorFrame.concat(results.values()).sort_by_time()
+    frame.meta = {
+        'total': len(frame),
+        'days': days,
+        'missing_days': sorted(set(missing), reverse=True),
+        'partial': bool(missing),
+        'elapsed': round(time.monotonic() - started, 3),
+    }
+    return frame
+
+
 def put_sensor_data(payload: Dict[str, Any], token: Optional[str] = None) -> Tuple[bool, str]:
     """PUT /du-lieu-cam-bien/ with payload containing sensor data for a date."""
     try:
-        headers = {}
-        if token:
-            headers['Authorization'] = f'Bearer {token}'
-        resp = requests.put(_url('du-lieu-cam-bien/'), json=payload, timeout=5, headers=headers)
-        try:
-            data = resp.json() if resp.content else {}
-        except Exception:
-            data = {}
+        resp = client.put('du-lieu-cam-bien/', json=payload, token=token)
+        data = client.decode_json(resp)
         if resp.status_code in (200, 204):
             return True, data.get('message', 'Cập nhật dữ liệu thành công')
         return False, data.get('message', data.get('error', 'Cập nhật dữ liệu thất bại'))
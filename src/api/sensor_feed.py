@@ -0,0 +1,306 @@
+from typing import Dict, Optional, Sequence, Tuple
+from collections import OrderedDict
+import os
+import threading
+import time
+import uuid
+import numpy as np
+import pandas as pd
+from .auth import user_scope
+from .cache import caller_identity
+from .sensor_frame import LOCAL_TZ, NAT, SensorFrame
+
+# Số dòng tối đa giữ cho mỗi feed (đủ cho một ngày đo mỗi giây ở vài máy bơm).
+FEED_CAPACITY = int(os.environ.get('API_FEED_CAPACITY', '100000'))
+# Chỉ giữ các cột trang chủ cần.
+FEED_COLUMNS = ('luu_luong_nuoc', 'do_am_dat', 'nhiet_do', 'do_am')
+# Số feed (người dùng, ngày) giữ tối đa.
+FEED_MAX_SESSIONS = int(os.environ.get('API_FEED_MAX_SESSIONS', '256'))
+# Số token (phiên) được phép đọc mỗi feed; cũ nhất bị bỏ trước và phải kiểm tra lại.
+FEED_MAX_VIEWERS = int(os.environ.get('API_FEED_MAX_VIEWERS', '16'))
+# Feed không được dùng quá số giây này sẽ bị bỏ.
+FEED_IDLE_TTL = float(os.environ.get('API_FEED_IDLE_TTL', '900'))
+# Trang mới nhất được đọc tối đa bao nhiêu trang mỗi lần poll trước khi tải lại cả ngày.
+FEED_PAGE_SIZE = int(os.environ.get('API_FEED_PAGE_SIZE', '100'))
+FEED_MAX_PAGES = int(os.environ.get('API_FEED_MAX_PAGES', '5'))
+# Các tab dùng chung một feed trong khoảng này chỉ gây một lần gọi backend.
+FEED_MIN_INTERVAL = float(os.environ.get('API_FEED_MIN_INTERVAL', '1'))
+
+
+class RunningStats:
+    """count/sum/min/max cập nhật dần, bỏ qua NaN như pandas."""
+
+    __slots__ = ('count', 'total', 'minimum', 'maximum')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.minimum = float('nan')
+        self.maximum = float('nan')
+
+    def update(self, values: np.ndarray) -> None:
+        values = values[np.isfinite(values)]
+        if not values.size:
+            return
+        low, high = float(values.min()), float(values.max())
+        self.minimum = low if self.count == 0 else min(self.minimum, low)
+        self.maximum = high if self.count == 0 else max(self.maximum, high)
+        self.count += int(values.size)
+        self.total += float(values.sum(dtype=np.float64))
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else float('nan')
+
+
+class SensorRingBuffer:
+    """Vòng đệm cố định cho dãy đo đã sắp xếp theo thời gian.
+
+    Mảng được cấp phát dần (gấp đôi) tới `capacity`. `seq` là tổng số dòng đã
+    thêm; dòng thứ s còn đọc được khi s >= seq - capacity.
+    """
+
+    def __init__(self, capacity: int = FEED_CAPACITY, columns: Sequence[str] = FEED_COLUMNS,
+                 initial: int = 1024):
+        self.capacity = max(int(capacity), 1)
+        size = min(self.capacity, max(int(initial), 1))
+        self.timestamps = np.empty(size, dtype=np.int64)
+        self.values = {c: np.empty(size, dtype=np.float32) for c in columns}
+        self.seq = 0
+
+    @property
+    def size(self) -> int:
+        return int(self.timestamps.shape[0])
+
+    def _grow(self, needed: int) -> None:
+        # Chỉ gọi khi chưa quay vòng (size < capacity) nên dữ liệu nằm ở [0, seq).
+        size = min(self.capacity, max(needed, self.size * 2))
+        timestamps = np.empty(size, dtype=np.int64)
+        timestamps[:self.seq] = self.timestamps[:self.seq]
+        self.timestamps = timestamps
+        for name, column in self.values.items():
+            grown = np.empty(size, dtype=np.float32)
+            grown[:self.seq] = column[:self.seq]
+            self.values[name] = grown
+
+    def __len__(self) -> int:
+        return min(self.seq, self.capacity)
+
+    @property
+    def first_seq(self) -> int:
+        return self.seq - len(self)
+
+    def append(self, frame: SensorFrame) -> int:
+        n = len(frame)
+        if not n:
+            return 0
+        if self.size < self.capacity and self.seq + n > self.size:
+            self._grow(self.seq + n)
+        skip = max(n - self.capacity, 0)
+        slots = np.arange(self.seq + skip, self.seq + n) % self.size
+        self.timestamps[slots] = frame.timestamps[skip:]
+        for name, column in self.values.items():
+            source = frame.values.get(name)
+            column[slots] = source[skip:] if source is not None else np.nan
+        self.seq += n
+        return n
+
+    def read(self, start_seq: Optional[int] = None) -> Optional[Tuple[np.ndarray, Dict[str, np.ndarray]]]:
+        """Các dòng từ `start_seq` tới hết (mặc định cả vòng đệm); None nếu đã bị ghi đè."""
+        start = self.first_seq if start_seq is None else int(start_seq)
+        if start < self.first_seq or start > self.seq:
+            return None
+        slots = np.arange(start, self.seq) % self.size
+        return self.timestamps[slots], {c: v[slots] for c, v in self.values.items()}
+
+
+class LiveSensorFeed:
+    """Dữ liệu cảm biến trong ngày của một người dùng, chỉ tải các dòng mới ở mỗi lần poll.
+
+    Lần đầu (hoặc khi không theo kịp) tải cả ngày qua /du-lieu-cam-bien/ngay; sau
+    đó đọc các trang mới nhất của /du-lieu-cam-bien cho tới khi gặp mốc thời gian
+    đã thấy. `epoch` đổi mỗi khi dữ liệu được nạp lại từ đầu. Feed dùng chung giữa
+    các phiên của người dùng; một phiên chỉ được đọc sau `admit` (backend đã nhận
+    token của nó), và feed tải bằng token của phiên được nhận gần nhất.
+    """
+
+    def __init__(self, date_str: str, token: Optional[str] = None, capacity: int = FEED_CAPACITY,
+                 page_size: int = FEED_PAGE_SIZE, max_pages: int = FEED_MAX_PAGES,
+                 min_interval: float = FEED_MIN_INTERVAL):
+        self.date_str = date_str
+        self.token = token
+        self.capacity = capacity
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.min_interval = min_interval
+        day_start = pd.Timestamp(date_str).tz_localize(LOCAL_TZ)
+        self.day_start = int(day_start.value)
+        self.day_end = int((day_start + pd.Timedelta(days=1)).value)
+        self.lock = threading.Lock()
+        self.incremental = True
+        self.last_used = time.monotonic()
+        self.last_refresh = 0.0
+        self.reloads = 0
+        # Khoá job của feed trong api.poller: feed tạo lại (sau khi bị bỏ) có job mới.
+        self.feed_id = uuid.uuid4().hex[:12]
+        # caller_identity(token) -> token của các phiên được phép đọc, mới nhất cuối.
+        self.viewers: 'OrderedDict[str, Optional[str]]' = OrderedDict()
+        self._reset()
+
+    def admit(self, token: Optional[str]) -> bool:
+        """True nếu phiên `token` được đọc feed; phiên mới được kiểm tra bằng một request với chính token đó."""
+        identity = caller_identity(token)
+        with self.lock:
+            if identity in self.viewers:
+                self.viewers.move_to_end(identity)
+                self.token = token
+                return True
+        from .sensor_data import get_frame_by_pump
+        if 'error' in get_frame_by_pump(limit=1, offset=0, token=token).meta:
+            return False
+        with self.lock:
+            self.viewers[identity] = token
+            while len(self.viewers) > FEED_MAX_VIEWERS:
+                self.viewers.popitem(last=False)
+            self.token = token
+        return True
+
+    def _reset(self) -> None:
+        self.buffer = SensorRingBuffer(self.capacity)
+        self.stats = {c: RunningStats() for c in self.buffer.values}
+        self.latest: Dict[str, float] = {}
+        self.epoch = uuid.uuid4().hex[:12]
+        self.loaded = False
+        self.watermark = NAT
+        self._pumps_at_watermark: set = set()
+
+    @property
+    def seq(self) -> int:
+        return self.buffer.seq
+
+    def _append(self, frame: SensorFrame) -> int:
+        frame = frame.take(np.flatnonzero(frame.timestamps != NAT)).sort_by_time()
+        if frame.empty:
+            return 0
+        for name, stats in self.stats.items():
+            column = frame.values.get(name)
+            if column is not None:
+                stats.update(column)
+        self.latest = {name: float(frame.values[name][-1]) for name in self.stats if name in frame.values}
+        newest = int(frame.timestamps[-1])
+        pumps = {str(p) for p in np.asarray(frame.pump_ids.astype(str))[frame.timestamps == newest]}
+        if newest == self.watermark:
+            self._pumps_at_watermark |= pumps
+        else:
+            self.watermark, self._pumps_at_watermark = newest, pumps
+        return self.buffer.append(frame)
+
+    def _reload(self) -> int:
+        from .sensor_data import get_frame_by_date
+        frame = get_frame_by_date(self.date_str, token=self.token)
+        if 'error' in frame.meta:
+            print(f"Error loading sensor feed: {frame.meta.get('error')}")
+            return 0
+        self._reset()
+        self.loaded = True
+        self.reloads += 1
+        return self._append(frame)
+
+    def _fetch_newer(self) -> Optional[SensorFrame]:
+        """Các dòng mới hơn watermark; None khi cần tải lại cả ngày."""
+        from .sensor_data import get_frame_by_pump
+        floor = max(self.watermark, self.day_start - 1)
+        fresh = []
+        for page in range(self.max_pages):
+            frame = get_frame_by_pump(limit=self.page_size, offset=page * self.page_size, token=self.token)
+            if 'error' in frame.meta:
+                raise RuntimeError(frame.meta.get('error'))
+            if frame.empty:
+                break
+            ts = frame.timestamps
+            valid = ts[ts != NAT]
+            if valid.size >= 2 and valid[0] < valid[-1]:
+                # Backend không trả dòng mới nhất trước: không poll tăng dần được.
+                self.incremental = False
+                return None
+            keep = (ts > floor) & (ts < self.day_end)
+            if floor == self.watermark and self._pumps_at_watermark:
+                at_mark = ts == floor
+                if at_mark.any():
+                    pumps = np.asarray(frame.pump_ids.astype(str))
+                    keep |= at_mark & ~np.isin(pumps, list(self._pumps_at_watermark))
+            fresh.append(frame.take(np.flatnonzero(keep)))
+            if len(frame) < self.page_size or (valid.size and valid.min() <= floor):
+                break
+        else:
+            return None
+        return SensorFrame.concat(fresh)
+
+    def refresh(self, force: bool = False) -> int:
+        """Cập nhật từ backend, trả về số dòng mới."""
+        with self.lock:
+            now = time.monotonic()
+            self.last_used = now
+            if not force and self.loaded and now - self.last_refresh < self.min_interval:
+                return 0
+            self.last_refresh = now
+            if not self.loaded or not self.incremental:
+                return self._reload()
+            try:
+                frame = self._fetch_newer()
+            except Exception as e:
+                print(f"Error polling sensor feed: {e}")
+                return 0
+            if frame is None:
+                return self._reload()
+            return self._append(frame)
+
+    def snapshot(self, since_seq: Optional[int] = None):
+        """(epoch, seq, timestamps, values) của các dòng từ `since_seq`; None nếu không còn trong vòng đệm."""
+        with self.lock:
+            rows = self.buffer.read(since_seq)
+            if rows is None:
+                return None
+            timestamps, values = rows
+            return self.epoch, self.buffer.seq, timestamps, values
+
+    def summary(self) -> Dict[str, object]:
+        with self.lock:
+            return {
+                'epoch': self.epoch,
+                'seq': self.buffer.seq,
+                'latest': dict(self.latest),
+                'stats': {name: (s.count, s.mean, s.minimum, s.maximum) for name, s in self.stats.items()},
+            }
+
+
+_feeds: 'OrderedDict[Tuple[str, str], LiveSensorFeed]' = OrderedDict()
+_feeds_lock = threading.Lock()
+
+
+def get_feed(token: Optional[str], date_str: str) -> Optional[LiveSensorFeed]:
+    """Feed dùng chung cho (người dùng, ngày), None nếu backend không nhận token; feed cũ/ngày cũ bị bỏ theo LRU và thời gian rảnh."""
+    key = (user_scope(token), date_str)
+    now = time.monotonic()
+    with _feeds_lock:
+        feed = _feeds.get(key)
+        if feed is None:
+            feed = _feeds[key] = LiveSensorFeed(date_str, token=token)
+        else:
+            _feeds.move_to_end(key)
+        feed.last_used = now
+        for old_key in [k for k, f in _feeds.items() if now - f.last_used > FEED_IDLE_TTL]:
+            del _feeds[old_key]
+        while len(_feeds) > FEED_MAX_SESSIONS:
+            _feeds.popitem(last=False)
+    return feed if feed.admit(token) else None
+
+
+def feed_stats() -> Dict[str, int]:
+    with _feeds_lock:
+        feeds = list(_feeds.values())
+    return {
+        'feeds': len(feeds),
+        'rows': sum(len(f.buffer) for f in feeds),
+        'reloads': sum(f.reloads for f in feeds),
+    }
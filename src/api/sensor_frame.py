@@ -0,0 +1,191 @@
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+from collections import OrderedDict
+import hashlib
+import json
+import threading
+import numpy as np
+import pandas as pd
+
+LOCAL_TZ = 'Asia/Bangkok'
+
+# Các cột số của /du-lieu-cam-bien, lưu dạng float32.
+NUMERIC_COLUMNS = ('luu_luong_nuoc', 'do_am_dat', 'nhiet_do', 'do_am', 'mua', 'so_xung', 'tong_the_tich')
+DEFAULT_TIME_KEYS = ('thoi_gian_tao',)
+
+NAT = np.iinfo(np.int64).min
+_TZ_SUFFIX = r'(?:Z|[+-]\d{2}:?\d{2})$'
+
+MEMO_MAX_ENTRIES = 64
+_memo: 'OrderedDict[tuple, SensorFrame]' = OrderedDict()
+_memo_lock = threading.Lock()
+
+
+class SensorFrame:
+    """Dữ liệu cảm biến dạng cột với kiểu cố định.
+
+    - timestamps: int64 epoch nano giây (UTC), NaT được mã hoá bằng NAT
+    - values: tên cột -> mảng float32 (NaN khi thiếu)
+    - pump_ids: pandas.Categorical của ma_may_bom
+    - meta: các khoá không phải 'data' của response (total, limit, offset, ...)
+
+    Đối tượng có thể được dùng chung giữa các callback (memo) nên coi là chỉ đọc.
+    """
+
+    __slots__ = ('timestamps', 'values', 'pump_ids', 'meta', 'time_key')
+
+    def __init__(self, timestamps: np.ndarray, values: Dict[str, np.ndarray], pump_ids: pd.Categorical,
+                 meta: Optional[Dict[str, Any]] = None, time_key: str = 'thoi_gian_tao'):
+        self.timestamps = timestamps
+        self.values = values
+        self.pump_ids = pump_ids
+        self.meta = meta or {}
+        self.time_key = time_key
+
+    def __len__(self) -> int:
+        return int(self.timestamps.shape[0])
+
+    @property
+    def empty(self) -> bool:
+        return len(self) == 0
+
+    @classmethod
+    def empty_frame(cls, meta: Optional[Dict[str, Any]] = None) -> 'SensorFrame':
+        return cls(np.empty(0, dtype=np.int64),
+                   {c: np.empty(0, dtype=np.float32) for c in NUMERIC_COLUMNS},
+                   pd.Categorical([]), meta)
+
+    def has_column(self, name: str) -> bool:
+        """Cột có ít nhất một giá trị hợp lệ."""
+        column = self.values.get(name)
+        return column is not None and bool(np.isfinite(column).any())
+
+    def valid_time_count(self) -> int:
+        return int((self.timestamps != NAT).sum())
+
+    def take(self, indexer: np.ndarray) -> 'SensorFrame':
+        return SensorFrame(self.timestamps[indexer],
+                           {c: v[indexer] for c, v in self.values.items()},
+                           self.pump_ids[indexer], dict(self.meta), self.time_key)
+
+    def sort_by_time(self) -> 'SensorFrame':
+        # NaT xếp cuối như DataFrame.sort_values
+        keys = np.where(self.timestamps == NAT, np.iinfo(np.int64).max, self.timestamps)
+        order = np.argsort(keys, kind='stable')
+        return self.take(order)
+
+    def filter_pump(self, ma_may_bom: Any) -> 'SensorFrame':
+        mask = np.asarray(self.pump_ids.astype(str)) == str(ma_may_bom)
+        return self.take(np.flatnonzero(mask))
+
+    def since(self, cutoff_ns: int) -> 'SensorFrame':
+        return self.take(np.flatnonzero(self.timestamps >= cutoff_ns))
+
+    def to_dataframe(self, tz: Optional[str] = LOCAL_TZ, columns: Optional[Sequence[str]] = None,
+                     time_column: str = 'thoi_gian_tao', drop_missing_time: bool = False) -> pd.DataFrame:
+        times = pd.to_datetime(self.timestamps, unit='ns', utc=True)
+        if tz:
+            times = times.tz_convert(tz)
+        data = {time_column: times, 'ma_may_bom': self.pump_ids}
+        for name in (columns or self.values.keys()):
+            if name in self.values:
+                data[name] = self.values[name]
+        df = pd.DataFrame(data)
+        if drop_missing_time:
+            df = df[df[time_column].notna()]
+        return df
+
+    @classmethod
+    def concat(cls, frames: Iterable['SensorFrame']) -> 'SensorFrame':
+        frames = [f for f in frames if f is not None and len(f)]
+        if not frames:
+            return cls.empty_frame()
+        names = []
+        for f in frames:
+            names.extend(n for n in f.values if n not in names)
+        values = {}
+        for name in names:
+            values[name] = np.concatenate([
+                f.values.get(name, np.full(len(f), np.nan, dtype=np.float32)) for f in frames
+            ])
+        pump_ids = pd.Categorical(np.concatenate([np.asarray(f.pump_ids.astype(object)) for f in frames]))
+        return cls(np.concatenate([f.timestamps for f in frames]), values, pump_ids,
+                   time_key=frames[0].time_key)
+
+
+def _parse_timestamps(raw: List[Any], naive_tz: str) -> np.ndarray:
+    """Chuỗi ISO -> int64 ns UTC. Chuỗi không có múi giờ được hiểu theo `naive_tz`."""
+    out = np.full(len(raw), NAT, dtype=np.int64)
+    if not raw:
+        return out
+    text = pd.Series(raw, dtype='object').astype('string').str.strip()
+    has_value = text.notna() & (text != '')
+    aware = has_value & text.str.contains(_TZ_SUFFIX, regex=True).fillna(False)
+    naive = has_value & ~aware
+
+    if aware.any():
+        parsed = pd.to_datetime(text[aware].str.replace(r'Z$', '+00:00', regex=True), errors='coerce', utc=True, format='ISO8601')
+        out[np.flatnonzero(aware.to_numpy())] = pd.DatetimeIndex(parsed).as_unit('ns').asi8
+    if naive.any():
+        parsed = pd.DatetimeIndex(pd.to_datetime(text[naive], errors='coerce', format='ISO8601'))
+        parsed = parsed.tz_localize(naive_tz, ambiguous='NaT', nonexistent='NaT')
+        out[np.flatnonzero(naive.to_numpy())] = parsed.as_unit('ns').asi8
+    return out
+
+
+def decode_sensor_rows(rows: Sequence[Dict[str, Any]], naive_tz: str = LOCAL_TZ,
+                       time_keys: Sequence[str] = DEFAULT_TIME_KEYS,
+                       meta: Optional[Dict[str, Any]] = None) -> SensorFrame:
+    """Chuyển danh sách bản ghi /du-lieu-cam-bien thành SensorFrame.
+
+    Cột thời gian là khoá đầu tiên trong `time_keys` có giá trị ở ít nhất một dòng.
+    """
+    rows = [r for r in (rows or []) if isinstance(r, dict)]
+    if not rows:
+        return SensorFrame.empty_frame(meta)
+
+    time_key = next((k for k in time_keys if any(r.get(k) for r in rows)), time_keys[0])
+    timestamps = _parse_timestamps([r.get(time_key) for r in rows], naive_tz)
+
+    values = {}
+    for name in NUMERIC_COLUMNS:
+        column = pd.to_numeric(pd.Series([r.get(name) for r in rows], dtype='object'), errors='coerce')
+        values[name] = column.to_numpy(dtype=np.float32, na_value=np.nan)
+
+    pump_ids = pd.Categorical([r.get('ma_may_bom') for r in rows])
+    return SensorFrame(timestamps, values, pump_ids, meta, time_key)
+
+
+def decode_sensor_response(response: Any, naive_tz: str = LOCAL_TZ,
+                           time_keys: Sequence[str] = DEFAULT_TIME_KEYS) -> SensorFrame:
+    """Như decode_sensor_rows nhưng nhận response đã giải mã ({'data': [...], ...} hoặc list)."""
+    if isinstance(response, dict):
+        meta = {k: v for k, v in response.items() if k != 'data'}
+        return decode_sensor_rows(response.get('data') or [], naive_tz, time_keys, meta)
+    if isinstance(response, list):
+        return decode_sensor_rows(response, naive_tz, time_keys)
+    return SensorFrame.empty_frame()
+
+
+def decode_sensor_body(body: bytes, naive_tz: str = LOCAL_TZ,
+                       time_keys: Sequence[str] = DEFAULT_TIME_KEYS) -> SensorFrame:
+    """Giải mã body JSON thô, ghi nhớ theo hash của body.
+
+    Các lần poll nhận lại đúng body cũ sẽ bỏ qua cả bước json.loads lẫn bước
+    chuyển đổi cột.
+    """
+    key = (hashlib.blake2b(body, digest_size=16).digest(), naive_tz, tuple(time_keys))
+    with _memo_lock:
+        frame = _memo.get(key)
+        if frame is not None:
+            _memo.move_to_end(key)
+            return frame
+    try:
+        response = json.loads(body) if body else {}
+    except ValueError:
+        response = {}
+    frame = decode_sensor_response(response, naive_tz, time_keys)
+    with _memo_lock:
+        _memo[key] = frame
+        while len(_memo) > MEMO_MAX_ENTRIES:
+            _memo.popitem(last=False)
+    return frame
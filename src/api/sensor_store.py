@@ -0,0 +1,446 @@
+from typing import Any, Dict, Hashable, List, Optional, Sequence, Tuple
+from datetime import date, datetime, timedelta
+from zoneinfo import ZoneInfo
+import json
+import os
+import sqlite3
+import threading
+import time
+import numpy as np
+import pandas as pd
+from . import metrics
+from .auth import user_scope
+from .cache import caller_identity
+from .day_cache import is_closed_day
+from .sensor_frame import _TZ_SUFFIX, LOCAL_TZ, NAT, NUMERIC_COLUMNS, SensorFrame, decode_sensor_rows
+
+# File SQLite lưu dữ liệu cảm biến đã tải; chuỗi rỗng để luôn đọc thẳng từ backend.
+SENSOR_STORE_PATH = os.environ.get('API_SENSOR_STORE_PATH',
+                                   os.path.join(os.path.expanduser('~'), '.cache', 'predict-water-flow', 'sensors.sqlite3'))
+# Kích thước trang khi tải trọn một ngày qua /du-lieu-cam-bien/ngay.
+SENSOR_STORE_PAGE_SIZE = int(os.environ.get('API_SENSOR_STORE_PAGE_SIZE', '1000'))
+# Đồng bộ ngày chưa đóng: đọc các trang mới nhất của /du-lieu-cam-bien tới mốc đã lưu.
+SENSOR_STORE_SYNC_PAGE_SIZE = int(os.environ.get('API_SENSOR_STORE_SYNC_PAGE_SIZE', '200'))
+SENSOR_STORE_SYNC_MAX_PAGES = int(os.environ.get('API_SENSOR_STORE_SYNC_MAX_PAGES', '10'))
+# Khoảng tối thiểu (giây) giữa hai lần đồng bộ cùng một ngày chưa đóng.
+SENSOR_STORE_SYNC_INTERVAL = float(os.environ.get('API_SENSOR_STORE_SYNC_INTERVAL', '5'))
+# Token đã được backend chấp nhận trong khoảng này (giây) thì đọc đĩa không cần hỏi lại.
+SENSOR_STORE_VERIFY_TTL = float(os.environ.get('API_SENSOR_STORE_VERIFY_TTL', '600'))
+
+_COLUMNS = ', '.join(NUMERIC_COLUMNS)
+_FRAME_FIELDS = f'ts, ma_may_bom, naive, {_COLUMNS}'
+_DAY_NS = 86_400 * 10 ** 9
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS readings (
+    scope TEXT NOT NULL,
+    ma_may_bom TEXT NOT NULL,
+    ts INTEGER NOT NULL,
+    row_id TEXT NOT NULL,
+    day TEXT NOT NULL,
+    naive INTEGER NOT NULL,
+    {', '.join(f'{c} REAL' for c in NUMERIC_COLUMNS)},
+    raw TEXT NOT NULL,
+    PRIMARY KEY (scope, ma_may_bom, ts, row_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS readings_by_day ON readings (scope, day, ma_may_bom, ts);
+CREATE TABLE IF NOT EXISTS days (
+    scope TEXT NOT NULL,
+    ma_may_bom TEXT NOT NULL,
+    day TEXT NOT NULL,
+    closed INTEGER NOT NULL,
+    mark INTEGER NOT NULL,
+    rows INTEGER NOT NULL,
+    synced_at REAL NOT NULL,
+    PRIMARY KEY (scope, ma_may_bom, day)
+) WITHOUT ROWID;
+"""
+
+# _fetch_newer không theo kịp / backend không trả mới nhất trước: tải lại cả ngày.
+_RELOAD = object()
+
+
+def _day_bounds(day: str) -> Tuple[int, int]:
+    start = datetime.combine(date.fromisoformat(day), datetime.min.time(), tzinfo=ZoneInfo(LOCAL_TZ))
+    return int(pd.Timestamp(start).value), int(pd.Timestamp(start + timedelta(days=1)).value)
+
+
+def _rows_of(response: Any) -> List[Dict[str, Any]]:
+    rows = response.get('data') if isinstance(response, dict) else response
+    if not isinstance(rows, list):
+        return []
+    return [r for r in rows if isinstance(r, dict)]
+
+
+def _pump_value(key: str) -> Any:
+    return int(key) if key.isdigit() else key
+
+
+class SensorStore:
+    """Kho SQLite cục bộ cho /du-lieu-cam-bien, dùng như cache đọc xuyên theo ngày.
+
+    Ngày đã đóng (day_cache.is_closed_day) được tải trọn một lần rồi đọc từ đĩa,
+    kể cả sau khi khởi động lại. Ngày chưa đóng chỉ tải các dòng mới hơn mốc
+    (high-water mark) đã lưu. Dữ liệu được tách theo người dùng trong JWT; một
+    token chỉ được đọc đĩa sau khi backend đã chấp nhận nó cho máy bơm đó.
+    """
+
+    def __init__(self, path: Optional[str] = SENSOR_STORE_PATH):
+        self.path = path or None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._key_locks: Dict[Hashable, threading.Lock] = {}
+        self._synced: Dict[Tuple[str, str, str], float] = {}
+        self._verified: Dict[Tuple[str, str], float] = {}
+        self._ready = False
+        self.disk = 0
+        self.syncs = 0
+        self.loads = 0
+        self.probes = 0
+        self.rows_written = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.path is not None
+
+    def _connect(self) -> Optional[sqlite3.Connection]:
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None or not self.enabled:
+            return conn
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            with self._lock:
+                if not self._ready:
+                    conn.executescript(_SCHEMA)
+                    self._ready = True
+        except (OSError, sqlite3.Error) as e:
+            print(f"Error opening sensor store {self.path}: {e}")
+            self.path = None
+            return None
+        self._local.conn = conn
+        return conn
+
+    def _key_lock(self, key: Hashable) -> threading.Lock:
+        with self._lock:
+            lock = self._key_locks.get(key)
+            if lock is None:
+                lock = self._key_locks[key] = threading.Lock()
+            return lock
+
+    @staticmethod
+    def scope(token: Optional[str]) -> str:
+        return user_scope(token)
+
+    # ---- backend
+
+    def _mark_verified(self, token: Optional[str], pump: str) -> None:
+        with self._lock:
+            self._verified[(caller_identity(token), pump)] = time.monotonic() + SENSOR_STORE_VERIFY_TTL
+
+    def _verify(self, token: Optional[str], pump: str) -> Optional[Any]:
+        """None nếu backend cho token xem `pump` ('' = mọi máy bơm của người dùng), ngược lại là lỗi."""
+        key = (caller_identity(token), pump)
+        with self._key_lock(('verify',) + key):
+            with self._lock:
+                if self._verified.get(key, 0) > time.monotonic():
+                    return None
+            from .sensor_data import get_data_by_pump
+            self.probes += 1
+            response = get_data_by_pump(ma_may_bom=_pump_value(pump) if pump else None, limit=1, token=token)
+            if isinstance(response, dict) and 'error' in response:
+                return response['error']
+            if pump and not _rows_of(response):
+                return 'Không có dữ liệu cảm biến cho máy bơm này'
+            self._mark_verified(token, pump)
+            return None
+
+    def _fetch_day(self, day: str, token: Optional[str], pump: str) -> Tuple[Optional[List[Dict[str, Any]]], Any]:
+        """Mọi dòng của ngày `day` qua /du-lieu-cam-bien/ngay (theo trang): (rows, None) hoặc (None, lỗi)."""
+        from .sensor_data import _fetch_data_by_date
+        rows, offset = [], 0
+        while True:
+            response = _fetch_data_by_date(day, token=token, limit=SENSOR_STORE_PAGE_SIZE, offset=offset,
+                                           ma_may_bom=_pump_value(pump) if pump else None)
+            if isinstance(response, dict) and 'error' in response:
+                return None, response['error']
+            page = _rows_of(response)
+            rows.extend(page)
+            offset += len(page)
+            total = response.get('total') if isinstance(response, dict) else None
+            try:
+                total = int(total) if total is not None else None
+            except (TypeError, ValueError):
+                total = None
+            if not page:
+                return rows, None
+            if total is not None:
+                # Biết tổng số dòng: đọc tiếp tới đủ, kể cả khi backend giới hạn limit nhỏ hơn trang.
+                if offset >= total:
+                    return rows, None
+            elif len(page) != SENSOR_STORE_PAGE_SIZE:
+                # Không có total: backend bỏ qua limit (trả cả ngày) hoặc đã tới trang cuối.
+                return rows, None
+
+    def _fetch_newer(self, token: Optional[str], pump: str, floor: int, day_end: int) -> Any:
+        """Các dòng có thời gian trong [floor, day_end) từ các trang mới nhất; _RELOAD hoặc (None, lỗi) khi không được."""
+        from .sensor_data import get_data_by_pump
+        fresh = []
+        for page in range(SENSOR_STORE_SYNC_MAX_PAGES):
+            response = get_data_by_pump(ma_may_bom=_pump_value(pump) if pump else None,
+                                        limit=SENSOR_STORE_SYNC_PAGE_SIZE,
+                                        offset=page * SENSOR_STORE_SYNC_PAGE_SIZE, token=token)
+            if isinstance(response, dict) and 'error' in response:
+                return None, response['error']
+            rows = _rows_of(response)
+            if not rows:
+                return fresh, None
+            ts = decode_sensor_rows(rows).timestamps
+            valid = ts[ts != NAT]
+            if valid.size >= 2 and valid[0] < valid[-1]:
+                return _RELOAD
+            fresh.extend(row for row, t in zip(rows, ts) if floor <= t < day_end)
+            if (valid.size and valid[-1] < floor) or len(rows) < SENSOR_STORE_SYNC_PAGE_SIZE:
+                return fresh, None
+        return _RELOAD
+
+    # ---- SQLite
+
+    def _record(self, conn: sqlite3.Connection, scope: str, pump: str, day: str) -> Optional[Tuple[int, int]]:
+        """(closed, mark) của ngày; ngày đã tải trọn cho mọi máy bơm cũng dùng được cho từng máy bơm."""
+        keys = (pump, '') if pump else ('',)
+        best = None
+        for key in keys:
+            found = conn.execute('SELECT closed, mark FROM days WHERE scope = ? AND ma_may_bom = ? AND day = ?',
+                                 (scope, key, day)).fetchone()
+            if found is not None and (best is None or found[0] > best[0]):
+                best = found
+        return best
+
+    def _write(self, conn: sqlite3.Connection, scope: str, pump: str, day: str, rows: List[Dict[str, Any]],
+               closed: bool, mark: int, replace: bool) -> int:
+        """Ghi `rows` (và trạng thái ngày) trong một transaction; `replace` xoá dữ liệu cũ của ngày trước."""
+        frame = decode_sensor_rows(rows)
+        ts = frame.timestamps
+        valid = np.flatnonzero(ts != NAT)
+        days = pd.to_datetime(ts[valid], unit='ns', utc=True).tz_convert(LOCAL_TZ).strftime('%Y-%m-%d') \
+            if not replace else [day] * len(valid)
+        # Thời gian không có múi giờ được lưu theo LOCAL_TZ; đánh dấu để đọc lại theo naive_tz khác.
+        naive = ~pd.Series([rows[i].get(frame.time_key) for i in valid], dtype='object').astype('string') \
+            .str.strip().str.contains(_TZ_SUFFIX, regex=True).fillna(False).to_numpy(dtype=bool)
+        columns = [np.where(np.isfinite(frame.values[c]), frame.values[c].astype(np.float64), np.nan) for c in NUMERIC_COLUMNS]
+        records = []
+        for position, i in enumerate(valid):
+            row = rows[i]
+            row_id = row.get('ma_du_lieu', row.get('id'))
+            records.append((
+                scope, str(row.get('ma_may_bom')), int(ts[i]), '' if row_id is None else str(row_id), days[position],
+                int(naive[position]), *(None if np.isnan(col[i]) else float(col[i]) for col in columns),
+                json.dumps(row, ensure_ascii=False, separators=(',', ':')),
+            ))
+        if len(valid):
+            mark = max(mark, int(ts[valid].max()))
+        placeholders = ', '.join('?' * (7 + len(NUMERIC_COLUMNS)))
+        with self._write_lock, conn:
+            if replace:
+                if pump:
+                    conn.execute('DELETE FROM readings WHERE scope = ? AND day = ? AND ma_may_bom = ?', (scope, day, pump))
+                else:
+                    conn.execute('DELETE FROM readings WHERE scope = ? AND day = ?', (scope, day))
+            conn.executemany(
+                f'INSERT OR REPLACE INTO readings (scope, ma_may_bom, ts, row_id, day, naive, {_COLUMNS}, raw) '
+                f'VALUES ({placeholders})', records)
+            count = conn.execute('SELECT COUNT(*) FROM readings WHERE scope = ? AND day = ?' + (' AND ma_may_bom = ?' if pump else ''),
+                                 (scope, day, pump) if pump else (scope, day)).fetchone()[0]
+            conn.execute('INSERT OR REPLACE INTO days (scope, ma_may_bom, day, closed, mark, rows, synced_at) '
+                         'VALUES (?, ?, ?, ?, ?, ?, ?)', (scope, pump, day, int(closed), mark, count, time.time()))
+        self.rows_written += len(records)
+        return len(records)
+
+    def _ensure_day(self, conn: sqlite3.Connection, scope: str, day: str, token: Optional[str], pump: str) -> Optional[Any]:
+        """Đảm bảo ngày `day` có trên đĩa và đủ mới; trả về lỗi nếu không tải được."""
+        key = (scope, pump, day)
+        with self._key_lock(key):
+            closed = is_closed_day(day)
+            record = self._record(conn, scope, pump, day)
+            if record is not None:
+                recent = time.monotonic() - self._synced.get(key, float('-inf')) < SENSOR_STORE_SYNC_INTERVAL
+                if record[0] or recent:
+                    self.disk += 1
+                    return self._verify(token, pump)
+                if not closed:
+                    day_start, day_end = _day_bounds(day)
+                    fetched = self._fetch_newer(token, pump, max(record[1], day_start - 1), day_end)
+                    if fetched is not _RELOAD:
+                        rows, error = fetched
+                        if error is not None:
+                            return error
+                        self._write(conn, scope, pump, day, rows, False, record[1], replace=False)
+                        self._mark_verified(token, pump)
+                        self._synced[key] = time.monotonic()
+                        self.syncs += 1
+                        return None
+
+            # Ngày chưa có, vừa đóng hoặc không đồng bộ tăng dần được: tải trọn ngày.
+            rows, error = self._fetch_day(day, token, pump)
+            if error is not None:
+                return error
+            self._write(conn, scope, pump, day, rows, closed, NAT, replace=True)
+            self._mark_verified(token, pump)
+            self._synced[key] = time.monotonic()
+            self.loads += 1
+            return None
+
+    def _query(self, fields: str, scope: str, first: str, last: str, pump: str, limit: Optional[int],
+               offset: Optional[int] = None, per_day: bool = False) -> Tuple[List[tuple], int]:
+        """Các dòng của các ngày [first, last] theo thời gian tăng dần và tổng số dòng.
+
+        Có `pump`: tra theo khoá chính (ma_may_bom, ts) trong khoảng thời gian của các ngày;
+        `per_day`: `limit` áp dụng cho từng ngày như khi gọi /du-lieu-cam-bien/ngay từng ngày.
+        """
+        conn = self._connect()
+        if pump:
+            # Nới một ngày mỗi phía: ngày do backend xếp có thể lệch với giờ địa phương.
+            lo, hi = _day_bounds(first)[0] - _DAY_NS, _day_bounds(last)[1] + _DAY_NS
+            where, params = 'scope = ? AND ma_may_bom = ? AND ts >= ? AND ts < ? AND day BETWEEN ? AND ?', \
+                (scope, pump, lo, hi, first, last)
+        else:
+            where, params = 'scope = ? AND day BETWEEN ? AND ?', (scope, first, last)
+        if per_day and limit is not None:
+            rows = conn.execute(
+                f'SELECT {fields} FROM (SELECT *, ROW_NUMBER() OVER (PARTITION BY day ORDER BY ts, row_id) AS n '
+                f'FROM readings WHERE {where}) WHERE n <= ? ORDER BY ts, row_id', (*params, int(limit))).fetchall()
+            return rows, len(rows)
+        rows = conn.execute(f'SELECT {fields} FROM readings WHERE {where} ORDER BY ts, row_id LIMIT ? OFFSET ?',
+                            (*params, -1 if limit is None else int(limit), int(offset or 0))).fetchall()
+        if limit is None and not offset:
+            return rows, len(rows)
+        return rows, conn.execute(f'SELECT COUNT(*) FROM readings WHERE {where}', params).fetchone()[0]
+
+    def _prepare(self, day: str, token: Optional[str], ma_may_bom: Any) -> Tuple[Optional[str], str, Optional[Any]]:
+        conn = self._connect()
+        if conn is None:
+            return None, '', 'Kho dữ liệu cảm biến không khả dụng'
+        scope, pump = self.scope(token), '' if ma_may_bom is None else str(ma_may_bom)
+        try:
+            return scope, pump, self._ensure_day(conn, scope, str(day)[:10], token, pump)
+        except (sqlite3.Error, ValueError) as e:
+            print(f"Error syncing sensor store for {day}: {e}")
+            return None, pump, str(e)
+
+    @staticmethod
+    def _frame(rows: List[tuple], meta: Dict[str, Any], naive_tz: str) -> SensorFrame:
+        if not rows:
+            return SensorFrame.empty_frame(meta)
+        timestamps = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+        naive = np.fromiter((r[2] for r in rows), dtype=bool, count=len(rows))
+        if naive_tz != LOCAL_TZ and naive.any():
+            wall = pd.to_datetime(timestamps[naive], unit='ns', utc=True).tz_convert(LOCAL_TZ).tz_localize(None)
+            timestamps[naive] = wall.tz_localize(naive_tz, ambiguous='NaT', nonexistent='NaT').asi8
+        matrix = np.array([r[3:] for r in rows], dtype=np.float64).astype(np.float32)
+        values = {name: np.ascontiguousarray(matrix[:, i]) for i, name in enumerate(NUMERIC_COLUMNS)}
+        pumps = pd.Categorical([r[1] for r in rows])
+        pumps = pumps.rename_categories([_pump_value(c) for c in pumps.categories])
+        return SensorFrame(timestamps, values, pumps, meta)
+
+    # ---- đọc
+
+    def day_rows(self, day: str, token: Optional[str] = None, ma_may_bom: Any = None,
+                 limit: Optional[int] = None, offset: Optional[int] = None) -> Dict[str, Any]:
+        """Như get_data_by_date: {'data': [...], 'total', 'limit', 'offset'}, sắp xếp theo thời gian."""
+        scope, pump, error = self._prepare(day, token, ma_may_bom)
+        if error is not None:
+            return {'data': [], 'error': error}
+        day = str(day)[:10]
+        try:
+            rows, total = self._query('raw', scope, day, day, pump, limit, offset)
+        except sqlite3.Error as e:
+            return {'data': [], 'error': str(e)}
+        return {'data': [json.loads(r[0]) for r in rows], 'total': total, 'limit': limit, 'offset': offset}
+
+    def day_frame(self, day: str, token: Optional[str] = None, ma_may_bom: Any = None, limit: Optional[int] = None,
+                  offset: Optional[int] = None, naive_tz: str = LOCAL_TZ) -> SensorFrame:
+        """Như get_frame_by_date, đọc thẳng các cột số từ SQLite (không qua JSON)."""
+        scope, pump, error = self._prepare(day, token, ma_may_bom)
+        if error is not None:
+            return SensorFrame.empty_frame({'error': error})
+        day = str(day)[:10]
+        try:
+            rows, total = self._query(_FRAME_FIELDS, scope, day, day, pump, limit, offset)
+        except sqlite3.Error as e:
+            return SensorFrame.empty_frame({'error': str(e)})
+        return self._frame(rows, {'total': total, 'limit': limit, 'offset': offset}, naive_tz)
+
+    def range_frame(self, days: Sequence[str], token: Optional[str] = None, ma_may_bom: Any = None,
+                    limit: Optional[int] = None, deadline: Optional[float] = None,
+                    naive_tz: str = LOCAL_TZ) -> Tuple[SensorFrame, List[str]]:
+        """SensorFrame của các ngày liên tiếp `days` (mỗi ngày tối đa `limit` dòng) và các ngày lỗi.
+
+        Các ngày thiếu/chưa đóng được đồng bộ song song (daterange.map_days), sau đó
+        cả khoảng được đọc bằng một truy vấn.
+        """
+        from .daterange import map_days
+        results, missing = map_days(lambda day: self._prepare(day, token, ma_may_bom), list(days), deadline)
+        missing.extend(day for day, (_, _, error) in results.items() if error is not None)
+        ok = sorted(day for day, (scope, _, error) in results.items() if error is None and scope is not None)
+        if not ok:
+            return SensorFrame.empty_frame(), missing
+        scope, pump = self.scope(token), '' if ma_may_bom is None else str(ma_may_bom)
+        try:
+            rows, _ = self._query(f'{_FRAME_FIELDS}, day', scope, ok[0], ok[-1], pump, limit, per_day=True)
+        except sqlite3.Error as e:
+            print(f"Error reading sensor store: {e}")
+            return SensorFrame.empty_frame(), list(days)
+        if missing:
+            # Ngày lỗi nằm giữa khoảng: bỏ dữ liệu cũ trên đĩa của ngày đó như khi tải thẳng từ backend.
+            allowed = set(ok)
+            rows = [r for r in rows if r[-1] in allowed]
+        frame = self._frame([r[:-1] for r in rows], {}, naive_tz)
+        # Đổi múi giờ chỉ dịch các dòng không có múi giờ: sắp xếp lại nếu có lẫn hai loại.
+        return (frame.sort_by_time() if naive_tz != LOCAL_TZ else frame), missing
+
+    def clear(self) -> None:
+        conn = self._connect()
+        if conn is None:
+            return
+        with self._write_lock, conn:
+            conn.execute('DELETE FROM readings')
+            conn.execute('DELETE FROM days')
+        with self._lock:
+            self._synced.clear()
+            self._verified.clear()
+
+    def stats(self) -> Dict[str, int]:
+        closed = 0
+        conn = self._connect()
+        if conn is not None:
+            try:
+                closed = conn.execute('SELECT COUNT(*) FROM days WHERE closed = 1').fetchone()[0]
+            except sqlite3.Error:
+                pass
+        return {'closed_days': int(closed), 'disk': self.disk, 'syncs': self.syncs, 'loads': self.loads,
+                'probes': self.probes, 'rows_written': self.rows_written}
+
+
+sensor_store = SensorStore()
+
+
+def _collect_metrics() -> List[str]:
+    if not sensor_store.enabled:
+        return []
+    stats = sensor_store.stats()
+    lines = metrics.sample_lines('api_sensor_store_closed_days', 'Số ngày dữ liệu cảm biến đã lưu trọn trên đĩa.',
+                                 [({}, stats['closed_days'])])
+    lines += metrics.sample_lines('api_sensor_store_reads_total', 'Số lần đọc ngày từ kho cục bộ theo cách lấy dữ liệu.', [
+        ({'result': 'disk'}, stats['disk']),
+        ({'result': 'sync'}, stats['syncs']),
+        ({'result': 'load'}, stats['loads']),
+    ], kind='counter')
+    lines += metrics.sample_lines('api_sensor_store_rows_written_total', 'Số dòng cảm biến đã ghi vào kho cục bộ.',
+                                  [({}, stats['rows_written'])], kind='counter')
+    return lines
+
+
+metrics.registry.add_collector(_collect_metrics)
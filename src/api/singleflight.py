@@ -0,0 +1,63 @@
+from typing import Any, Callable, Dict, Hashable, Optional
+import threading
+
+
+class WaitTimeout(TimeoutError):
+    """Hết thời gian chờ kết quả của lời gọi đang chạy ở luồng khác."""
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Gộp các lời gọi đồng thời có cùng khoá thành một lời gọi duy nhất.
+
+    Luồng đầu tiên thực thi `fn`; các luồng đến sau trong lúc lời gọi đang chạy
+    chờ và nhận cùng kết quả (hoặc cùng exception).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self.shared = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any], wait_timeout: Optional[float] = None) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.shared += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                leader = True
+
+        if not leader:
+            if not call.done.wait(wait_timeout):
+                raise WaitTimeout(f'Timed out waiting for shared call {key!r}')
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+        return call.result
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
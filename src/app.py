@@ -3,10 +3,14 @@ from dash import html, dcc, Input, Output, State
 import dash_bootstrap_components as dbc
 from flask import session
 import os
-from pages import home, login, register, account, settings, pump_detail, sensor_data, documentation, predict_data, devices
+import uuid
+from pages import home, login, register, account, settings, pump_detail, sensor_data, documentation, predict_data, predict_fleet, devices
 from pages.admin import admin, admin_models, admin_users, admin_devices, admin_sensor_types
 from components.navbar import create_navbar
 from components.footer import create_footer
+from api.resilience import install_budget
+from api.metrics import install as install_metrics
+from api.events import PUSH_ENABLED, install as install_events
 
 app = dash.Dash(
     __name__,
@@ -24,19 +28,32 @@ app = dash.Dash(
 
 server = app.server
 server.config['SECRET_KEY'] = os.urandom(24)
-
-app.layout = html.Div([
-    dcc.Location(id='url', refresh=False),
-    dcc.Store(id='session-store', storage_type='session'),
-    dcc.Store(id='pump-detail-store', storage_type='memory'),
-    dcc.Store(id='selected-pump-store', data={'ma_may_bom': None, 'ten_may_bom': None}),
-    dcc.Store(id='pump-control-last-action', storage_type='memory', data={'mode': None, 'trang_thai': None}),
-    dcc.Interval(id='initial-pump-select', interval=500, max_intervals=1, n_intervals=0),
-    dcc.Interval(id='token-check-interval', interval=30*1000, n_intervals=0),
-    html.Div(id='page-content'),
-    html.Div(id='app-footer', children=create_footer()),
-    html.Div(id='pump-control-result', style={'display': 'none'})
-])
+install_budget(server)
+install_metrics(server)
+install_events(server)
+
+# Nút ẩn do assets/live_updates.js bấm khi nhận sự kiện SSE từ /events.
+LIVE_SIGNALS = ['live-sensor-signal', 'live-pump-signal', 'live-notification-signal', 'live-token-signal']
+
+def serve_layout():
+    """Layout gốc, tạo lại mỗi lần tải trang để 'client-tab' mang id riêng của tab (api.output_diff)."""
+    return html.Div([
+        dcc.Store(id='client-tab', data=uuid.uuid4().hex),
+        dcc.Location(id='url', refresh=False),
+        dcc.Store(id='session-store', storage_type='session'),
+        dcc.Store(id='pump-detail-store', storage_type='memory'),
+        dcc.Store(id='selected-pump-store', data={'ma_may_bom': None, 'ten_may_bom': None}),
+        dcc.Store(id='pump-control-last-action', storage_type='memory', data={'mode': None, 'trang_thai': None}),
+        dcc.Interval(id='initial-pump-select', interval=500, max_intervals=1, n_intervals=0),
+        dcc.Interval(id='token-check-interval', interval=30*1000, n_intervals=0, disabled=PUSH_ENABLED),
+        html.Div([html.Button(id=signal, n_clicks=0) for signal in LIVE_SIGNALS], style={'display': 'none'}),
+        html.Div(id='page-content'),
+        html.Div(id='app-footer', children=create_footer()),
+        html.Div(id='pump-control-result', style={'display': 'none'})
+    ])
+
+
+app.layout = serve_layout
 
 @app.callback(
     Output('page-content', 'children'),
@@ -81,6 +98,11 @@ def display_page(pathname, session_data):
             page = predict_data.layout
         else:
             page = login.layout
+    elif pathname == '/predict_fleet':
+        if is_authenticated and is_admin == False:
+            page = predict_fleet.layout
+        else:
+            page = login.layout
     elif pathname == '/documentation':
         page = documentation.layout
     elif pathname == '/admin':
@@ -133,11 +155,11 @@ def toggle_footer(pathname):
 
 @app.callback(
     [Output('session-store', 'data', allow_duplicate=True), Output('url', 'pathname', allow_duplicate=True)],
-    Input('token-check-interval', 'n_intervals'),
+    [Input('token-check-interval', 'n_intervals'), Input('live-token-signal', 'n_clicks')],
     State('session-store', 'data'),
     prevent_initial_call='initial_duplicate'
 )
-def check_token_expiry(n_intervals, session_data):
+def check_token_expiry(n_intervals, live_signal, session_data):
     from api.auth import is_token_expired
 
     if not session_data or not isinstance(session_data, dict):
@@ -0,0 +1,16 @@
+// Tự bấm nút "Tải thêm" khi vùng lịch sử máy bơm được cuộn gần tới cuối.
+document.addEventListener(
+  "scroll",
+  function (e) {
+    const box = e.target;
+    if (!box || !box.classList || !box.classList.contains("history-scroll")) return;
+    if (box.scrollTop + box.clientHeight < box.scrollHeight - 80) return;
+    const button = box.querySelector(".history-load-more");
+    if (!button || button.offsetParent === null) return;
+    // Chờ nội dung mới được thêm (scrollHeight đổi) rồi mới bấm tiếp.
+    if (box.dataset.loadingHeight === String(box.scrollHeight)) return;
+    box.dataset.loadingHeight = String(box.scrollHeight);
+    button.click();
+  },
+  true
+);
@@ -0,0 +1,124 @@
+// Nhận sự kiện SSE từ /events (api/events.py) và bấm các nút ẩn live-*-signal
+// để Dash chạy lại đúng callback cần thiết, thay cho các dcc.Interval.
+(function () {
+  const SIGNALS = {
+    sensor: "live-sensor-signal",
+    pump: "live-pump-signal",
+    notification: "live-notification-signal",
+  };
+  // Khi không giữ được kết nối SSE (ví dụ server không hỗ trợ luồng), quay lại poll theo chu kỳ cũ.
+  const FALLBACK_MS = { sensor: 5000, pump: 5000, notification: 10000 };
+  const FALLBACK_AFTER_MS = 15000;
+
+  let token = null;
+  let source = null;
+  let connected = false;
+  let fallbackTimers = [];
+  let fallbackWatchdog = null;
+  let expiryTimer = null;
+  const pending = {};
+
+  function click(id) {
+    if (pending[id]) return;
+    pending[id] = setTimeout(function () {
+      delete pending[id];
+      const button = document.getElementById(id);
+      if (button) button.click();
+    }, 250);
+  }
+
+  function readToken() {
+    try {
+      const data = JSON.parse(window.sessionStorage.getItem("session-store") || "null");
+      return data && data.token ? data.token : null;
+    } catch (e) {
+      return null;
+    }
+  }
+
+  function tokenExpiry(value) {
+    try {
+      const payload = value.split(".")[1].replace(/-/g, "+").replace(/_/g, "/");
+      const claims = JSON.parse(atob(payload + "===".slice((payload.length + 3) % 4)));
+      return claims.exp ? claims.exp * 1000 : null;
+    } catch (e) {
+      return null;
+    }
+  }
+
+  function scheduleExpiry(value) {
+    clearTimeout(expiryTimer);
+    const exp = value ? tokenExpiry(value) : null;
+    if (!exp) return;
+    // setTimeout giới hạn ~24.8 ngày; token dài hơn thì kiểm tra lại sau mỗi ngày.
+    const delay = Math.min(Math.max(exp - Date.now() + 1000, 0), 86400000);
+    expiryTimer = setTimeout(function () {
+      click("live-token-signal");
+      scheduleExpiry(token);
+    }, delay);
+  }
+
+  function stopFallback() {
+    fallbackTimers.forEach(clearInterval);
+    fallbackTimers = [];
+  }
+
+  function startFallback() {
+    if (fallbackTimers.length || !token) return;
+    Object.keys(SIGNALS).forEach(function (channel) {
+      fallbackTimers.push(setInterval(function () { click(SIGNALS[channel]); }, FALLBACK_MS[channel]));
+    });
+  }
+
+  function disconnect() {
+    if (source) source.close();
+    source = null;
+    connected = false;
+    clearTimeout(fallbackWatchdog);
+    stopFallback();
+  }
+
+  function connect() {
+    disconnect();
+    scheduleExpiry(token);
+    if (!token) return;
+    fetch("/events/session", {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      credentials: "same-origin",
+      body: JSON.stringify({ token: token }),
+    }).then(function (resp) {
+      // 404: server tắt kênh đẩy (API_PUSH=0), các dcc.Interval vẫn đang chạy.
+      if (!resp.ok) return;
+      source = new EventSource("/events");
+      source.addEventListener("hello", function () {
+        connected = true;
+        clearTimeout(fallbackWatchdog);
+        stopFallback();
+        // Bù các thay đổi có thể đã lỡ khi mất kết nối.
+        Object.values(SIGNALS).forEach(click);
+      });
+      Object.keys(SIGNALS).forEach(function (channel) {
+        source.addEventListener(channel, function () { click(SIGNALS[channel]); });
+      });
+      source.onerror = function () {
+        if (!connected) return;
+        connected = false;
+        fallbackWatchdog = setTimeout(function () { if (!connected) startFallback(); }, FALLBACK_AFTER_MS);
+      };
+      fallbackWatchdog = setTimeout(function () { if (!connected) startFallback(); }, FALLBACK_AFTER_MS);
+    }).catch(function (e) {
+      console.log("Live updates unavailable", e);
+      startFallback();
+    });
+  }
+
+  // dcc.Store ghi sessionStorage trong cùng tab nên không có sự kiện "storage"; kiểm tra mỗi giây.
+  setInterval(function () {
+    const current = readToken();
+    if (current !== token) {
+      token = current;
+      connect();
+    }
+  }, 1000);
+})();
@@ -1,6 +1,7 @@
 import dash_bootstrap_components as dbc
 from dash import html, dcc, callback, Input, Output, State
 import dash
+from api.events import PUSH_ENABLED
 
 
 def create_navbar(is_authenticated=False, is_admin=False, current_path: str = None):
@@ -24,6 +25,7 @@ def create_navbar(is_authenticated=False, is_admin=False, current_path: str = No
                 dbc.NavItem(dbc.NavLink("Trang chủ", href="/", className="nav-link-custom", active=is_active('/'))),
                 dbc.NavItem(dbc.NavLink("Thiết bị", href="/devices", className="nav-link-custom", active=is_active('/devices'))),
                 dbc.NavItem(dbc.NavLink("Dự đoán", href="/predict_data", className="nav-link-custom", active=is_active('/predict_data'))),
+                dbc.NavItem(dbc.NavLink("Dự báo tổng", href="/predict_fleet", className="nav-link-custom", active=is_active('/predict_fleet'))),
             ]
 
         # Notification button
@@ -206,7 +208,7 @@ def create_navbar(is_authenticated=False, is_admin=False, current_path: str = No
                 html.Div(id='notifications-list')
             ])
         ], style={'maxHeight': '670px', 'overflowY': 'auto', 'padding': '1rem'}),
-        dcc.Interval(id='notifications-refresh-interval', interval=10*1000, n_intervals=0),
+        dcc.Interval(id='notifications-refresh-interval', interval=10*1000, n_intervals=0, disabled=PUSH_ENABLED),
         dcc.Store(id='notifications-store', data={'data': [], 'total': 0})
     ], id='notifications-offcanvas', is_open=False, placement='end', backdrop=True, scrollable=True, style={'width': '400px'})
 
@@ -303,11 +305,12 @@ def toggle_notifications_panel(n_clicks, is_open):
      Output('notification-badge', 'children'),
      Output('notification-badge', 'style')],
     [Input('notifications-refresh-interval', 'n_intervals'),
+     Input('live-notification-signal', 'n_clicks'),
      Input('notifications-offcanvas', 'is_open')],
     State('session-store', 'data'),
     prevent_initial_call=False
 )
-def update_notifications(n_intervals, is_open, session_data):
+def update_notifications(n_intervals, live_signal, is_open, session_data):
     from api.notification import get_notifications, get_unread_count
     
     token = None
@@ -0,0 +1,181 @@
+from datetime import datetime, timedelta
+from dash import html, dcc, Patch
+import dash_bootstrap_components as dbc
+from api.daterange import iter_days, map_days
+from api.day_cache import local_now
+from api.memory_pump import get_pump_memory_logs, log_sort_key
+
+# Số lần bật/tắt tối đa render mỗi lần tải; ngày nhiều hơn được chia qua nhiều lần.
+HISTORY_PAGE_LOGS = 40
+# Số ngày tải song song mỗi đợt khi tìm đủ dữ liệu cho một trang.
+HISTORY_DAY_BATCH = 3
+
+DAY_OF_WEEK = ['Thứ Hai', 'Thứ Ba', 'Thứ Tư', 'Thứ Năm', 'Thứ Sáu', 'Thứ Bảy', 'Chủ Nhật']
+HIDDEN = {'display': 'none'}
+VISIBLE = {'display': 'block', 'margin': '12px auto 4px auto'}
+
+
+def format_time_with_seconds(time_str):
+    """Format time string to HH:MM:SS format in Asia/Bangkok timezone."""
+    if not time_str:
+        return "N/A"
+    try:
+        from datetime import timezone as tz_module
+        dt = datetime.fromisoformat(time_str.replace('Z', '+00:00'))
+        target_tz = tz_module(timedelta(hours=7))
+        dt_local = dt.astimezone(target_tz)
+        return dt_local.strftime('%H:%M:%S')
+    except:
+        return time_str
+
+
+def calculate_duration(start_time, end_time):
+    """Calculate duration between two timestamps and return formatted string."""
+    if not start_time or not end_time:
+        return "N/A"
+    try:
+        start_dt = datetime.fromisoformat(start_time.replace('Z', '+00:00'))
+        end_dt = datetime.fromisoformat(end_time.replace('Z', '+00:00'))
+        total_seconds = int((end_dt - start_dt).total_seconds())
+        hours = total_seconds // 3600
+        minutes = (total_seconds % 3600) // 60
+        seconds = total_seconds % 60
+        if hours > 0:
+            return f"{hours}h {minutes}m {seconds}s"
+        elif minutes > 0:
+            return f"{minutes}m {seconds}s"
+        else:
+            return f"{seconds}s"
+    except Exception as e:
+        print(f"Error calculating duration: {e}")
+        return "N/A"
+
+
+def format_history_date(date_key):
+    try:
+        date_obj = datetime.strptime(date_key, '%Y-%m-%d')
+        return f"{DAY_OF_WEEK[date_obj.weekday()]}, {date_obj.strftime('%d/%m/%Y')}"
+    except Exception:
+        return date_key
+
+
+def create_log_item(log, number):
+    return html.Div([
+        html.Div([
+            html.Span(f"Lần {number}: ", style={'font-weight': '600', 'color': '#333'}),
+            html.Span(' Bắt đầu:  ', style={'color': '#666'}),
+            html.Span(
+                format_time_with_seconds(log.get('thoi_gian_bat', '')),
+                style={'color': '#28a745', 'font-weight': '500'}
+            ),
+            html.Span(' - Kết thúc: ', style={'color': '#666', 'margin': '0 4px'}),
+            html.Span(
+                format_time_with_seconds(log.get('thoi_gian_tat', '')) if log.get('thoi_gian_tat') else '(Chưa tắt)',
+                style={'color': '#dc3545', 'font-weight': '500'}
+            ),
+        ], style={'display': 'flex', 'align-items': 'center', 'flex-wrap': 'wrap'}),
+        html.Div([
+            html.Span(' Tổng thời gian: ', style={'color': '#666', 'font-size': '0.85rem'}),
+            html.Span(
+                calculate_duration(log.get('thoi_gian_bat', ''), log.get('thoi_gian_tat', '')),
+                style={'color': '#007bff', 'font-weight': '500', 'font-size': '0.85rem'}
+            ),
+        ], style={'display': 'flex', 'align-items': 'center', 'margin-top': '4px'})
+    ], style={'padding': '10px 0', 'border-bottom': '1px solid #f0f0f0'})
+
+
+def create_day_group(date_key, logs, total, start, continued=False):
+    """Nhóm một ngày; `logs` là đoạn [start, start + len(logs)) của `total` lần trong ngày (mới nhất trước)."""
+    title = format_history_date(date_key) + (' (tiếp)' if continued else '')
+    return html.Div([
+        html.Div([
+            html.Span(title, style={
+                'font-weight': '600',
+                'color': '#333',
+                'font-size': '0.95rem',
+                'padding': '8px 0',
+                'border-bottom': '2px solid #e9ecef',
+                'width': '100%'
+            })
+        ], style={'margin': '15px 0 10px 0'}),
+        html.Div([create_log_item(log, total - (start + idx)) for idx, log in enumerate(logs)])
+    ])
+
+
+def create_history_body(prefix):
+    """Vùng cuộn của modal lịch sử: danh sách `{prefix}-content`, nút tải thêm và store con trỏ.
+
+    assets/history_scroll.js bấm nút tải thêm khi người dùng cuộn gần cuối.
+    """
+    return html.Div([
+        html.Div(id=f'{prefix}-content', children=[
+            html.P("Đang tải...", className="text-muted text-center")
+        ]),
+        dbc.Button("Tải thêm", id=f'{prefix}-load-more', color='light', size='sm',
+                   className='history-load-more', style=HIDDEN),
+        dcc.Store(id=f'{prefix}-cursor', data=None),
+    ], className='history-scroll', style={
+        'max-height': '600px',
+        'overflow-y': 'auto',
+        'padding-right': '10px'
+    })
+
+
+def _log_position(log):
+    """Vị trí của một lần bật/tắt trong ngày: (thời gian, mã nhật ký), so sánh được và lưu được trong store."""
+    return [log_sort_key(log), str(log.get('ma_nhat_ky') or '')]
+
+
+def load_history_page(pump_id, token, cursor, page_logs=HISTORY_PAGE_LOGS):
+    """Render trang kế tiếp của lịch sử từ `cursor`.
+
+    cursor = {'pump', 'days' (mới nhất trước), 'day' (chỉ số ngày), 'after' (vị trí của lần cuối đã
+    hiển thị trong ngày, hoặc None)}. Trang sau chỉ lấy các lần cũ hơn 'after', nên lần bật/tắt mới
+    của hôm nay không làm lặp hay lệch danh sách.
+    Trả về (các nhóm ngày, cursor mới hoặc None khi đã hết ngày).
+    """
+    days = cursor['days']
+    day_index, after = cursor.get('day', 0), cursor.get('after')
+    groups, rendered = [], 0
+    while day_index < len(days) and rendered < page_logs:
+        batch = days[day_index:day_index + HISTORY_DAY_BATCH]
+        results, _ = map_days(
+            lambda ngay: get_pump_memory_logs(pump_id, token=token, limit=100, offset=0, date=ngay), batch)
+        for day in batch:
+            response = results.get(day) or {}
+            logs = response.get('data') if isinstance(response, dict) else None
+            logs = sorted(logs, key=_log_position, reverse=True) if isinstance(logs, list) else []
+            start = sum(1 for log in logs if _log_position(log) >= after) if after else 0
+            chunk = logs[start:start + page_logs - rendered]
+            if chunk:
+                # Số thứ tự đếm từ lần cũ nhất nên không đổi khi có lần mới.
+                groups.append(create_day_group(day, chunk, len(logs), start, continued=after is not None))
+                rendered += len(chunk)
+            if start + len(chunk) < len(logs):
+                after = _log_position(chunk[-1]) if chunk else after
+                break
+            day_index, after = day_index + 1, None
+            if rendered >= page_logs:
+                break
+    next_cursor = dict(cursor, day=day_index, after=after) if day_index < len(days) else None
+    return groups, next_cursor
+
+
+def update_history_modal(load_more, pump_id, token, span_days, cursor, empty_message):
+    """Kết quả (content, cursor, style nút tải thêm) cho callback modal lịch sử.
+
+    Khi mở modal: render trang đầu (ngày mới nhất). Khi bấm/cuộn tải thêm: chỉ gửi
+    các nhóm ngày mới, nối vào danh sách bằng Patch.
+    """
+    if load_more and isinstance(cursor, dict) and str(cursor.get('pump')) == str(pump_id):
+        groups, next_cursor = load_history_page(pump_id, token, cursor)
+        patched = Patch()
+        patched.extend(groups)
+        return patched, next_cursor, VISIBLE if next_cursor else HIDDEN
+
+    now = local_now()
+    cursor = {'pump': pump_id, 'days': iter_days(now - timedelta(days=span_days - 1), now), 'day': 0, 'after': None}
+    groups, next_cursor = load_history_page(pump_id, token, cursor)
+    if not groups:
+        return [html.P(empty_message, className="text-muted text-center")], None, HIDDEN
+    return groups, next_cursor, VISIBLE if next_cursor else HIDDEN
@@ -7,6 +7,8 @@ from api import sensor as api_sensor
 from api import pump as api_pump
 from api import sensor_data as api_sensor_data
 from api import models as api_models
+from api.sensor_frame import SensorFrame
+from api.downsample import chart_series
 import pandas as pd
 import plotly.express as px
 
@@ -14,6 +16,7 @@ PRIMARY_BLUE = '#0358a3'
 BLUE_SCALE = ['#0358a3', '#1d4ed8', '#2563eb', '#38bdf8', '#60a5fa']
 USER_STATUS_BLUE_MAP = {'Hoạt động': '#0358a3', 'Không hoạt động': '#60a5fa'}
 PUMP_STATUS_BLUE_MAP = {'Đang chạy': '#0358a3', 'Đã dừng': '#60a5fa'}
+SENSOR_TIME_KEYS = ('thoi_gian_cap_nhat', 'thoi_gian', 'thoi_gian_tao', 'timestamp', 'created_at', 'ngay')
 
 
 layout = html.Div([
@@ -80,9 +83,10 @@ def load_admin_dashboard(pathname, session_data):
         total_pumps = 0
 
     try:
-        data = api_sensor_data.get_data_by_pump(limit=500, offset=0, token=token) or {}
-        total_data = data.get('total', 0) if isinstance(data, dict) else 0
+        sensor_frame = api_sensor_data.get_frame_by_pump(limit=500, offset=0, token=token, time_keys=SENSOR_TIME_KEYS)
+        total_data = sensor_frame.meta.get('total', 0)
     except Exception:
+        sensor_frame = SensorFrame.empty_frame()
         total_data = 0
     active_users = []
     try:
@@ -135,15 +139,8 @@ def load_admin_dashboard(pathname, session_data):
         elif inferred_type_names:
             total_sensor_types = len(inferred_type_names)
 
-    sensor_records = []
-    if isinstance(data, dict):
-        sensor_records = data.get('data') or []
-        if not total_data:
-            total_data = data.get('total') or len(sensor_records)
-    elif isinstance(data, list):
-        sensor_records = data
-        if not total_data:
-            total_data = len(sensor_records)
+    if not total_data:
+        total_data = len(sensor_frame)
 
     def _is_truthy(value):
         if isinstance(value, bool):
@@ -377,92 +374,69 @@ def load_admin_dashboard(pathname, session_data):
         registration_fig = None
         activity_fig = None
 
-    sensor_df = pd.DataFrame(sensor_records) if sensor_records else pd.DataFrame()
+    value_columns = {
+        'luu_luong_nuoc': 'Lưu lượng (L/phút)',
+        'nhiet_do': 'Nhiệt độ (°C)',
+        'do_am_dat': 'Áp suất (bar)',
+        'do_am': 'Độ ẩm (%)'
+    }
+    available_cols = [col for col in value_columns if sensor_frame.has_column(col)]
+    if sensor_frame.valid_time_count():
+        sensor_df = sensor_frame.sort_by_time().to_dataframe(
+            columns=list(value_columns), time_column='timestamp', drop_missing_time=True
+        )
+    else:
+        sensor_df = pd.DataFrame()
     sensor_fig = None
     pump_activity_fig = None
 
     if not sensor_df.empty:
-        timestamp_col = None
-        for col in ('thoi_gian_cap_nhat', 'thoi_gian', 'thoi_gian_tao', 'timestamp', 'created_at'):
-            if col in sensor_df.columns:
-                converted = pd.to_datetime(sensor_df[col], errors='coerce')
-                if converted.notna().any():
-                    sensor_df['timestamp'] = converted
-                    timestamp_col = 'timestamp'
-                    break
-        if timestamp_col is None and 'ngay' in sensor_df.columns:
-            converted = pd.to_datetime(sensor_df['ngay'], errors='coerce')
-            if converted.notna().any():
-                sensor_df['timestamp'] = converted
-                timestamp_col = 'timestamp'
-
-        if timestamp_col:
-            sensor_df = sensor_df.dropna(subset=['timestamp']).sort_values('timestamp')
-
-            if not sensor_df.empty:
-                try:
-                    sensor_df['is_running'] = sensor_df.get(
-                        'luu_luong_nuoc',
-                        pd.Series([0] * len(sensor_df), index=sensor_df.index)
-                    ).apply(lambda v: float(v or 0) > 0)
-                except Exception:
-                    sensor_df['is_running'] = False
-
-                pump_group = sensor_df.groupby(sensor_df['timestamp'].dt.floor('4H')).agg(
-                    running=('is_running', 'sum'),
-                    total=('is_running', 'count')
-                ).reset_index()
-
-                if not pump_group.empty:
-                    pump_group['stopped'] = pump_group['total'] - pump_group['running']
-                    pump_long = pump_group.melt(
-                        id_vars='timestamp',
-                        value_vars=['running', 'stopped'],
-                        var_name='Trạng thái',
-                        value_name='Số lần'
-                    )
-                    pump_long['Trạng thái'] = pump_long['Trạng thái'].map({'running': 'Đang chạy', 'stopped': 'Đã dừng'})
-                    pump_activity_fig = px.bar(
-                        pump_long,
-                        x='timestamp',
-                        y='Số lần',
-                        color='Trạng thái',
-                        barmode='stack',
-                        title='Hoạt động máy bơm theo thời gian',
-                        color_discrete_map=PUMP_STATUS_BLUE_MAP,
-                        labels={'timestamp': 'Thời gian', 'Số lần': 'Số lần', 'Trạng thái': 'Trạng thái'}
-                    )
-
-                value_columns = {
-                    'luu_luong_nuoc': 'Lưu lượng (L/phút)',
-                    'nhiet_do': 'Nhiệt độ (°C)',
-                    'do_am_dat': 'Áp suất (bar)',
-                    'do_am': 'Độ ẩm (%)'
-                }
-                available_cols = [col for col in value_columns if col in sensor_df.columns]
-
-                if available_cols:
-                    sensor_values = sensor_df[['timestamp'] + available_cols]
-                    sensor_long = sensor_values.melt(
-                        id_vars='timestamp',
-                        value_vars=available_cols,
-                        var_name='Chỉ số',
-                        value_name='Giá trị'
-                    )
-                    sensor_long['Chỉ số'] = sensor_long['Chỉ số'].map(value_columns)
-                    sensor_long = sensor_long.dropna(subset=['Giá trị'])
-                    if not sensor_long.empty:
-                        sensor_fig = px.line(
-                            sensor_long,
-                            x='timestamp',
-                            y='Giá trị',
-                            color='Chỉ số',
-                            markers=True,
-                            title='Giá trị cảm biến theo thời gian',
-                            color_discrete_sequence=BLUE_SCALE,
-                            labels={'timestamp': 'Thời gian', 'Giá trị': 'Giá trị', 'Chỉ số': 'Chỉ số'}
-                        )
-                        sensor_fig.update_layout(legend=dict(title=dict(text='Chỉ số cảm biến')))
+        sensor_df['is_running'] = sensor_df['luu_luong_nuoc'].fillna(0) > 0
+
+        pump_group = sensor_df.groupby(sensor_df['timestamp'].dt.floor('4H')).agg(
+            running=('is_running', 'sum'),
+            total=('is_running', 'count')
+        ).reset_index()
+
+        if not pump_group.empty:
+            pump_group['stopped'] = pump_group['total'] - pump_group['running']
+            pump_long = pump_group.melt(
+                id_vars='timestamp',
+                value_vars=['running', 'stopped'],
+                var_name='Trạng thái',
+                value_name='Số lần'
+            )
+            pump_long['Trạng thái'] = pump_long['Trạng thái'].map({'running': 'Đang chạy', 'stopped': 'Đã dừng'})
+            pump_activity_fig = px.bar(
+                pump_long,
+                x='timestamp',
+                y='Số lần',
+                color='Trạng thái',
+                barmode='stack',
+                title='Hoạt động máy bơm theo thời gian',
+                color_discrete_map=PUMP_STATUS_BLUE_MAP,
+                labels={'timestamp': 'Thời gian', 'Số lần': 'Số lần', 'Trạng thái': 'Trạng thái'}
+            )
+
+        if available_cols:
+            # Mỗi chỉ số tối đa CHART_MAX_POINTS điểm (LTTB), bỏ giá trị thiếu.
+            series = chart_series(sensor_frame.sort_by_time(), available_cols)
+            sensor_long = pd.concat([
+                pd.DataFrame({'timestamp': times, 'Chỉ số': value_columns[name], 'Giá trị': values})
+                for name, (times, values) in series.items()
+            ], ignore_index=True)
+            if not sensor_long.empty:
+                sensor_fig = px.line(
+                    sensor_long,
+                    x='timestamp',
+                    y='Giá trị',
+                    color='Chỉ số',
+                    markers=True,
+                    title='Giá trị cảm biến theo thời gian',
+                    color_discrete_sequence=BLUE_SCALE,
+                    labels={'timestamp': 'Thời gian', 'Giá trị': 'Giá trị', 'Chỉ số': 'Chỉ số'}
+                )
+                sensor_fig.update_layout(legend=dict(title=dict(text='Chỉ số cảm biến')))
 
     registration_fig = _style_figure(registration_fig)
     if registration_fig is not None:
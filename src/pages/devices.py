@@ -3,10 +3,17 @@ import dash_bootstrap_components as dbc
 from dash.exceptions import PreventUpdate
 from components.navbar import create_navbar
 from components.topbar import TopBar
+from components.pump_history import create_history_body, update_history_modal, HIDDEN as HISTORY_HIDDEN
 from api.sensor import list_sensors, create_sensor, update_sensor, delete_sensor, get_sensor, get_sensor_types
 from api.pump import list_pumps, create_pump, update_pump, delete_pump, get_pump
-from api.sensor_data import get_data_by_date, get_data_by_pump
-from api.memory_pump import get_pump_memory_logs
+from api.sensor_data import get_frame_by_date_range, get_data_by_pump
+from api.memory_pump import get_pump_memory_logs_range
+from api.day_cache import local_now
+from api.events import PUSH_ENABLED
+from api.poller import live_pumps
+from api.output_diff import TAB_STATE, diff_outputs
+from api.downsample import chart_frames, chart_series, relayout_window
+from api.cache import caller_identity
 import dash
 from datetime import datetime, timedelta
 import pandas as pd
@@ -31,44 +38,6 @@ def format_datetime(dt_str):
         return "Không có dữ liệu"
 
 
-def format_time_with_seconds(time_str):
-    """Format time string to HH:MM:SS format in Asia/Bangkok timezone."""
-    if not time_str:
-        return "N/A"
-    try:
-        from datetime import timezone as tz_module
-        dt = datetime.fromisoformat(time_str.replace('Z', '+00:00'))
-        target_tz = tz_module(timedelta(hours=7))
-        dt_local = dt.astimezone(target_tz)
-        return dt_local.strftime('%H:%M:%S')
-    except:
-        return time_str
-
-def calculate_duration(start_time, end_time):
-    """Calculate duration between two timestamps and return formatted string."""
-    if not start_time or not end_time:
-        return "N/A"
-    try:
-        start_dt = datetime.fromisoformat(start_time.replace('Z', '+00:00'))
-        end_dt = datetime.fromisoformat(end_time.replace('Z', '+00:00'))
-        duration = end_dt - start_dt
-        
-        # Calculate hours, minutes, seconds
-        total_seconds = int(duration.total_seconds())
-        hours = total_seconds // 3600
-        minutes = (total_seconds % 3600) // 60
-        seconds = total_seconds % 60
-        
-        if hours > 0:
-            return f"{hours}h {minutes}m {seconds}s"
-        elif minutes > 0:
-            return f"{minutes}m {seconds}s"
-        else:
-            return f"{seconds}s"
-    except Exception as e:
-        print(f"Error calculating duration: {e}")
-        return "N/A"
-
 def create_sensor_card(sensor, pump_name="", index=0):
     """Tạo card hiển thị dữ liệu cảm biến"""
     return dbc.Col([
@@ -193,7 +162,7 @@ layout = html.Div([
         dcc.Store(id='device-pump-delete-id'),
         dcc.Store(id='device-sensor-edit-id'),
         dcc.Store(id='device-pump-edit-id'),
-        dcc.Interval(id='device-refresh-interval', interval=5*1000, n_intervals=0),
+        dcc.Interval(id='device-refresh-interval', interval=5*1000, n_intervals=0, disabled=PUSH_ENABLED),
 
         # Modals for Pump
         dbc.Modal([
@@ -274,13 +243,7 @@ layout = html.Div([
                 close_button=True
             ),
             dbc.ModalBody([
-                html.Div(id='device-pump-history-modal-content', children=[
-                    html.P("Đang tải...", className="text-muted text-center")
-                ], style={
-                    'max-height': '600px',
-                    'overflow-y': 'auto',
-                    'padding-right': '10px'
-                })
+                create_history_body('device-pump-history-modal')
             ]),
             dbc.ModalFooter([
                 dbc.Button("Đóng", id='device-pump-history-modal-close', className="ms-auto")
@@ -295,11 +258,12 @@ layout = html.Div([
 
 @callback(
     [Output('device-pump-data-store', 'data', allow_duplicate=True), Output('device-sensor-data-store', 'data', allow_duplicate=True)],
-    [Input('device-refresh-interval', 'n_intervals')],
-    State('session-store', 'data'),
+    [Input('device-refresh-interval', 'n_intervals'), Input('live-pump-signal', 'n_clicks')],
+    [State('session-store', 'data'), TAB_STATE],
     prevent_initial_call='initial_duplicate'
 )
-def device_load_all_data(n_intervals, session_data):
+@diff_outputs()
+def device_load_all_data(n_intervals, live_signal, session_data):
     token = None
     if session_data and isinstance(session_data, dict):
         token = session_data.get('token')
@@ -309,6 +273,13 @@ def device_load_all_data(n_intervals, session_data):
     
     try:
         pump_data = list_pumps(limit=1, offset=0, token=token)
+        # Trạng thái / chế độ lấy từ ảnh chụp dùng chung (api.poller) thay vì hỏi backend mỗi lần.
+        if isinstance(pump_data, dict) and isinstance(pump_data.get('data'), list):
+            pumps = []
+            for pump in pump_data['data']:
+                snapshot = live_pumps.view(pump.get('ma_may_bom'), token) if isinstance(pump, dict) else None
+                pumps.append({**pump, **snapshot['pump']} if snapshot else pump)
+            pump_data = {**pump_data, 'data': pumps}
         # print(f"DEBUG: pump_data = {pump_data}")
     except Exception as e:
         print(f"ERROR loading pumps: {str(e)}")
@@ -396,10 +367,13 @@ def device_render_main_pump(pump_data):
 
 @callback(
     Output('device-pump-history-body', 'children'),
-    [Input('device-pump-data-store', 'data')],
+    # Store máy bơm được diff_outputs bỏ khi không đổi nên cần tick riêng để lịch sử vẫn làm mới
+    # (interval khi poll, live-pump-signal khi bật push).
+    [Input('device-pump-data-store', 'data'), Input('device-refresh-interval', 'n_intervals'),
+     Input('live-pump-signal', 'n_clicks')],
     State('session-store', 'data')
 )
-def device_render_pump_history(pump_data, session):
+def device_render_pump_history(pump_data, n_intervals, live_signal, session):
     if not pump_data or not isinstance(pump_data, dict):
         return html.P("Không có dữ liệu", className="text-muted")
     
@@ -413,19 +387,9 @@ def device_render_pump_history(pump_data, session):
     
     try:
         # Collect logs from last 5 days
-        all_logs = []
-        for i in range(5):
-            date = (datetime.now() - timedelta(days=i)).strftime('%Y-%m-%d')
-            logs = get_pump_memory_logs(pump_id, limit=100, offset=0, token=token, date=date)
-            
-            if isinstance(logs, dict):
-                data = logs.get('data', [])
-            elif isinstance(logs, list):
-                data = logs
-            else:
-                data = []
-            
-            all_logs.extend(data)
+        now = local_now()
+        logs = get_pump_memory_logs_range(pump_id, now - timedelta(days=4), now, token=token, limit=100)
+        all_logs = logs.get('data', [])
         
         # Sort by time, most recent first, and take last 3
         if all_logs:
@@ -542,10 +506,18 @@ def update_selected_sensor(n_clicks, sensor_data, current_selection):
 @callback(
     Output('device-sensor-detail-chart', 'figure'),
     [Input('device-pump-data-store', 'data'),
-     Input('chart-time-filter', 'value')],
+     Input('chart-time-filter', 'value'),
+     Input('device-sensor-detail-chart', 'relayoutData'),
+     Input('device-refresh-interval', 'n_intervals'),
+     Input('live-sensor-signal', 'n_clicks')],
     State('session-store', 'data')
 )
-def device_render_sensor_detail_chart(pump_data, time_filter, session_data):
+def device_render_sensor_detail_chart(pump_data, time_filter, relayout_data, n_intervals, live_signal, session_data):
+    """Biểu đồ tổng hợp; mỗi trace tối đa CHART_MAX_POINTS điểm (LTTB).
+
+    Khi phóng to, khoảng đang xem được lấy mẫu lại từ frame đầy đủ trong chart_frames
+    nên chi tiết tăng dần mà không gọi lại backend.
+    """
     if not pump_data or not isinstance(pump_data, dict) or not pump_data.get('data'):
         return {
             'data': [],
@@ -560,43 +532,51 @@ def device_render_sensor_detail_chart(pump_data, time_filter, session_data):
     token = session_data.get('token') if session_data else None
     pump = pump_data['data'][0]
     pump_id = pump.get('ma_may_bom')
-    
-    # Fetch data based on time filter
-    end_date = datetime.now()
-    
-    if time_filter == '24h':
-        days_to_fetch = 1
-        start_date = end_date - timedelta(days=1)
-    elif time_filter == '7d':
-        days_to_fetch = 7
-        start_date = end_date - timedelta(days=7)
-    elif time_filter == '30d':
-        days_to_fetch = 30
-        start_date = end_date - timedelta(days=30)
-    else:
-        days_to_fetch = 1
-        start_date = end_date - timedelta(days=1)
-        
-    all_data = []
-    
-    # Fetch data day by day
-    for i in range(days_to_fetch + 1):
-        current_date = end_date - timedelta(days=i)
-        date_str = current_date.strftime('%Y-%m-%d')
-        
-        if current_date < start_date - timedelta(days=1):
-            break
-            
-        resp = get_data_by_date(date_str, token=token, ma_may_bom=pump_id, limit=1000)
-        if isinstance(resp, dict):
-            day_data = resp.get('data', [])
+
+    triggered = ctx.triggered_id
+    zoomed, window = relayout_window(relayout_data)
+    if triggered == 'device-sensor-detail-chart' and not zoomed:
+        raise PreventUpdate
+    if triggered == 'chart-time-filter':
+        window = None
+
+    def load_frame():
+        # Fetch data based on time filter
+        end_date = datetime.now()
+
+        if time_filter == '24h':
+            start_date = end_date - timedelta(days=1)
+        elif time_filter == '7d':
+            start_date = end_date - timedelta(days=7)
+        elif time_filter == '30d':
+            start_date = end_date - timedelta(days=30)
         else:
-            day_data = resp
+            start_date = end_date - timedelta(days=1)
+
+        # Fetch every day in the range in parallel (start_date's day included)
+        frame = get_frame_by_date_range(start_date, end_date, ma_may_bom=pump_id, token=token, limit=1000, naive_tz='UTC')
+        if frame.empty or not frame.valid_time_count():
+            return frame
+
+        # Filter by time range exactly
+        from datetime import timezone
+        tz_bangkok = timezone(timedelta(hours=7))
+        cutoff_time = datetime.now(tz_bangkok)
+
+        if time_filter == '24h':
+            cutoff_time = cutoff_time - timedelta(hours=24)
+        elif time_filter == '7d':
+            cutoff_time = cutoff_time - timedelta(days=7)
+        elif time_filter == '30d':
+            cutoff_time = cutoff_time - timedelta(days=30)
+
+        return frame.since(int(cutoff_time.timestamp() * 1_000_000_000))
+
+    # Phóng to dùng lại frame đã tải; dữ liệu mới (store máy bơm, bộ lọc) thì tải lại.
+    frame = chart_frames.get_or_load((caller_identity(token), str(pump_id), time_filter), load_frame,
+                                     reload=triggered != 'device-sensor-detail-chart')
             
-        if isinstance(day_data, list):
-            all_data.extend(day_data)
-            
-    if not all_data:
+    if frame.empty:
         return {
             'data': [],
             'layout': go.Layout(
@@ -607,86 +587,52 @@ def device_render_sensor_detail_chart(pump_data, time_filter, session_data):
             )
         }
         
-    # Convert to DataFrame
-    df = pd.DataFrame(all_data)
-    
     # Ensure timestamp column exists
-    if 'thoi_gian_tao' not in df.columns:
+    if not frame.valid_time_count():
         return {
             'data': [],
             'layout': go.Layout(title="Lỗi dữ liệu: Thiếu thời gian")
         }
-        
-    # Convert to datetime and handle timezone
-    df['thoi_gian_tao'] = pd.to_datetime(df['thoi_gian_tao'], utc=True)
-    
-    try:
-        df['thoi_gian_tao'] = df['thoi_gian_tao'].dt.tz_convert('Asia/Bangkok')
-    except Exception as e:
-        print(f"Error converting timezone: {e}")
-
-    # Filter by time range exactly
-    from datetime import timezone
-    tz_bangkok = timezone(timedelta(hours=7))
-    cutoff_time = datetime.now(tz_bangkok)
-    
-    if time_filter == '24h':
-        cutoff_time = cutoff_time - timedelta(hours=24)
-    elif time_filter == '7d':
-        cutoff_time = cutoff_time - timedelta(days=7)
-    elif time_filter == '30d':
-        cutoff_time = cutoff_time - timedelta(days=30)
-        
-    df = df[df['thoi_gian_tao'] >= cutoff_time]
-    
-    if df.empty:
-         return {
-            'data': [],
-            'layout': go.Layout(
-                title=f"Không có dữ liệu trong khoảng thời gian này",
-                xaxis={'title': 'Thời gian'},
-                yaxis={'title': 'Giá trị'},
-                template='plotly_white'
-            )
-        }
 
-    df = df.sort_values('thoi_gian_tao')
+    # Frame from get_frame_by_date_range is already sorted by time
+    chart_columns = [c for c in ('nhiet_do', 'do_am', 'do_am_dat', 'luu_luong_nuoc') if frame.has_column(c)]
+    series = chart_series(frame, chart_columns, window=window)
     
     # Create Chart with multiple traces
     fig = go.Figure()
     
     # Add traces for each metric if available
-    if 'nhiet_do' in df.columns:
+    if 'nhiet_do' in series:
         fig.add_trace(go.Scatter(
-            x=df['thoi_gian_tao'],
-            y=df['nhiet_do'],
+            x=series['nhiet_do'][0],
+            y=series['nhiet_do'][1],
             mode='lines',
             name='Nhiệt độ (°C)',
             line=dict(color='#dc3545', width=2)
         ))
         
-    if 'do_am' in df.columns:
+    if 'do_am' in series:
         fig.add_trace(go.Scatter(
-            x=df['thoi_gian_tao'],
-            y=df['do_am'],
+            x=series['do_am'][0],
+            y=series['do_am'][1],
             mode='lines',
             name='Độ ẩm không khí (%)',
             line=dict(color='#0d6efd', width=2)
         ))
         
-    if 'do_am_dat' in df.columns:
+    if 'do_am_dat' in series:
         fig.add_trace(go.Scatter(
-            x=df['thoi_gian_tao'],
-            y=df['do_am_dat'],
+            x=series['do_am_dat'][0],
+            y=series['do_am_dat'][1],
             mode='lines',
             name='Độ ẩm đất (%)',
             line=dict(color='#198754', width=2)
         ))
         
-    if 'luu_luong_nuoc' in df.columns:
+    if 'luu_luong_nuoc' in series:
         fig.add_trace(go.Scatter(
-            x=df['thoi_gian_tao'],
-            y=df['luu_luong_nuoc'],
+            x=series['luu_luong_nuoc'][0],
+            y=series['luu_luong_nuoc'][1],
             mode='lines',
             name='Lưu lượng (L/phút)',
             line=dict(color='#0dcaf0', width=2),
@@ -695,6 +641,8 @@ def device_render_sensor_detail_chart(pump_data, time_filter, session_data):
     
     fig.update_layout(
         title=f"Biểu đồ tổng hợp ({time_filter})",
+        # Giữ vùng phóng to / chú thích đã ẩn khi figure được cập nhật, đặt lại khi đổi máy bơm / bộ lọc.
+        uirevision=f"{pump_id}-{time_filter}",
         xaxis_title="Thời gian",
         yaxis_title="Giá trị",
         hovermode='x unified',
@@ -859,139 +807,47 @@ def device_toggle_history_modal(n_clicks_view, n_clicks_close, is_open):
     return is_open
 
 @callback(
-    Output('device-pump-history-modal-content', 'children'),
+    [
+        Output('device-pump-history-modal-content', 'children'),
+        Output('device-pump-history-modal-cursor', 'data'),
+        Output('device-pump-history-modal-load-more', 'style'),
+    ],
     [
         Input('device-pump-history-modal', 'is_open'),
+        Input('device-pump-history-modal-load-more', 'n_clicks'),
     ],
     [
+        State('device-pump-history-modal-cursor', 'data'),
         State('device-pump-data-store', 'data'),
         State('session-store', 'data')
     ]
 )
-def device_update_history_modal(is_open, pump_data, session):
+def device_update_history_modal(is_open, load_more_clicks, cursor, pump_data, session):
     if not is_open:
         raise PreventUpdate
     
     if not pump_data or not isinstance(pump_data, dict):
-        return [html.P("Không có dữ liệu máy bơm", className="text-muted text-center")]
+        return [html.P("Không có dữ liệu máy bơm", className="text-muted text-center")], None, HISTORY_HIDDEN
     
     pumps = pump_data.get('data', [])
     if not pumps:
-        return [html.P("Không có dữ liệu máy bơm", className="text-muted text-center")]
+        return [html.P("Không có dữ liệu máy bơm", className="text-muted text-center")], None, HISTORY_HIDDEN
     
     pump = pumps[0]
     pump_id = pump.get('ma_may_bom')
     token = session.get('token') if session else None
     
     try:
-        # Fetch logs for last 7 days
-        all_logs = []
-        for i in range(7):
-            date = (datetime.now() - timedelta(days=i)).strftime('%Y-%m-%d')
-            logs = get_pump_memory_logs(pump_id, limit=100, offset=0, token=token, date=date)
-            
-            if isinstance(logs, dict):
-                data = logs.get('data', [])
-            elif isinstance(logs, list):
-                data = logs
-            else:
-                data = []
-            
-            all_logs.extend(data)
-            
-        if not all_logs:
-            return [html.P("Không có lịch sử hoạt động trong 7 ngày qua", className="text-muted text-center")]
-            
-        # Group logs by date
-        logs_by_date = {}
-        for log in all_logs:
-            time_str = log.get('thoi_gian_bat') or log.get('thoi_gian_tat') or log.get('thoi_gian_tao', '')
-            if time_str:
-                # Extract date from timestamp (YYYY-MM-DD)
-                date_part = time_str.split('T')[0] if 'T' in time_str else time_str[:10]
-                if date_part not in logs_by_date:
-                    logs_by_date[date_part] = []
-                logs_by_date[date_part].append(log)
-        
-        # Sort dates in descending order (newest first)
-        sorted_dates = sorted(logs_by_date.keys(), reverse=True)
-        
-        # Create timeline view
-        timeline_items = []
-        
-        for date_key in sorted_dates:
-            logs_for_date = logs_by_date[date_key]
-            # Sort logs by thoi_gian_bat (oldest first), then reverse to show newest first
-            logs_for_date = sorted(logs_for_date, key=lambda x: x.get('thoi_gian_bat') or x.get('thoi_gian_tat') or x.get('thoi_gian_tao', ''), reverse=True)
-            
-            if not logs_for_date:
-                continue
-            
-            # Parse and format date
-            try:
-                date_obj = datetime.strptime(date_key, '%Y-%m-%d')
-                # Format as "Thứ X, DD/MM/YYYY"
-                day_of_week = ['Thứ Hai', 'Thứ Ba', 'Thứ Tư', 'Thứ Năm', 'Thứ Sáu', 'Thứ Bảy', 'Chủ Nhật']
-                weekday = day_of_week[date_obj.weekday()]
-                formatted_date = f"{weekday}, {date_obj.strftime('%d/%m/%Y')}"
-            except:
-                formatted_date = date_key
-            
-            # Create timeline section for this date
-            total_logs = len(logs_for_date)
-            date_section = html.Div([
-                # Date header
-                html.Div([
-                    html.Span(formatted_date, style={
-                        'font-weight': '600',
-                        'color': '#333',
-                        'font-size': '0.95rem',
-                        'padding': '8px 0',
-                        'border-bottom': '2px solid #e9ecef',
-                        'width': '100%'
-                    })
-                ], style={'margin': '15px 0 10px 0'}),
-                
-                # List of events for this date
-                html.Div([
-                    *[
-                        html.Div([
-                            html.Div([
-                                html.Span(f"Lần {total_logs - idx}: ", style={'font-weight': '600', 'color': '#333'}),
-                                html.Span(' Bắt đầu:  ', style={'color': '#666'}),
-                                html.Span(
-                                    format_time_with_seconds(log.get('thoi_gian_bat', '')),
-                                    style={'color': '#28a745', 'font-weight': '500'}
-                                ),
-                                html.Span(' - Kết thúc: ', style={'color': '#666', 'margin': '0 4px'}),
-                                html.Span(
-                                    format_time_with_seconds(log.get('thoi_gian_tat', '')) if log.get('thoi_gian_tat') else '(Chưa tắt)',
-                                    style={'color': '#dc3545', 'font-weight': '500'}
-                                ),
-                            ], style={'display': 'flex', 'align-items': 'center', 'flex-wrap': 'wrap'}),
-                            # Duration row
-                            html.Div([
-                                html.Span(' Tổng thời gian: ', style={'color': '#666', 'font-size': '0.85rem'}),
-                                html.Span(
-                                    calculate_duration(log.get('thoi_gian_bat', ''), log.get('thoi_gian_tat', '')),
-                                    style={'color': '#007bff', 'font-weight': '500', 'font-size': '0.85rem'}
-                                ),
-                            ], style={'display': 'flex', 'align-items': 'center', 'margin-top': '4px'})
-                        ], style={'padding': '10px 0', 'border-bottom': '1px solid #f0f0f0'})
-                        for idx, log in enumerate(logs_for_date)
-                    ]
-                ])
-            ])
-            
-            timeline_items.append(date_section)
-        
-        return timeline_items
+        # 7 ngày gần nhất, tải dần theo nhóm ngày
+        load_more = ctx.triggered_id == 'device-pump-history-modal-load-more'
+        return update_history_modal(load_more, pump_id, token, 7, cursor,
+                                    "Không có lịch sử hoạt động trong 7 ngày qua")
         
     except Exception as e:
         print(f"Error fetching pump history modal: {e}")
         import traceback
         traceback.print_exc()
-        return [html.P("Lỗi tải dữ liệu", className="text-danger text-center")]
+        return [html.P("Lỗi tải dữ liệu", className="text-danger text-center")], None, HISTORY_HIDDEN
 
 # Add callback to close modal on save success? 
 # For simplicity, let's add 'device-pump-save' to the toggle callback inputs.
@@ -1,4 +1,4 @@
-from dash import html, dcc, callback, Input, Output, State
+from dash import html, dcc, callback, Input, Output, State, Patch
 import dash_bootstrap_components as dbc
 import plotly.graph_objs as go
 import plotly.express as px
@@ -6,14 +6,20 @@ import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
 from components.navbar import create_navbar
+from components.pump_history import create_history_body, update_history_modal, HIDDEN as HISTORY_HIDDEN
 from dash.exceptions import PreventUpdate
 import requests
 import json
-from api.sensor_data import get_data_by_date
-from api.pump import list_pumps, get_pump, update_pump
+from api.sensor_data import get_frame_by_date
+from api.sensor_feed import get_feed
+from api.latest import get_latest_reading
+from api.sensor_frame import LOCAL_TZ
+from api.pump import list_pumps, update_pump
 from api.sensor import list_sensors
 from api.user import get_user, list_users
-from api.memory_pump import get_pump_memory_logs
+from api.events import PUSH_ENABLED
+from api.poller import live_pumps, keep_feed_fresh
+from api.output_diff import TAB_STATE, diff_outputs
 import dash
 
 def create_empty_dataframe():
@@ -51,37 +57,19 @@ def fetch_sensor_data(token=None, date_str=None):
     try:
         if date_str is None:
             date_str = datetime.now().strftime('%Y-%m-%d')
-        response_data = get_data_by_date(date_str, token)
+        frame = get_frame_by_date(date_str, token=token)
 
-        if isinstance(response_data, dict) and 'data' in response_data:
-            data = response_data['data']
-        else:
-            data = response_data
-        
-        if not data or not isinstance(data, list):
+        if frame.empty:
             return create_empty_dataframe()
-            
-        df = pd.DataFrame.from_records(data)
-        
-        required_columns = ['thoi_gian_tao', 'luu_luong_nuoc', 'do_am_dat', 'nhiet_do', 'do_am']
+
+        required_columns = ['luu_luong_nuoc', 'do_am_dat', 'nhiet_do', 'do_am']
         for col in required_columns:
-            if col not in df.columns:
+            if not frame.has_column(col):
                 print(f"Missing required column: {col}")
                 return create_empty_dataframe()
-        
-        df['thoi_gian_tao'] = pd.to_datetime(df['thoi_gian_tao'], errors='coerce')
-        try:
-            if df['thoi_gian_tao'].dt.tz is None:
-                df['thoi_gian_tao'] = df['thoi_gian_tao'].dt.tz_localize('Asia/Bangkok')
-            else:
-                df['thoi_gian_tao'] = df['thoi_gian_tao'].dt.tz_convert('Asia/Bangkok')
-        except Exception:
-            df['thoi_gian_tao'] = pd.to_datetime(df['thoi_gian_tao'])
 
-        df['ngay'] = pd.to_datetime(df['ngay'], errors='coerce')
-        
+        df = frame.sort_by_time().to_dataframe(tz='Asia/Bangkok', time_column='date')
         df = df.rename(columns={
-            'thoi_gian_tao': 'date',
             'luu_luong_nuoc': 'flow_rate',
             'do_am_dat': 'soil_moisture',
             'nhiet_do': 'temperature',
@@ -89,15 +77,7 @@ def fetch_sensor_data(token=None, date_str=None):
             'mua': 'rain',
             'so_xung': 'pulse_count',
             'tong_the_tich': 'total_volume',
-            'ghi_chu': 'notes'
         })
-        
-        df = df.sort_values('date')
-        
-        numeric_columns = ['flow_rate', 'soil_moisture', 'temperature', 'humidity']
-        for col in numeric_columns:
-            df[col] = pd.to_numeric(df[col], errors='coerce')
-        
         return df
     except Exception as e:
         print(f"Error fetching sensor data: {e}")
@@ -120,68 +100,14 @@ def fetch_pump_list(token=None):
 
 
 def fetch_pump_latest_data(ma_may_bom, token=None):
+    """Bản ghi mới nhất hôm nay của máy bơm, tra trong chỉ mục dùng chung (api.latest)."""
     try:
-        today = datetime.now().strftime('%Y-%m-%d')
-        response = get_data_by_date(today, token=token, limit=1000, offset=0)
-
-        if isinstance(response, dict):
-            data = response.get('data')
-        else:
-            data = response
-
-        if not isinstance(data, list):
-            return None
-
-        str_id = str(ma_may_bom) if ma_may_bom is not None else None
-        filtered = [item for item in data if str(item.get('ma_may_bom')) == str_id]
-
-        if not filtered:
-            return None
-
-        filtered.sort(key=lambda item: item.get('thoi_gian_tao', ''), reverse=True)
-        return filtered[0]
+        today_start = pd.Timestamp.now(tz=LOCAL_TZ).normalize().value
+        return get_latest_reading(ma_may_bom, token=token, since=today_start)
     except Exception as e:
         print(f"Error fetching pump data: {e}")
         return None
 
-def format_time_with_seconds(time_str):
-    """Format time string to HH:MM:SS format in Asia/Bangkok timezone."""
-    if not time_str:
-        return "N/A"
-    try:
-        from datetime import timezone as tz_module
-        dt = datetime.fromisoformat(time_str.replace('Z', '+00:00'))
-        target_tz = tz_module(timedelta(hours=7))
-        dt_local = dt.astimezone(target_tz)
-        return dt_local.strftime('%H:%M:%S')
-    except:
-        return time_str
-
-def calculate_duration(start_time, end_time):
-    """Calculate duration between two timestamps and return formatted string."""
-    if not start_time or not end_time:
-        return "N/A"
-    try:
-        start_dt = datetime.fromisoformat(start_time.replace('Z', '+00:00'))
-        end_dt = datetime.fromisoformat(end_time.replace('Z', '+00:00'))
-        duration = end_dt - start_dt
-        
-        # Calculate hours, minutes, seconds
-        total_seconds = int(duration.total_seconds())
-        hours = total_seconds // 3600
-        minutes = (total_seconds % 3600) // 60
-        seconds = total_seconds % 60
-        
-        if hours > 0:
-            return f"{hours}h {minutes}m {seconds}s"
-        elif minutes > 0:
-            return f"{minutes}m {seconds}s"
-        else:
-            return f"{seconds}s"
-    except Exception as e:
-        print(f"Error calculating duration: {e}")
-        return "N/A"
-
 empty_df = create_empty_dataframe()
 
 layout = html.Div([
@@ -359,13 +285,7 @@ layout = html.Div([
                         close_button=True
                     ),
                     dbc.ModalBody([
-                        html.Div(id='pump-history-modal-content', children=[
-                            html.P("Đang tải...", className="text-muted text-center")
-                        ], style={
-                            'max-height': '600px',
-                            'overflow-y': 'auto',
-                            'padding-right': '10px'
-                        })
+                        create_history_body('pump-history-modal')
                     ]),
                     dbc.ModalFooter([
                         dbc.Button("Đóng", id='pump-history-modal-close', className="ms-auto")
@@ -416,9 +336,83 @@ layout = html.Div([
 
     ], fluid=True, className='home-page-container px-4'),
 
-    dcc.Interval(id='interval-component', interval=5*1000, n_intervals=0)
+    dcc.Store(id='home-sensor-cursor', data=None),
+    # Khi bật kênh đẩy, live-*-signal (app.py) kích hoạt các callback thay cho interval này.
+    dcc.Interval(id='interval-component', interval=5*1000, n_intervals=0, disabled=PUSH_ENABLED)
 ], className='page-container')
 
+def _feed_dates(timestamps):
+    return pd.Series(pd.to_datetime(timestamps, unit='ns', utc=True).tz_convert(LOCAL_TZ))
+
+
+def _centered_mean(values, window=3):
+    return pd.Series(values, dtype='float64').rolling(window=window, center=True).mean()
+
+
+def _plot_values(values):
+    return [None if pd.isna(v) else float(v) for v in values]
+
+
+def build_flow_rate_figure(dates, flow):
+    """Biểu đồ lưu lượng đầy đủ; đường trung bình bỏ điểm cuối (chưa đủ cửa sổ) để có thể nối thêm."""
+    rolling = _centered_mean(flow, window=min(3, len(flow)))
+    avg_dates, avg_values = dates, rolling
+    if len(flow) >= 3:
+        avg_dates, avg_values = dates.iloc[:-1], rolling.iloc[:-1]
+    return {
+        'data': [
+            go.Scatter(
+                x=dates,
+                y=flow,
+                mode='lines',
+                name='Lưu Lượng Thực Tế',
+                line=dict(color='#1f77b4', width=3),
+                fill='tozeroy',
+                fillcolor='rgba(31, 119, 180, 0.2)'
+            ),
+            go.Scatter(
+                x=avg_dates,
+                y=avg_values,
+                mode='lines',
+                name='Lưu Lượng Dự Đoán (Trung bình)',
+                line=dict(color='#2ca02c', width=2, dash='dash'),
+            )
+        ],
+        'layout': go.Layout(
+            xaxis={'title': 'Thời Gian', 'gridcolor': '#f0f0f0'},
+            yaxis={'title': 'Lưu Lượng (L/phút)', 'gridcolor': '#f0f0f0'},
+            hovermode='x unified',
+            plot_bgcolor='white',
+            paper_bgcolor='white',
+            margin=dict(l=50, r=20, t=20, b=50),
+            legend=dict(
+                orientation="h",
+                yanchor="bottom",
+                y=1.02,
+                xanchor="right",
+                x=1
+            )
+        )
+    }
+
+
+def extend_flow_rate_figure(dates, flow, first_new):
+    """Patch nối các điểm từ vị trí `first_new` (trong dates/flow) vào biểu đồ đã vẽ.
+
+    dates/flow phải bắt đầu sớm hơn điểm mới ít nhất hai điểm để tính lại trung
+    bình trượt của điểm cuối cũ.
+    """
+    # Giống cách plotly ghi datetime có múi giờ: giờ địa phương, không kèm offset.
+    labels = list(dates.dt.tz_localize(None).dt.strftime('%Y-%m-%dT%H:%M:%S.%f'))
+    rolling = _centered_mean(flow)
+    patched = Patch()
+    patched['data'][0]['x'].extend(labels[first_new:])
+    patched['data'][0]['y'].extend(_plot_values(flow[first_new:]))
+    patched['data'][1]['x'].extend(labels[first_new - 1:-1])
+    patched['data'][1]['y'].extend(_plot_values(rolling.iloc[first_new - 1:-1]))
+    return patched
+
+
 @callback(
     [
         Output('flow-rate', 'children'),
@@ -432,19 +426,29 @@ layout = html.Div([
         Output('max-flow', 'children'),
         Output('min-flow', 'children'),
         Output('selected-flow-rate-chart', 'figure'),
+        Output('home-sensor-cursor', 'data'),
     ],
     [
         Input('interval-component', 'n_intervals'),
+        Input('live-sensor-signal', 'n_clicks'),
         Input('url', 'pathname'),
         Input('session-store', 'modified_timestamp'),
     ],
     [
         State('session-store', 'data'),
-        State('selected-pump-store', 'data')
+        State('selected-pump-store', 'data'),
+        State('home-sensor-cursor', 'data'),
+        TAB_STATE,
     ]
 )
-def update_sensor_data(n, pathname, session_modified, session, selected_pump):
-    """Update all sensor data and charts."""
+@diff_outputs()
+def update_sensor_data(n, live_signal, pathname, session_modified, session, selected_pump, cursor):
+    """Update all sensor data and charts.
+
+    Dữ liệu trong ngày được giữ ở feed phía server (api.sensor_feed); mỗi lần poll
+    chỉ tải dòng mới, thống kê cập nhật dần và biểu đồ được nối thêm bằng Patch.
+    `home-sensor-cursor` ghi (epoch, seq) mà trình duyệt đã vẽ.
+    """
     if pathname not in ('', '/', None):
         raise PreventUpdate
     
@@ -453,105 +457,91 @@ def update_sensor_data(n, pathname, session_modified, session, selected_pump):
         token = session.get('token')
     
     try:
-        df = fetch_sensor_data(token)
-        
-        if df.empty:
+        feed = get_feed(token, pd.Timestamp.now(tz=LOCAL_TZ).strftime('%Y-%m-%d'))
+        if feed is None:
             raise PreventUpdate
-        
+        keep_feed_fresh(feed, token)
+        summary = feed.summary()
+        if not summary['seq']:
+            raise PreventUpdate
+
+        cursor = cursor if isinstance(cursor, dict) else {}
+        triggered = dash.callback_context.triggered_id
+        in_sync = (
+            triggered in ('interval-component', 'live-sensor-signal')
+            and cursor.get('epoch') == summary['epoch']
+            and isinstance(cursor.get('seq'), int)
+            and 3 <= cursor['seq'] <= summary['seq']
+        )
+        if in_sync and cursor['seq'] == summary['seq']:
+            raise PreventUpdate
+
+        epoch, seq = summary['epoch'], summary['seq']
+        flow_rate_figure = None
+        if in_sync:
+            snapshot = feed.snapshot(cursor['seq'] - 2)
+            if snapshot is not None and snapshot[0] == epoch:
+                _, seq, timestamps, values = snapshot
+                flow_rate_figure = extend_flow_rate_figure(_feed_dates(timestamps), values['luu_luong_nuoc'], 2)
+        if flow_rate_figure is None:
+            epoch, seq, timestamps, values = feed.snapshot()
+            flow_rate_figure = build_flow_rate_figure(_feed_dates(timestamps), values['luu_luong_nuoc'])
+
+        latest = summary['latest']
+        _, avg_value, min_value, max_value = summary['stats']['luu_luong_nuoc']
+
         # Update stat cards
-        flow_rate = f"{df['flow_rate'].iloc[-1]:.1f} L/phút" if not df.empty else "N/A"
+        flow_rate = f"{latest['luu_luong_nuoc']:.1f} L/phút"
         
-        soil_moisture_val = df['soil_moisture'].iloc[-1] if not df.empty else 0
-        soil_moisture = f"{soil_moisture_val:.0f}%" if not df.empty else "N/A"
+        soil_moisture_val = latest['do_am_dat']
+        soil_moisture = f"{soil_moisture_val:.0f}%"
         
         soil_moisture_desc = "%"
-        if not df.empty:
-            if pd.isna(soil_moisture_val):
-                soil_moisture_desc = "%"
-            elif soil_moisture_val < 20:
-                soil_moisture_desc = "Đất rất khô"
-            elif 20 <= soil_moisture_val < 40:
-                soil_moisture_desc = "Đất khô"
-            elif 40 <= soil_moisture_val < 60:
-                soil_moisture_desc = "Đất bình thường"
-            elif 60 <= soil_moisture_val < 80:
-                soil_moisture_desc = "Đất ẩm"
-            else:
-                soil_moisture_desc = "Đất ướt/bão hòa"
+        if pd.isna(soil_moisture_val):
+            soil_moisture_desc = "%"
+        elif soil_moisture_val < 20:
+            soil_moisture_desc = "Đất rất khô"
+        elif 20 <= soil_moisture_val < 40:
+            soil_moisture_desc = "Đất khô"
+        elif 40 <= soil_moisture_val < 60:
+            soil_moisture_desc = "Đất bình thường"
+        elif 60 <= soil_moisture_val < 80:
+            soil_moisture_desc = "Đất ẩm"
+        else:
+            soil_moisture_desc = "Đất ướt/bão hòa"
 
-        humidity_val = df['humidity'].iloc[-1] if not df.empty else 0
-        humidity = f"{humidity_val:.0f}%" if not df.empty else "N/A"
+        humidity_val = latest['do_am']
+        humidity = f"{humidity_val:.0f}%"
         
         humidity_desc = "%"
-        if not df.empty:
-            if pd.isna(humidity_val):
-                humidity_desc = "%"
-            elif humidity_val < 30:
-                humidity_desc = "Không khí khô"
-            elif 30 <= humidity_val < 70:
-                humidity_desc = "Lý tưởng"
-            else:
-                humidity_desc = "Không khí ẩm"
+        if pd.isna(humidity_val):
+            humidity_desc = "%"
+        elif humidity_val < 30:
+            humidity_desc = "Không khí khô"
+        elif 30 <= humidity_val < 70:
+            humidity_desc = "Lý tưởng"
+        else:
+            humidity_desc = "Không khí ẩm"
 
-        temperature_val = df['temperature'].iloc[-1] if not df.empty else 0
-        temperature = f"{temperature_val:.1f}°C" if not df.empty else "N/A"
+        temperature_val = latest['nhiet_do']
+        temperature = f"{temperature_val:.1f}°C"
         
         temperature_desc = "°C"
-        if not df.empty:
-            if pd.isna(temperature_val):
-                temperature_desc = "°C"
-            elif temperature_val < 15:
-                temperature_desc = "Lạnh"
-            elif 15 <= temperature_val < 25:
-                temperature_desc = "Mát mẻ"
-            elif 25 <= temperature_val < 35:
-                temperature_desc = "Bình thường"
-            else:
-                temperature_desc = "Nóng"
-        
-        # Calculate flow stats
-        avg_flow = df['flow_rate'].mean() if not df.empty else 0
-        predicted_flow = f"{avg_flow:.1f} L/phút" if not df.empty else "N/A"
+        if pd.isna(temperature_val):
+            temperature_desc = "°C"
+        elif temperature_val < 15:
+            temperature_desc = "Lạnh"
+        elif 15 <= temperature_val < 25:
+            temperature_desc = "Mát mẻ"
+        elif 25 <= temperature_val < 35:
+            temperature_desc = "Bình thường"
+        else:
+            temperature_desc = "Nóng"
         
-        max_flow = f"{df['flow_rate'].max():.1f} L/phút" if not df.empty else "N/A"
-        min_flow = f"{df['flow_rate'].min():.1f} L/phút" if not df.empty else "N/A"
-        
-        # Create flow rate chart
-        flow_rate_figure = {
-            'data': [
-                go.Scatter(
-                    x=df['date'],
-                    y=df['flow_rate'],
-                    mode='lines',
-                    name='Lưu Lượng Thực Tế',
-                    line=dict(color='#1f77b4', width=3),
-                    fill='tozeroy',
-                    fillcolor='rgba(31, 119, 180, 0.2)'
-                ),
-                go.Scatter(
-                    x=df['date'],
-                    y=df['flow_rate'].rolling(window=min(3, len(df)), center=True).mean(),
-                    mode='lines',
-                    name='Lưu Lượng Dự Đoán (Trung bình)',
-                    line=dict(color='#2ca02c', width=2, dash='dash'),
-                )
-            ],
-            'layout': go.Layout(
-                xaxis={'title': 'Thời Gian', 'gridcolor': '#f0f0f0'},
-                yaxis={'title': 'Lưu Lượng (L/phút)', 'gridcolor': '#f0f0f0'},
-                hovermode='x unified',
-                plot_bgcolor='white',
-                paper_bgcolor='white',
-                margin=dict(l=50, r=20, t=20, b=50),
-                legend=dict(
-                    orientation="h",
-                    yanchor="bottom",
-                    y=1.02,
-                    xanchor="right",
-                    x=1
-                )
-            )
-        }
+        # Flow stats (running aggregates over the whole day)
+        predicted_flow = f"{avg_value:.1f} L/phút"
+        max_flow = f"{max_value:.1f} L/phút"
+        min_flow = f"{min_value:.1f} L/phút"
         
         return (
             flow_rate,
@@ -564,9 +554,12 @@ def update_sensor_data(n, pathname, session_modified, session, selected_pump):
             predicted_flow,
             max_flow,
             min_flow,
-            flow_rate_figure
+            flow_rate_figure,
+            {'epoch': epoch, 'seq': seq},
         )
     
+    except PreventUpdate:
+        raise
     except Exception as e:
         print(f"Error updating sensor data: {e}")
         raise PreventUpdate
@@ -650,16 +643,19 @@ def select_pump(n_clicks):
     [
         Input('selected-pump-store', 'data'),
         Input('interval-component', 'n_intervals'),
+        Input('live-pump-signal', 'n_clicks'),
         Input('pump-toggle', 'value'),
         Input('auto-mode-btn', 'value'),
     ],
     [
         State('session-store', 'data'),
         State('url', 'pathname'),
+        TAB_STATE,
     ],
     prevent_initial_call=False
 )
-def update_pump_control_panel(selected_pump, n_intervals, toggle_value, auto_mode_value, session, pathname):
+@diff_outputs()
+def update_pump_control_panel(selected_pump, n_intervals, live_signal, toggle_value, auto_mode_value, session, pathname):
     """Unified callback to refresh control panel state and handle pump toggling & mode changes.
     
     Distinguishes between triggers using dash.callback_context:
@@ -680,7 +676,9 @@ def update_pump_control_panel(selected_pump, n_intervals, toggle_value, auto_mod
     token = session.get('token') if session else None
 
     try:
-        pump_info = get_pump(pump_id, token)
+        # Ảnh chụp dùng chung do api.poller cập nhật nền; tải lại ngay sau khi có ghi.
+        snapshot = live_pumps.view(pump_id, token)
+        pump_info = snapshot['pump'] if snapshot else {}
         if not pump_info:
             pump_name = selected_pump.get('ten_may_bom', 'Máy Bơm Nước Chính')
             return (pump_name, [], False, "Không có dữ liệu", [], "Chế độ không xác định")
@@ -755,12 +753,15 @@ def update_pump_control_panel(selected_pump, n_intervals, toggle_value, auto_mod
     [
         Input('selected-pump-store', 'data'),
         Input('interval-component', 'n_intervals'),
+        Input('live-pump-signal', 'n_clicks'),
     ],
     [
-        State('session-store', 'data')
+        State('session-store', 'data'),
+        TAB_STATE,
     ]
 )
-def update_pump_history(selected_pump, n_intervals, session):
+@diff_outputs()
+def update_pump_history(selected_pump, n_intervals, live_signal, session):
     """Update pump history with recent logs from last 5 days."""
     if not selected_pump or not selected_pump.get('ma_may_bom'):
         return [html.Small('Chưa chọn máy bơm', className='text-muted')]
@@ -770,20 +771,9 @@ def update_pump_history(selected_pump, n_intervals, session):
         pump_id = selected_pump.get('ma_may_bom')
         token = session.get('token') if session else None
         
-        # Collect logs from last 5 days
-        all_logs = []
-        for i in range(5):
-            date = (datetime.now() - timedelta(days=i)).strftime('%Y-%m-%d')
-            logs = get_pump_memory_logs(pump_id, limit=100, offset=0, token=token, date=date)
-            
-            if isinstance(logs, dict):
-                data = logs.get('data', [])
-            elif isinstance(logs, list):
-                data = logs
-            else:
-                data = []
-            
-            all_logs.extend(data)
+        # Nhật ký 5 ngày gần nhất trong ảnh chụp dùng chung (api.poller)
+        snapshot = live_pumps.view(pump_id, token)
+        all_logs = snapshot['logs'] if snapshot else []
         
         # Sort by time, most recent first, and take last 3
         if all_logs:
@@ -854,134 +844,38 @@ def toggle_pump_history_modal(n_clicks_open, n_clicks_close, is_open):
     return is_open
 
 @callback(
-    Output('pump-history-modal-content', 'children'),
+    [
+        Output('pump-history-modal-content', 'children'),
+        Output('pump-history-modal-cursor', 'data'),
+        Output('pump-history-modal-load-more', 'style'),
+    ],
     [
         Input('pump-history-modal', 'is_open'),
+        Input('pump-history-modal-load-more', 'n_clicks'),
     ],
     [
+        State('pump-history-modal-cursor', 'data'),
         State('selected-pump-store', 'data'),
         State('session-store', 'data')
     ]
 )
-def update_pump_history_modal(is_open, selected_pump, session):
-    """Update pump history modal content with all logs from last 30 days, grouped by date."""
+def update_pump_history_modal(is_open, load_more_clicks, cursor, selected_pump, session):
+    """Lịch sử 30 ngày theo nhóm ngày, ngày mới nhất trước; các ngày cũ hơn được tải dần khi cuộn/bấm "Tải thêm"."""
     if not is_open or not selected_pump or not selected_pump.get('ma_may_bom'):
-        return [html.P("Không có dữ liệu", className="text-muted text-center")]
+        return [html.P("Không có dữ liệu", className="text-muted text-center")], None, HISTORY_HIDDEN
     
     try:
-        from datetime import datetime, timedelta
-        from collections import defaultdict
-        
         pump_id = selected_pump.get('ma_may_bom')
         token = session.get('token') if session else None
-        
-        # Get logs from last 30 days
-        all_logs = []
-        for i in range(30):
-            query_date = (datetime.now() - timedelta(days=i)).strftime('%Y-%m-%d')
-            logs = get_pump_memory_logs(pump_id, limit=100, offset=0, token=token, date=query_date)
-            
-            if isinstance(logs, dict):
-                data = logs.get('data', [])
-            elif isinstance(logs, list):
-                data = logs
-            else:
-                data = []
-            
-            all_logs.extend(data)
-        
-        if not all_logs:
-            return [html.P("Không có hoạt động trong 30 ngày gần đây", className="text-muted text-center")]
-        
-        # Group logs by date
-        logs_by_date = defaultdict(list)
-        for log in all_logs:
-            # Use thoi_gian_bat if available, otherwise thoi_gian_tat
-            time_str = log.get('thoi_gian_bat') or log.get('thoi_gian_tat') or log.get('thoi_gian_tao', '')
-            if time_str:
-                # Extract date from timestamp (YYYY-MM-DD)
-                date_part = time_str.split('T')[0] if 'T' in time_str else time_str[:10]
-                logs_by_date[date_part].append(log)
-        
-        # Sort dates in descending order (newest first)
-        sorted_dates = sorted(logs_by_date.keys(), reverse=True)
-        
-        # Create timeline view
-        timeline_items = []
-        
-        for date_key in sorted_dates:
-            logs_for_date = logs_by_date[date_key]
-            # Sort logs by thoi_gian_bat (oldest first), then reverse to show newest first
-            logs_for_date = sorted(logs_for_date, key=lambda x: x.get('thoi_gian_bat') or x.get('thoi_gian_tat') or x.get('thoi_gian_tao', ''), reverse=True)
-            
-            if not logs_for_date:
-                continue
-            
-            # Parse and format date
-            try:
-                date_obj = datetime.strptime(date_key, '%Y-%m-%d')
-                # Format as "Thứ X, DD/MM/YYYY"
-                day_of_week = ['Thứ Hai', 'Thứ Ba', 'Thứ Tư', 'Thứ Năm', 'Thứ Sáu', 'Thứ Bảy', 'Chủ Nhật']
-                weekday = day_of_week[date_obj.weekday()]
-                formatted_date = f"{weekday}, {date_obj.strftime('%d/%m/%Y')}"
-            except:
-                formatted_date = date_key
-            
-            # Create timeline section for this date
-            total_logs = len(logs_for_date)
-            date_section = html.Div([
-                # Date header
-                html.Div([
-                    html.Span(formatted_date, style={
-                        'font-weight': '600',
-                        'color': '#333',
-                        'font-size': '0.95rem',
-                        'padding': '8px 0',
-                        'border-bottom': '2px solid #e9ecef',
-                        'width': '100%'
-                    })
-                ], style={'margin': '15px 0 10px 0'}),
-                
-                # List of events for this date
-                html.Div([
-                    *[
-                        html.Div([
-                            html.Div([
-                                html.Span(f"Lần {total_logs - idx}: ", style={'font-weight': '600', 'color': '#333'}),
-                                html.Span(' Bắt đầu:  ', style={'color': '#666'}),
-                                html.Span(
-                                    format_time_with_seconds(log.get('thoi_gian_bat', '')),
-                                    style={'color': '#28a745', 'font-weight': '500'}
-                                ),
-                                html.Span(' - Kết thúc: ', style={'color': '#666', 'margin': '0 4px'}),
-                                html.Span(
-                                    format_time_with_seconds(log.get('thoi_gian_tat', '')) if log.get('thoi_gian_tat') else '(Chưa tắt)',
-                                    style={'color': '#dc3545', 'font-weight': '500'}
-                                ),
-                            ], style={'display': 'flex', 'align-items': 'center', 'flex-wrap': 'wrap'}),
-                            # Duration row
-                            html.Div([
-                                html.Span(' Tổng thời gian: ', style={'color': '#666', 'font-size': '0.85rem'}),
-                                html.Span(
-                                    calculate_duration(log.get('thoi_gian_bat', ''), log.get('thoi_gian_tat', '')),
-                                    style={'color': '#007bff', 'font-weight': '500', 'font-size': '0.85rem'}
-                                ),
-                            ], style={'display': 'flex', 'align-items': 'center', 'margin-top': '4px'})
-                        ], style={'padding': '10px 0', 'border-bottom': '1px solid #f0f0f0'})
-                        for idx, log in enumerate(logs_for_date)
-                    ]
-                ])
-            ])
-            
-            timeline_items.append(date_section)
-        
-        return timeline_items
+        load_more = dash.callback_context.triggered_id == 'pump-history-modal-load-more'
+        return update_history_modal(load_more, pump_id, token, 30, cursor,
+                                    "Không có hoạt động trong 30 ngày gần đây")
         
     except Exception as e:
         print(f"Error fetching pump history modal: {e}")
         import traceback
         traceback.print_exc()
-        return [html.P("Lỗi tải dữ liệu", className="text-danger text-center")]
+        return [html.P("Lỗi tải dữ liệu", className="text-danger text-center")], None, HISTORY_HIDDEN
 
 @callback(
     Output('soil-moisture-date-picker', 'date'),
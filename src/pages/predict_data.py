@@ -7,10 +7,17 @@ import dash
 from datetime import datetime, timedelta
 import math
 import plotly.graph_objs as go
-from statistics import mean, pstdev
 from api.pump import list_pumps
-from api.sensor_data import get_data_by_pump
+from api.day_cache import local_now
+from api.sensor_data import get_data_by_date_range, iter_data_rows
 import random
+import uuid
+import numpy as np
+from api.downsample import CHART_MAX_POINTS, lttb_indices
+from api.forecast import forecast_cache
+from api.forecast_schedule import forecast_schedule
+from api.seasonal import seasonal_models
+from api.cache import caller_identity
 
 
 RANGE_TO_DAYS = {
@@ -32,7 +39,11 @@ FORECAST_OPTIONS = {
 DEFAULT_FORECAST_KEY = '60m'
 
 MAX_FETCH_LIMIT = 200
-MAX_FETCH_BATCHES = 5
+FALLBACK_FETCH_PAGES = 5
+# Số dòng gần nhất hiển thị trong bảng; chỉ các dòng này giữ bản ghi gốc ('raw') trong store.
+TABLE_ROWS = 50
+# Khoảng dữ liệu của các dự báo tính sẵn trong nền (api.forecast_schedule).
+SCHEDULE_RANGE = '7d'
 
 
 def create_empty_store(range_value: str = '7d', pump_id: Optional[str] = None, horizon_minutes: Optional[int] = None) -> Dict[str, Any]:
@@ -117,43 +128,6 @@ def parse_sensor_timestamp(item: Dict[str, Any]) -> Optional[datetime]:
     return None
 
 
-def calculate_series_stats(data):
-    flows = [float(item.get('flow_rate', 0)) for item in data if item.get('flow_rate') is not None]
-    if not flows:
-        return {
-            'flows': [],
-            'average': None,
-            'trend_pct': None,
-            'std_dev': 0.0,
-            'anomalies': 0
-        }
-    avg = mean(flows)
-    first = flows[0]
-    last = flows[-1]
-    trend_pct = ((last - first) / first * 100) if first else 0.0
-    std_dev = pstdev(flows) if len(flows) > 1 else 0.0
-    anomalies = sum(1 for value in flows if abs(value - avg) > std_dev * 2.5)
-    return {
-        'flows': flows,
-        'average': avg,
-        'trend_pct': trend_pct,
-        'std_dev': std_dev,
-        'anomalies': anomalies
-    }
-
-
-def derive_confidence_score(stats: Dict[str, Any]) -> float:
-    flows = stats.get('flows') or []
-    if not flows:
-        return 0.0
-    avg = stats.get('average') or 0.0
-    std_dev = stats.get('std_dev') or 0.0
-    variability_penalty = 0.0 if avg <= 0 else min(40.0, (std_dev / avg) * 45.0)
-    anomaly_penalty = min(25.0, (stats.get('anomalies') or 0) * 5.0)
-    confidence = 95.0 - variability_penalty - anomaly_penalty
-    return round(max(55.0, min(98.0, confidence)), 1)
-
-
 def trend_badge_props(trend_pct):
     if trend_pct is None:
         return 'Chưa có dữ liệu', 'secondary'
@@ -186,102 +160,9 @@ def anomaly_badge_props(count):
     return 'Cảnh báo bất thường', 'danger'
 
 
-# Tìm đến dòng định nghĩa hàm generate_forecast_values và thay thế bằng:
-def get_linear_coefficients(values: List[float]):
-    """Tính toán hệ số hồi quy tuyến tính y = ax + b"""
-    if not values:
-        return 0.0, 0.0
-    
-    n = len(values)
-    if n == 1:
-        return 0.0, values[-1]
-
-    x_vals = list(range(n))
-    sum_x = sum(x_vals)
-    sum_y = sum(values)
-    sum_xy = sum(x * y for x, y in zip(x_vals, values))
-    sum_x2 = sum(x * x for x in x_vals)
-    
-    denominator = n * sum_x2 - sum_x ** 2
-    if denominator == 0:
-        slope = 0.0
-    else:
-        slope = (n * sum_xy - sum_x * sum_y) / denominator
-        
-    intercept = (sum_y - slope * sum_x) / n
-    return slope, intercept
-
-
-def infer_sample_interval_seconds(times: List[datetime]) -> float:
-    if len(times) < 2:
-        return 300.0
-    diffs = []
-    for current, previous in zip(times[1:], times[:-1]):
-        delta = (current - previous).total_seconds()
-        if delta > 0:
-            diffs.append(delta)
-    if not diffs:
-        return 300.0
-    diffs.sort()
-    mid = len(diffs) // 2
-    if len(diffs) % 2 == 0:
-        median = (diffs[mid - 1] + diffs[mid]) / 2.0
-    else:
-        median = diffs[mid]
-    return max(60.0, min(3600.0, median))
-
-
-def fetch_pump_timeseries(pump_id: Optional[str], days: int, token: Optional[str]) -> List[Dict[str, Any]]:
-    if pump_id is None:
-        return []
-    try:
-        pump_id_int = int(pump_id)
-    except (TypeError, ValueError):
-        pump_id_int = pump_id
-
-    records: List[Dict[str, Any]] = []
-    offset = 0
-    batches = 0
-
-    while batches < MAX_FETCH_BATCHES:
-        response = get_data_by_pump(ma_may_bom=pump_id_int, limit=MAX_FETCH_LIMIT, offset=offset, token=token)
-        if isinstance(response, dict):
-            data_chunk = response.get('data') or []
-            total = response.get('total')
-        elif isinstance(response, list):
-            data_chunk = response
-            total = None
-        else:
-            data_chunk = []
-            total = None
-
-        if not isinstance(data_chunk, list):
-            data_chunk = [data_chunk]
-
-        if not data_chunk:
-            break
-
-        records.extend(data_chunk)
-
-        if total is not None:
-            try:
-                total_int = int(total)
-                if offset + MAX_FETCH_LIMIT >= total_int:
-                    break
-            except (TypeError, ValueError):
-                pass
-
-        if len(data_chunk) < MAX_FETCH_LIMIT:
-            break
-
-        offset += MAX_FETCH_LIMIT
-        batches += 1
-
-    if not records:
-        return []
-
+def _convert_sensor_rows(rows) -> List[Dict[str, Any]]:
     converted = []
-    for item in records:
+    for item in rows:
         timestamp = parse_sensor_timestamp(item)
         if not timestamp:
             continue
@@ -297,19 +178,41 @@ def fetch_pump_timeseries(pump_id: Optional[str], days: int, token: Optional[str
             'flow_rate': round(flow_value, 2),
             'raw': item
         })
+    return converted
 
-    if not converted:
+
+def fetch_pump_timeseries(pump_id: Optional[str], days: int, token: Optional[str]) -> List[Dict[str, Any]]:
+    if pump_id is None:
         return []
+    try:
+        pump_id_int = int(pump_id)
+    except (TypeError, ValueError):
+        pump_id_int = pump_id
 
-    converted.sort(key=lambda it: it['time'])
     end_time = datetime.now()
     start_time = end_time - timedelta(days=days)
+
+    # Theo ngày: các ngày đã qua được đọc từ kho cục bộ (api.sensor_store), chỉ hôm nay hỏi backend.
+    today = local_now().date()
+    history = get_data_by_date_range(today - timedelta(days=days), today, ma_may_bom=pump_id_int,
+                                     token=token, limit=None)
+    converted = _convert_sensor_rows(history.get('data') or [])
+
+    if not converted:
+        # Nothing inside the range: fall back to the most recent readings available.
+        converted = _convert_sensor_rows(iter_data_rows(
+            ma_may_bom=pump_id_int, token=token, page_size=MAX_FETCH_LIMIT, max_pages=FALLBACK_FETCH_PAGES
+        ))
+        if not converted:
+            return []
+        converted.sort(key=lambda it: it['time'])
+        return converted[-min(len(converted), 200):]
+
+    converted.sort(key=lambda it: it['time'])
     filtered = [it for it in converted if parse_iso_datetime(it['time']) >= start_time]
 
     if not filtered:
         filtered = converted[-min(len(converted), 200):]
-    elif len(filtered) > 400:
-        filtered = filtered[-400:]
 
     return filtered
 
@@ -336,6 +239,31 @@ def build_last_updated_text(timestamp: Optional[str]) -> str:
     return f'Cập nhật: {format_timestamp(timestamp)}'
 
 
+def schedule_forecasts(pump_ids: List[str], token: Optional[str]) -> None:
+    """Để luồng nền tính sẵn dự báo mọi horizon cho các máy bơm của phiên."""
+    days = RANGE_TO_DAYS[SCHEDULE_RANGE]
+    horizons = [opt['minutes'] for opt in FORECAST_OPTIONS.values()]
+    for pump_id in pump_ids:
+        forecast_schedule.watch(token, pump_id, lambda job_token, pump_id=pump_id: fetch_pump_timeseries(pump_id, days, job_token),
+                                horizons, rows=TABLE_ROWS)
+
+
+def serve_precomputed(store: Dict[str, Any], token: Optional[str], pump_value: Any) -> bool:
+    """Điền store từ dự báo tính sẵn (chỉ các dòng cuối cho bảng); False nếu chưa có hoặc đã cũ."""
+    if store.get('range_value') != SCHEDULE_RANGE:
+        return False
+    entry = forecast_schedule.get(token, pump_value)
+    if entry is None:
+        return False
+    store.update({
+        'series': [dict(point) for point in entry['rows']],
+        'last_updated': datetime.fromtimestamp(entry['updated']).isoformat(),
+        'version': entry['version'],
+        'precomputed': True,
+    })
+    return True
+
+
 layout = html.Div([
     create_navbar(is_authenticated=True),
     dbc.Container([
@@ -514,6 +442,7 @@ def load_pump_options(pathname, session_data, current_value):
     if not options:
         return [], None, {}
 
+    schedule_forecasts(list(meta), token)
     selected_value = current_value if current_value in meta else options[0]['value']
     return options, selected_value, meta
 
@@ -547,8 +476,9 @@ def refresh_predict_data(pathname, refresh_clicks, simulate_clicks, pump_value,
     ctx = dash.callback_context
     trigger = ctx.triggered[0]['prop_id'].split('.')[0] if ctx and ctx.triggered else None
 
-    if trigger == 'predict-forecast-select':
+    if trigger == 'predict-forecast-select' and (not store.get('precomputed') or forecast_cache.is_pinned(store.get('version'))):
         return store, build_last_updated_text(store.get('last_updated')), '', False
+    # Còn lại: store tính sẵn đã hết hạn (chỉ có các dòng cuối) nên lấy bản mới như khi tải trang.
 
     if trigger == 'predict-simulate-btn':
         now = datetime.now()
@@ -582,7 +512,8 @@ def refresh_predict_data(pathname, refresh_clicks, simulate_clicks, pump_value,
             sim_truth[h] = {'times': [tt.isoformat() for tt in times], 'values': values}
 
         last_updated = now.isoformat()
-        store.update({'series': series, 'last_updated': last_updated, 'simulated': True, 'sim_truth': sim_truth})
+        store.update({'series': series, 'last_updated': last_updated, 'simulated': True, 'sim_truth': sim_truth,
+                      'version': uuid.uuid4().hex, 'precomputed': False})
         return store, build_last_updated_text(last_updated), '', False
 
     if not pump_value:
@@ -592,6 +523,10 @@ def refresh_predict_data(pathname, refresh_clicks, simulate_clicks, pump_value,
     if session_data and isinstance(session_data, dict):
         token = session_data.get('token')
 
+    # Mở trang / đổi máy bơm: dùng dự báo luồng nền đã tính; nút "Tải dữ liệu" luôn tải lại từ API.
+    if trigger != 'predict-refresh-btn' and serve_precomputed(store, token, pump_value):
+        return store, build_last_updated_text(store['last_updated']), '', False
+
     try:
         days = RANGE_TO_DAYS.get(range_value, 7)
         series = fetch_pump_timeseries(pump_value, days, token)
@@ -599,6 +534,7 @@ def refresh_predict_data(pathname, refresh_clicks, simulate_clicks, pump_value,
         message = f'Lỗi khi tải dữ liệu: {exc}'
         store['series'] = []
         store['last_updated'] = None
+        store['version'] = None
         return store, '', message, True
 
     if not series:
@@ -634,53 +570,26 @@ def refresh_predict_data(pathname, refresh_clicks, simulate_clicks, pump_value,
             sim_truth[h] = {'times': [tt.isoformat() for tt in times], 'values': values}
 
         last_updated = now.isoformat()
-        store.update({'series': series, 'last_updated': last_updated, 'simulated': True, 'sim_truth': sim_truth})
+        store.update({'series': series, 'last_updated': last_updated, 'simulated': True, 'sim_truth': sim_truth,
+                      'version': uuid.uuid4().hex, 'precomputed': False})
         return store, build_last_updated_text(last_updated), '', False
 
+    # Bảng chỉ hiện các dòng cuối: bỏ bản ghi gốc của phần còn lại để store gửi qua trình duyệt nhỏ hơn.
+    for point in series[:-TABLE_ROWS]:
+        point.pop('raw', None)
+    # Mô hình mùa vụ theo ngày của máy bơm chỉ nhận các điểm mới kể từ lần tải trước (api.seasonal).
+    version = uuid.uuid4().hex
+    forecast_cache.attach_model(version, seasonal_models.update((caller_identity(token), str(pump_value)), series))
     last_updated = datetime.now().isoformat()
     store.update({
         'series': series,
-        'last_updated': last_updated
+        'last_updated': last_updated,
+        # Các callback đọc store dùng chung một kết quả dự báo theo phiên bản (api.forecast.forecast_cache).
+        'version': version,
+        'precomputed': False,
     })
     return store, build_last_updated_text(last_updated), '', False
 
-def calculate_ema_and_forecast(values: List[float], horizon_steps: int, alpha: float = 0.15):
-    """
-    Tính đường xu hướng (EMA) cho quá khứ và dự báo tương lai.
-    alpha: Hệ số làm mịn (0 < alpha < 1). Càng nhỏ càng mượt nhưng trễ hơn.
-    """
-    if not values:
-        return [], []
-
-    # 1. Tính EMA cho dữ liệu quá khứ (Fit line)
-    ema_values = []
-    current_ema = values[0]
-    for val in values:
-        current_ema = alpha * val + (1 - alpha) * current_ema
-        ema_values.append(current_ema) # Không làm tròn ở đây để giữ độ mượt
-
-    # 2. Tính dự báo tương lai (Forecast)
-    # Lấy độ dốc (trend) của vài điểm cuối cùng để phóng chiếu
-    if len(ema_values) >= 5:
-        last_vals = ema_values[-5:]
-        # Tính slope trung bình của 5 điểm cuối
-        slope = (last_vals[-1] - last_vals[0]) / 4 
-    else:
-        slope = 0
-    
-    last_val = ema_values[-1]
-    forecast_values = []
-    
-    # Tạo dự báo tuyến tính từ điểm cuối cùng
-    # (Nếu muốn dự báo hình sin thì cần thuật toán phức tạp hơn như FFT hoặc LSTM)
-    for i in range(1, horizon_steps + 1):
-        # Giảm dần độ dốc theo thời gian để dự báo không bị bay quá xa (Damping)
-        damped_slope = slope * (0.9 ** i) 
-        next_val = last_val + damped_slope * i
-        forecast_values.append(max(0.0, next_val))
-
-    return ema_values, forecast_values
-
 @callback(
     Output('predict-flow-chart', 'figure'),
     Input('predict-data-store', 'data')
@@ -689,8 +598,10 @@ def update_chart(data_store):
     store = data_store or {}
     data = store.get('series') or []
     fig = go.Figure()
+    result = forecast_cache.get(store, store.get('horizon_minutes') or get_horizon_minutes(DEFAULT_FORECAST_KEY)) \
+        if data else None
 
-    if not data:
+    if not result or not result['stats']['count']:
         fig.update_layout(
             plot_bgcolor='white',
             paper_bgcolor='white',
@@ -707,43 +618,29 @@ def update_chart(data_store):
         )
         return fig
 
-    # --- CHUẨN BỊ DỮ LIỆU ---
-    times = [parse_iso_datetime(point.get('time')) for point in data]
-    flows = [point.get('flow_rate', 0) for point in data]
-    
-    # Tính toán số bước dự báo cần thiết
-    horizon_minutes = store.get('horizon_minutes') or get_horizon_minutes(DEFAULT_FORECAST_KEY)
-    base_seconds = infer_sample_interval_seconds(times)
-    horizon_seconds = max(base_seconds, horizon_minutes * 60.0)
-    steps = int(math.ceil(horizon_seconds / base_seconds))
-    
-    # --- TÍNH TOÁN ĐƯỜNG XU HƯỚNG MỚI ---
-    # Sử dụng alpha=0.15 để đường line uốn lượn theo hình sin
-    fit_values, forecast_values = calculate_ema_and_forecast(flows, steps, alpha=0.7)
-
-    # Tạo mốc thời gian cho tương lai
+    # --- DỮ LIỆU & DỰ BÁO (tính một lần cho mỗi phiên bản store, dùng chung với các thẻ chỉ số) ---
+    times, flows, fit_values = result['times'], result['flows'], result['fit']
+    forecast_times, forecast_values = result['forecast_times'], result['forecast']
     last_time = times[-1]
-    start_offset = 30
-    forecast_times = [last_time + timedelta(seconds=start_offset + base_seconds * (step - 1)) for step in range(1, steps + 1)]
+
+    # Chuỗi dài (vd. 30 ngày mỗi phút) được giảm điểm bằng LTTB trước khi gửi xuống trình duyệt.
+    x_ns = times.asi8
+    actual_index = lttb_indices(x_ns, flows, CHART_MAX_POINTS)
+    fit_index = lttb_indices(x_ns, fit_values, CHART_MAX_POINTS)
 
     # --- VẼ BIỂU ĐỒ ---
-    
-    # Tính toán vùng tin cậy (dựa trên độ lệch chuẩn của dữ liệu gốc so với đường fit)
-    residuals = [abs(f - e) for f, e in zip(flows, fit_values)]
-    mean_res = sum(residuals) / len(residuals) if residuals else 0
-    std_res = pstdev(residuals) if len(residuals) > 1 else 0
-    confidence_interval = mean_res + 2 * std_res # 95% confidence
-
-    all_times = times + forecast_times
-    all_modeled = fit_values + forecast_values
-    
-    upper_band = [v + confidence_interval for v in all_modeled]
-    lower_band = [max(0.0, v - confidence_interval) for v in all_modeled]
+
+    # Vùng tin cậy: trung bình + 2 độ lệch chuẩn của phần dư |thực tế - fit|
+    confidence_interval = result['band']
+    all_times = times[fit_index].append(forecast_times)
+    all_modeled = np.concatenate([fit_values[fit_index], forecast_values])
+    upper_band = all_modeled + confidence_interval
+    lower_band = np.maximum(0.0, all_modeled - confidence_interval)
 
     # 1. Vùng tin cậy
     fig.add_trace(go.Scatter(
-        x=all_times + all_times[::-1],
-        y=upper_band + lower_band[::-1],
+        x=all_times.append(all_times[::-1]),
+        y=np.concatenate([upper_band, lower_band[::-1]]),
         fill='toself',
         fillcolor='rgba(26,115,232,0.1)',
         line=dict(color='rgba(0,0,0,0)'),
@@ -754,18 +651,18 @@ def update_chart(data_store):
 
     # 2. Dữ liệu thực tế
     fig.add_trace(go.Scatter(
-        x=times,
-        y=flows,
+        x=times[actual_index],
+        y=flows[actual_index],
         mode='lines+markers',
         name='Thực tế',
         line=dict(color='#34a853', width=2), # Giảm width chút cho thanh thoát
         marker=dict(size=5, color='#34a853')
     ))
 
-    # 3. Xu hướng hiện tại (FIT) - Đã sửa hết bậc thang
+    # 3. Xu hướng hiện tại (FIT)
     fig.add_trace(go.Scatter(
-        x=times,
-        y=[round(v, 4) for v in fit_values], # Làm tròn 4 chữ số
+        x=times[fit_index],
+        y=np.round(fit_values[fit_index], 4), # Làm tròn 4 chữ số
         mode='lines',
         name='Xu hướng (Smooth)',
         line=dict(color='#1a73e8', width=3),
@@ -775,7 +672,7 @@ def update_chart(data_store):
     # 4. Dự báo tương lai
     fig.add_trace(go.Scatter(
         x=forecast_times,
-        y=[round(v, 4) for v in forecast_values], # Làm tròn 4 chữ số
+        y=np.round(forecast_values, 4), # Làm tròn 4 chữ số
         mode='lines',
         name='Dự báo',
         line=dict(color='#1a73e8', dash='dash', width=3),
@@ -785,10 +682,10 @@ def update_chart(data_store):
     fig.add_vline(x=last_time, line_width=1, line_dash="dot", line_color="gray")
 
     # Annotation độ chính xác
-    stats = calculate_series_stats(data)
-    conf = derive_confidence_score(stats)
+    conf = result['confidence']
+    model_label = 'Holt-Winters theo ngày' if result['model'] == 'holt_winters' else 'EMA'
     fig.add_annotation(
-        text=f'Độ tin cậy mô hình: {conf:.1f}%',
+        text=f'Độ tin cậy mô hình: {conf:.1f}% · {model_label}',
         xref='paper', yref='paper',
         x=0.98, y=0.98,
         showarrow=False,
@@ -821,7 +718,7 @@ def render_table(data_store):
     if not data:
         return dbc.Alert('Chưa có dữ liệu để hiển thị', color='secondary', className='mb-0 bg-light border-0 text-muted')
     rows = []
-    for idx, d in enumerate(reversed(data[-50:]), start=1):
+    for idx, d in enumerate(reversed(data[-TABLE_ROWS:]), start=1):
         raw = d.get('raw') or {}
         soil = raw.get('do_am_dat')
         temp = raw.get('nhiet_do')
@@ -873,10 +770,10 @@ def render_table(data_store):
 )
 def update_metric_cards(data_store):
     store = data_store or {}
-    stats = calculate_series_stats(store.get('series') or [])
-    confidence = derive_confidence_score(stats)
+    result = forecast_cache.get(store, store.get('horizon_minutes') or get_horizon_minutes(DEFAULT_FORECAST_KEY))
+    stats, confidence = result['stats'], result['confidence']
 
-    if not stats['flows']:
+    if not stats['count']:
         return (
             '—',
             '—', 'Chưa có dữ liệu', 'secondary',
@@ -919,8 +816,8 @@ def update_pump_section(pump_value, meta_store, data_store):
     pump = meta_store.get(str(pump_value)) if pump_value is not None else None
     store = data_store or {}
     series = store.get('series') or []
-    stats = calculate_series_stats(series)
-    confidence = derive_confidence_score(stats)
+    result = forecast_cache.get(store, store.get('horizon_minutes') or get_horizon_minutes(DEFAULT_FORECAST_KEY))
+    stats, confidence = result['stats'], result['confidence']
 
     name = pump.get('ten_may_bom') if pump else '—'
     location = pump.get('mo_ta') if pump else None
@@ -941,7 +838,7 @@ def update_pump_section(pump_value, meta_store, data_store):
     last_update_text = format_timestamp(latest_timestamp)
 
     recommendations: List[dbc.ListGroupItem] = []
-    if stats['flows']:
+    if stats['count']:
         trend_label, _ = trend_badge_props(stats['trend_pct'])
         trend_pct = stats['trend_pct'] or 0.0
         icon = 'fas fa-arrow-up' if trend_pct >= 0 else 'fas fa-arrow-down'
@@ -0,0 +1,167 @@
+from typing import Dict, Any, List, Optional
+from dash import html, dcc, callback, Input, Output, State
+import dash_bootstrap_components as dbc
+from components.navbar import create_navbar
+from dash.exceptions import PreventUpdate
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+from api.pump import list_pumps
+from api.day_cache import local_now
+from api.sensor_data import get_frame_by_date_range
+from api.sensor_frame import LOCAL_TZ
+from api.forecast import align_frame, batch_forecast
+from pages.predict_data import (
+    FORECAST_OPTIONS, DEFAULT_FORECAST_KEY, build_stat_card, trend_badge_props, confidence_badge_props, anomaly_badge_props,
+)
+
+# Khoảng lịch sử (ngày) và bước lưới (giây) dùng để dự báo cho toàn bộ máy bơm.
+FLEET_RANGE_DAYS = 1
+FLEET_GRID_SECONDS = 300
+FLEET_MAX_PUMPS = 200
+
+
+def _pump_names(token: Optional[str]) -> Dict[str, str]:
+    try:
+        response = list_pumps(limit=FLEET_MAX_PUMPS, offset=0, token=token)
+    except Exception:
+        return {}
+    if isinstance(response, dict):
+        pumps = response.get('data') or []
+    elif isinstance(response, list):
+        pumps = response
+    else:
+        pumps = []
+    return {str(p.get('ma_may_bom')): p.get('ten_may_bom') or f"Máy bơm {p.get('ma_may_bom')}"
+            for p in pumps if isinstance(p, dict) and p.get('ma_may_bom') is not None}
+
+
+def _format_time(ns: int) -> str:
+    return pd.Timestamp(int(ns), unit='ns', tz='UTC').tz_convert(LOCAL_TZ).strftime('%H:%M %d/%m')
+
+
+def build_fleet_table(pumps: List[Any], names: Dict[str, str], grid: np.ndarray, result: Dict[str, Any]):
+    # Máy bơm nhiều điểm bất thường / độ tin cậy thấp lên đầu.
+    order = np.lexsort((result['confidence'], -result['anomalies']))
+    rows = []
+    for index in order:
+        if not result['count'][index]:
+            continue
+        pump_id = str(pumps[index])
+        trend_pct = float(result['trend_pct'][index])
+        trend_label, trend_color = trend_badge_props(trend_pct)
+        confidence = float(result['confidence'][index])
+        _, confidence_color = confidence_badge_props(confidence)
+        anomalies = int(result['anomalies'][index])
+        _, anomaly_color = anomaly_badge_props(anomalies)
+        band = float(result['band'][index])
+        rows.append(html.Tr([
+            html.Td(dcc.Link(names.get(pump_id) or f'Máy bơm {pump_id}', href=f'/pump/{pump_id}')),
+            html.Td(_format_time(grid[result['last_index'][index]]), className='text-muted'),
+            html.Td(f"{result['average'][index]:.1f}"),
+            html.Td(dbc.Badge(f'{trend_pct:+.1f}%', color=trend_color, title=trend_label)),
+            html.Td(dbc.Badge(f'{confidence:.1f}%', color=confidence_color)),
+            html.Td(dbc.Badge(str(anomalies), color=anomaly_color)),
+        ] + [
+            html.Td(f"{result['horizons'][key][index]:.1f} ± {band:.1f}") for key in FORECAST_OPTIONS
+        ], className='align-middle'))
+    table = dbc.Table(
+        [
+            html.Thead(html.Tr([
+                html.Th('Máy bơm'),
+                html.Th('Đo lần cuối'),
+                html.Th('TB (L/min)'),
+                html.Th('Xu hướng'),
+                html.Th('Độ tin cậy'),
+                html.Th('Bất thường'),
+            ] + [html.Th(opt['label']) for opt in FORECAST_OPTIONS.values()])),
+            html.Tbody(rows)
+        ],
+        bordered=False,
+        hover=True,
+        responsive=True,
+        size='sm',
+        className='mb-0'
+    )
+    return html.Div(table, style={'maxHeight': '640px', 'overflowY': 'auto'}, className='table-responsive')
+
+
+layout = html.Div([
+    create_navbar(is_authenticated=True),
+    dbc.Container([
+        dbc.Row([
+            dbc.Col([
+                html.Span('Hệ thống giám sát và dự báo dòng chảy nước', className='text-uppercase text-muted small fw-semibold'),
+                html.H2('Dự báo toàn bộ máy bơm', className='fw-bold mb-2'),
+                html.P(f'Dự báo lưu lượng của mọi máy bơm từ dữ liệu {FLEET_RANGE_DAYS * 24} giờ gần nhất, '
+                       f'gom theo bước {FLEET_GRID_SECONDS // 60} phút', className='text-muted mb-0')
+            ], md=8),
+            dbc.Col([
+                html.Div([
+                    dbc.Button('Tải dữ liệu', id='fleet-refresh-btn', color='primary', n_clicks=0, className='btn-sm'),
+                    html.Small(id='fleet-last-updated', className='text-muted ms-md-3')
+                ], className='d-flex flex-wrap align-items-center justify-content-md-end gap-2')
+            ], md=4)
+        ], className='mt-4 mb-3 g-3 align-items-center'),
+
+        dbc.Alert(id='fleet-alert', color='warning', is_open=False, className='mb-3'),
+
+        dbc.Row([
+            dbc.Col(build_stat_card('Máy bơm có dữ liệu', 'fleet-pump-count', 'Trong khoảng đã chọn', 'fas fa-water'), md=3),
+            dbc.Col(build_stat_card('Cần kiểm tra', 'fleet-anomaly-count', 'Máy bơm có điểm bất thường', 'fas fa-exclamation-circle'), md=3),
+            dbc.Col(build_stat_card('Độ tin cậy trung bình', 'fleet-confidence-value', 'Trên các máy bơm có dữ liệu', 'fas fa-shield-alt'), md=3),
+            dbc.Col(build_stat_card(f"Tổng lưu lượng {FORECAST_OPTIONS[DEFAULT_FORECAST_KEY]['label']} tới", 'fleet-forecast-total', 'L/min, cộng dự báo mọi máy bơm', 'fas fa-chart-line'), md=3)
+        ], className='g-3 mb-4'),
+
+        dbc.Card([
+            dbc.CardHeader(html.H6('Dự báo theo máy bơm', className='mb-0 fw-semibold')),
+            dbc.CardBody(dcc.Loading(type='dot', children=html.Div(id='fleet-table')))
+        ], className='shadow-sm mb-4'),
+    ], fluid=True)
+], className='page-container')
+
+
+@callback(
+    Output('fleet-table', 'children'),
+    Output('fleet-pump-count', 'children'),
+    Output('fleet-anomaly-count', 'children'),
+    Output('fleet-confidence-value', 'children'),
+    Output('fleet-forecast-total', 'children'),
+    Output('fleet-last-updated', 'children'),
+    Output('fleet-alert', 'children'),
+    Output('fleet-alert', 'is_open'),
+    Input('url', 'pathname'),
+    Input('fleet-refresh-btn', 'n_clicks'),
+    State('session-store', 'data')
+)
+def refresh_fleet(pathname, refresh_clicks, session_data):
+    if pathname != '/predict_fleet':
+        raise PreventUpdate
+    token = session_data.get('token') if isinstance(session_data, dict) else None
+
+    # Một truy vấn cho mọi máy bơm (các ngày đã qua đọc từ api.sensor_store), rồi dự báo cả ma trận một lượt.
+    now = local_now()
+    frame = get_frame_by_date_range((now - timedelta(days=FLEET_RANGE_DAYS)).date(), now.date(), token=token, limit=None)
+    start_ns = pd.Timestamp(now - timedelta(days=FLEET_RANGE_DAYS)).value
+    pumps, grid, matrix = align_frame(frame, FLEET_GRID_SECONDS, start_ns=start_ns)
+    updated = f"Cập nhật: {datetime.now().strftime('%H:%M:%S %d/%m/%Y')}"
+    alert = ''
+    if frame.meta.get('partial'):
+        alert = f"Chưa tải được dữ liệu ngày {', '.join(frame.meta.get('missing_days') or [])}; kết quả có thể thiếu."
+    if not pumps:
+        empty = dbc.Alert('Chưa có dữ liệu để hiển thị', color='secondary', className='mb-0 bg-light border-0 text-muted')
+        return empty, '0', '0', '—', '—', updated, alert, bool(alert)
+
+    result = batch_forecast(matrix, FLEET_GRID_SECONDS, {key: opt['minutes'] for key, opt in FORECAST_OPTIONS.items()})
+    has = result['count'] > 0
+    table = build_fleet_table(pumps, _pump_names(token), grid, result)
+    return (
+        table,
+        str(int(has.sum())),
+        str(int((result['anomalies'][has] > 0).sum())),
+        f"{result['confidence'][has].mean():.1f}%",
+        f"{np.nansum(result['horizons'][DEFAULT_FORECAST_KEY]):.1f}",
+        updated,
+        alert,
+        bool(alert),
+    )
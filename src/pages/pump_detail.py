@@ -5,7 +5,10 @@ from components.navbar import create_navbar
 from api.pump import get_pump
 from api.sensor import list_sensors
 from api.sensor_data import get_data_by_date
+from api.sensor_frame import decode_sensor_rows
 from api.pump import update_pump
+from api.events import PUSH_ENABLED
+from api.poller import live_pumps
 import plotly.graph_objs as go
 import dash
 import json
@@ -182,7 +185,7 @@ def create_layout():
             ], style={"margin-bottom": "24px"}),
             
             dcc.Store(id='pump-detail-page-store', storage_type='memory', data={'page': 1, 'limit': 15, 'total': 0}),
-            dcc.Interval(id='interval-component', interval=1000, n_intervals=0),
+            dcc.Interval(id='interval-component', interval=1000, n_intervals=0, disabled=PUSH_ENABLED),
             
             dcc.Store(id='pump-detail-showing-details', storage_type='memory', data=False),
             
@@ -266,7 +269,8 @@ def load_pump_detail(pathname, session_data):
         if session_data and isinstance(session_data, dict):
             token = session_data.get('token')
 
-        pump_data = get_pump(pump_id, token=token) or {}
+        snapshot = live_pumps.view(pump_id, token)
+        pump_data = snapshot['pump'] if snapshot else {}
 
         sensors_data = list_sensors(limit=1000, token=token)
         sensors = sensors_data.get('data', []) if sensors_data else []
@@ -389,28 +393,9 @@ def load_pump_sensor_data(selected_date, pump_store, page_store, show_details, s
             page = 1
 
     
-    try:
-        df = pd.DataFrame.from_records(pump_data_list)
-        if 'thoi_gian_tao' in df.columns:
-            df['thoi_gian_tao'] = pd.to_datetime(df['thoi_gian_tao'], errors='coerce')
-            try:
-                if df['thoi_gian_tao'].dt.tz is None:
-                    df['thoi_gian_tao'] = df['thoi_gian_tao'].dt.tz_localize('Asia/Bangkok')
-                else:
-                    df['thoi_gian_tao'] = df['thoi_gian_tao'].dt.tz_convert('Asia/Bangkok')
-            except Exception:
-                df['thoi_gian_tao'] = pd.to_datetime(df['thoi_gian_tao'], errors='coerce')
-        else:
-            df['thoi_gian_tao'] = pd.to_datetime(df.get('ngay'))
-
-        
-        for c in ['luu_luong_nuoc', 'do_am_dat', 'nhiet_do', 'do_am']:
-            if c in df.columns:
-                df[c] = pd.to_numeric(df[c], errors='coerce')
-
-        df = df.sort_values('thoi_gian_tao')
-    except Exception:
-        df = pd.DataFrame.from_records(pump_data_list)
+    frame = decode_sensor_rows(pump_data_list).sort_by_time()
+    chart_columns = [c for c in ('luu_luong_nuoc', 'do_am_dat', 'nhiet_do', 'do_am') if frame.has_column(c)]
+    df = frame.to_dataframe(tz='Asia/Bangkok', columns=chart_columns)
 
     
     fig = go.Figure()
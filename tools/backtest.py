@@ -0,0 +1,357 @@
+"""Backtest dự báo lưu lượng theo gốc dự báo trượt (rolling origin).
+
+    python tools/backtest.py                                   # chuỗi tổng hợp 14 ngày, mọi mô hình
+    python tools/backtest.py --synthetic sim --days 3 --interval 60
+    python tools/backtest.py --store .cache/sensor_store.sqlite3 --pump 1 --models ema,holt_winters
+    python tools/backtest.py --input series.json --step 12 --workers 4 --output backtest.json
+
+Tại mỗi gốc (cách nhau --step điểm, sau --warmup ngày đầu) mô hình chỉ thấy --history ngày
+dữ liệu trước gốc, dự báo mọi horizon trong FORECAST_OPTIONS một lượt rồi được so với giá trị
+thật trên cả đường dự báo. Kết quả theo mô hình và horizon: MAE, MAPE (bỏ các điểm thật bằng 0),
+tỉ lệ điểm thật nằm trong vùng tin cậy ±band và thời gian tính mỗi lần dự báo (mọi horizon).
+Các gốc được chia thành đoạn liên tiếp và chạy song song trên một process pool; riêng
+holt_winters_incremental chạy mọi gốc theo thứ tự trong một tiến trình (xem SEQUENTIAL_MODELS).
+
+Mô hình:
+    ema                      api.forecast.compute_forecasts (EMA + xu hướng tắt dần)
+    holt_winters             api.seasonal: khớp lại Holt-Winters từ đầu ở mỗi gốc
+    holt_winters_incremental api.seasonal.SeasonalModels giữ trạng thái giữa các gốc (như forecast_schedule)
+"""
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import json
+import os
+import sqlite3
+import statistics
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC = os.path.join(ROOT, 'src')
+LOCAL_TZ = 'Asia/Bangkok'
+MODELS = ('ema', 'holt_winters', 'holt_winters_incremental')
+# Mô hình giữ trạng thái giữa các gốc: chạy một đoạn duy nhất để trạng thái đi qua mọi gốc như
+# forecast_schedule trong thực tế (chia đoạn sẽ khởi động lại mô hình ở đầu mỗi đoạn).
+SEQUENTIAL_MODELS = ('holt_winters_incremental',)
+# Điểm dự báo cách điểm đo gần nhất quá số khoảng lấy mẫu này thì không chấm (chuỗi bị hở).
+MAX_GAP_INTERVALS = 2.0
+# |giá trị thật| nhỏ hơn ngưỡng này không tính vào MAPE.
+MAPE_FLOOR = 1e-6
+
+Series = List[Dict[str, Any]]
+
+
+def _import_api():
+    # api/__init__ nạp các module gọi HTTP; trỏ tới cổng không dùng để không vô tình gọi mạng.
+    os.environ.setdefault('URL_API_BASE', 'http://127.0.0.1:9/api/v1')
+    if SRC not in sys.path:
+        sys.path.insert(0, SRC)
+    from api import forecast, seasonal
+    return forecast, seasonal
+
+
+def forecast_horizons() -> Dict[str, float]:
+    """{khoá: phút} của FORECAST_OPTIONS trên trang dự đoán."""
+    _import_api()
+    cwd = os.getcwd()
+    os.chdir(SRC)
+    try:
+        import contextlib
+        import io
+        with contextlib.redirect_stdout(io.StringIO()):
+            from pages.predict_data import FORECAST_OPTIONS
+    finally:
+        os.chdir(cwd)
+    return {key: float(opt['minutes']) for key, opt in FORECAST_OPTIONS.items()}
+
+
+# ---------------------------------------------------------------- nguồn dữ liệu
+
+def synthetic_series(kind: str, days: float, interval: int, seed: int) -> Series:
+    """Chuỗi tổng hợp theo giờ Asia/Bangkok.
+
+    irrigation: nền 5 L/min, hai đợt tưới mỗi ngày (06:00-07:55 và 16:48-18:00);
+    daily: dao động hình sin theo ngày như tools/fake_backend;
+    sim: công thức của nhánh mô phỏng trên trang dự đoán (chu kỳ 60 mẫu).
+    """
+    rng = np.random.default_rng(seed)
+    n = int(days * 86_400 / interval)
+    start = pd.Timestamp.now(tz=LOCAL_TZ).floor('D') - pd.Timedelta(days=days)
+    times = start + pd.to_timedelta(np.arange(n) * interval, unit='s')
+    day = ((times.hour * 3600 + times.minute * 60 + times.second) / 86_400.0).to_numpy()
+    if kind == 'irrigation':
+        values = 5.0 + np.where((day > 0.25) & (day < 0.33), 20.0, 0.0) \
+            + np.where((day > 0.70) & (day < 0.75), 15.0, 0.0) + rng.normal(0, 0.5, n)
+    elif kind == 'daily':
+        values = 12 + 6 * np.sin((day * 24 - 6) / 24 * 2 * np.pi) + rng.normal(0, 1.5, n)
+    elif kind == 'sim':
+        values = 0.425 + 0.175 * np.sin(2 * np.pi * (np.arange(n) % 60) / 60) + rng.normal(0, 0.03, n)
+    else:
+        raise ValueError(f'Chuỗi tổng hợp không hỗ trợ: {kind}')
+    values = np.round(np.maximum(0.0, values), 4)
+    return [{'time': t.isoformat(), 'flow_rate': float(v)} for t, v in zip(times, values)]
+
+
+def store_series(path: str, pump: str, scope: Optional[str] = None, column: str = 'luu_luong_nuoc') -> Series:
+    """Chuỗi của một máy bơm đọc thẳng từ file SQLite của api.sensor_store (không gọi backend)."""
+    with sqlite3.connect(f'file:{path}?mode=ro', uri=True) as conn:
+        if scope is None:
+            row = conn.execute('SELECT scope FROM readings WHERE ma_may_bom = ? GROUP BY scope '
+                               'ORDER BY COUNT(*) DESC LIMIT 1', (str(pump),)).fetchone()
+            if row is None:
+                return []
+            scope = row[0]
+        rows = conn.execute(f'SELECT ts, {column} FROM readings WHERE scope = ? AND ma_may_bom = ? '
+                            f'AND {column} IS NOT NULL ORDER BY ts', (scope, str(pump))).fetchall()
+    if not rows:
+        return []
+    ts = np.array([r[0] for r in rows], dtype=np.int64)
+    times = pd.to_datetime(ts, unit='ns', utc=True).tz_convert(LOCAL_TZ)
+    return [{'time': t.isoformat(), 'flow_rate': float(r[1])} for t, r in zip(times, rows)]
+
+
+def file_series(path: str) -> Series:
+    """Chuỗi từ file JSON: danh sách [{'time', 'flow_rate'}, ...] hoặc predict-data-store ({'series': [...]})."""
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        data = data.get('series') or []
+    return [p for p in data if isinstance(p, dict)]
+
+
+def clean_series(series: Series) -> Tuple[Series, np.ndarray, np.ndarray]:
+    """(chuỗi đã sắp theo thời gian, thời gian ns, giá trị) chỉ gồm các điểm hợp lệ."""
+    forecast, _ = _import_api()
+    flows = pd.to_numeric(pd.Series([p.get('flow_rate') for p in series], dtype='object'), errors='coerce')
+    flows = flows.to_numpy(dtype=np.float64, na_value=np.nan)
+    times = forecast.parse_times([p.get('time') for p in series])
+    keep = np.flatnonzero(np.isfinite(flows) & ~times.isna())
+    ns = times.asi8[keep]
+    order = np.argsort(ns, kind='stable')
+    keep, ns = keep[order], ns[order]
+    return [series[i] for i in keep.tolist()], ns, flows[keep]
+
+
+def rolling_origins(ns: np.ndarray, warmup_days: float, step: int, max_origins: Optional[int] = None) -> List[int]:
+    """Chỉ số các gốc dự báo: sau warmup_days, cách nhau `step` điểm, chừa đủ dữ liệu thật phía sau."""
+    if ns.shape[0] < 2:
+        return []
+    first = int(np.searchsorted(ns, ns[0] + int(warmup_days * 86_400e9)))
+    origins = list(range(max(first, 1), ns.shape[0] - 1, max(step, 1)))
+    if max_origins and len(origins) > max_origins:
+        origins = origins[len(origins) - max_origins:]
+    return origins
+
+
+# ---------------------------------------------------------------- tiến trình con
+
+_STATE: Dict[str, Any] = {}
+
+
+def _init_worker(series: Series, ns: np.ndarray, values: np.ndarray, horizons: Dict[str, float],
+                 history_days: float, model: str) -> None:
+    forecast, seasonal = _import_api()
+    interval = forecast.sample_interval_seconds(ns)
+    _STATE.update(series=series, ns=ns, values=values, horizons=horizons, model=model,
+                  history_ns=int(history_days * 86_400e9), max_gap_ns=int(MAX_GAP_INTERVALS * interval * 1e9),
+                  predict=_make_model(model, forecast, seasonal))
+    # Chạy thử một lần để các import lười của pandas không rơi vào thời gian của gốc đầu tiên.
+    forecast.compute_forecasts(series[:16], list(horizons.values()))
+
+
+def _make_model(name: str, forecast, seasonal) -> Callable[[Series, Sequence[float]], Dict[float, Dict[str, Any]]]:
+    if name == 'ema':
+        return lambda window, horizons: forecast.compute_forecasts(window, horizons)
+    if name == 'holt_winters':
+        def predict(window, horizons):
+            model = seasonal.SeasonalModels(max_entries=1).update('backtest', window)
+            return forecast.compute_forecasts(window, horizons, seasonal=model) if model is not None else {}
+        return predict
+    if name == 'holt_winters_incremental':
+        models = seasonal.SeasonalModels(max_entries=1)
+
+        def predict(window, horizons):
+            model = models.update('backtest', window)
+            return forecast.compute_forecasts(window, horizons, seasonal=model) if model is not None else {}
+        return predict
+    raise ValueError(f'Mô hình không hỗ trợ: {name}')
+
+
+def _empty_totals() -> Dict[str, float]:
+    return {'points': 0, 'abs_error': 0.0, 'ape': 0.0, 'ape_points': 0, 'covered': 0, 'forecasts': 0}
+
+
+def run_chunk(origins: Sequence[int]) -> Dict[str, Any]:
+    """Chạy một đoạn gốc liên tiếp: tổng sai số theo horizon và thời gian (giây) mỗi lần dự báo."""
+    series, ns, values = _STATE['series'], _STATE['ns'], _STATE['values']
+    horizons, predict = _STATE['horizons'], _STATE['predict']
+    totals = {key: _empty_totals() for key in horizons}
+    timings: List[float] = []
+    skipped = 0
+    minutes = list(horizons.values())
+    for origin in origins:
+        start = int(np.searchsorted(ns, ns[origin] - _STATE['history_ns']))
+        window = series[start:origin + 1]
+        began = time.perf_counter()
+        results = predict(window, minutes)
+        elapsed = time.perf_counter() - began
+        if not results:
+            skipped += 1
+            continue
+        timings.append(elapsed)
+        for key, h in horizons.items():
+            result = results[float(h)]
+            predicted = np.asarray(result['forecast'], dtype=np.float64)
+            if not predicted.shape[0]:
+                continue
+            at = pd.DatetimeIndex(result['forecast_times']).asi8
+            # Giá trị thật: nội suy tuyến tính giữa hai điểm đo kề nhau; bỏ điểm nằm ngoài chuỗi hoặc chỗ hở.
+            right = np.clip(np.searchsorted(ns, at), 1, ns.shape[0] - 1)
+            nearest = np.minimum(np.abs(at - ns[right - 1]), np.abs(ns[right] - at))
+            valid = (at > ns[origin]) & (at <= ns[-1]) & (nearest <= _STATE['max_gap_ns'])
+            if not valid.any():
+                continue
+            actual = np.interp(at[valid], ns, values)
+            error = np.abs(predicted[valid] - actual)
+            positive = np.abs(actual) > MAPE_FLOOR
+            total = totals[key]
+            total['points'] += int(valid.sum())
+            total['abs_error'] += float(error.sum())
+            total['ape'] += float((error[positive] / np.abs(actual[positive])).sum())
+            total['ape_points'] += int(positive.sum())
+            total['covered'] += int((error <= float(result['band'])).sum())
+            total['forecasts'] += 1
+    return {'totals': totals, 'timings': timings, 'skipped': skipped}
+
+
+# ---------------------------------------------------------------- tổng hợp
+
+def _chunks(origins: Sequence[int], parts: int) -> List[List[int]]:
+    size = max(1, -(-len(origins) // max(parts, 1)))
+    return [list(origins[i:i + size]) for i in range(0, len(origins), size)]
+
+
+def backtest_model(model: str, series: Series, ns: np.ndarray, values: np.ndarray, origins: Sequence[int],
+                   horizons: Dict[str, float], history_days: float, workers: int) -> Dict[str, Any]:
+    """Chạy một mô hình trên mọi gốc bằng process pool và gộp kết quả các đoạn."""
+    if model in SEQUENTIAL_MODELS:
+        chunks, workers = [list(origins)], 1
+    else:
+        # Chia 4 đoạn mỗi tiến trình cho đều tải.
+        chunks = _chunks(origins, workers * 4)
+    began = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(series, ns, values, horizons, history_days, model)) as pool:
+        parts = list(pool.map(run_chunk, chunks))
+    wall = time.perf_counter() - began
+
+    timings = [t for part in parts for t in part['timings']]
+    by_horizon = {}
+    for key, h in horizons.items():
+        total = _empty_totals()
+        for part in parts:
+            for name, value in part['totals'][key].items():
+                total[name] += value
+        points = total['points']
+        by_horizon[key] = {
+            'minutes': h,
+            'forecasts': total['forecasts'],
+            'points': points,
+            'mae': round(total['abs_error'] / points, 6) if points else None,
+            'mape_pct': round(100 * total['ape'] / total['ape_points'], 3) if total['ape_points'] else None,
+            'coverage_pct': round(100 * total['covered'] / points, 2) if points else None,
+        }
+    return {
+        'origins': len(origins),
+        'skipped': sum(part['skipped'] for part in parts),
+        'ms_per_forecast': {
+            'mean': round(1000 * statistics.fmean(timings), 3) if timings else None,
+            'median': round(1000 * statistics.median(timings), 3) if timings else None,
+            'p95': round(1000 * float(np.percentile(timings, 95)), 3) if timings else None,
+        },
+        'wall_s': round(wall, 3),
+        'horizons': by_horizon,
+    }
+
+
+def print_report(results: Dict[str, Any]) -> None:
+    print(f"\n{'mô hình':26s} {'horizon':>8s} {'MAE':>10s} {'MAPE %':>9s} {'phủ %':>7s} {'điểm':>9s}")
+    for model, result in results.items():
+        for key, row in result['horizons'].items():
+            fmt = lambda v, spec: format(v, spec) if v is not None else '—'
+            print(f"{model:26s} {key:>8s} {fmt(row['mae'], '10.4f'):>10s} {fmt(row['mape_pct'], '9.2f'):>9s} "
+                  f"{fmt(row['coverage_pct'], '7.1f'):>7s} {row['points']:>9d}")
+        ms = result['ms_per_forecast']
+        print(f"{model:26s} {result['origins']} gốc ({result['skipped']} bỏ qua), "
+              f"{ms['median']} ms/lần dự báo (trung vị), p95 {ms['p95']} ms, {result['wall_s']} s\n")
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Backtest các mô hình dự báo lưu lượng theo gốc trượt')
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--synthetic', choices=('irrigation', 'daily', 'sim'), default='irrigation',
+                        help='chuỗi tổng hợp (mặc định khi không có --store/--input)')
+    source.add_argument('--store', default=None, help='file SQLite của api.sensor_store (API_SENSOR_STORE_PATH)')
+    source.add_argument('--input', default=None, help='file JSON [{time, flow_rate}, ...] hoặc predict-data-store')
+    parser.add_argument('--pump', default=None, help='mã máy bơm khi đọc từ --store')
+    parser.add_argument('--scope', default=None, help='scope trong --store (mặc định: scope có nhiều dòng nhất)')
+    parser.add_argument('--days', type=float, default=14.0, help='độ dài chuỗi tổng hợp (ngày)')
+    parser.add_argument('--interval', type=int, default=300, help='bước lấy mẫu của chuỗi tổng hợp (giây)')
+    parser.add_argument('--models', default=','.join(MODELS))
+    parser.add_argument('--history', type=float, default=7.0, help='số ngày dữ liệu mô hình thấy ở mỗi gốc')
+    parser.add_argument('--warmup', type=float, default=2.0, help='bỏ qua gốc trong số ngày đầu chuỗi')
+    parser.add_argument('--step', type=int, default=12, help='khoảng cách giữa các gốc (số điểm)')
+    parser.add_argument('--max-origins', type=int, default=None, help='chỉ giữ số gốc cuối cùng này')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--output', default='backtest_results.json')
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> Dict[str, Any]:
+    args = parse_args(argv)
+    if args.store:
+        if args.pump is None:
+            raise SystemExit('--store cần --pump')
+        source = {'store': args.store, 'pump': args.pump, 'scope': args.scope}
+        raw = store_series(args.store, args.pump, args.scope)
+    elif args.input:
+        source = {'input': args.input}
+        raw = file_series(args.input)
+    else:
+        source = {'synthetic': args.synthetic, 'days': args.days, 'interval': args.interval, 'seed': args.seed}
+        raw = synthetic_series(args.synthetic, args.days, args.interval, args.seed)
+
+    series, ns, values = clean_series(raw)
+    horizons = forecast_horizons()
+    origins = rolling_origins(ns, args.warmup, args.step, args.max_origins)
+    models = [m.strip() for m in args.models.split(',') if m.strip()]
+    print(f'{len(series)} điểm, {len(origins)} gốc, horizon {", ".join(horizons)}, {args.workers} tiến trình', flush=True)
+
+    results = {}
+    for model in models:
+        if model not in MODELS:
+            raise SystemExit(f'Mô hình không hỗ trợ: {model} (chọn trong {", ".join(MODELS)})')
+        results[model] = backtest_model(model, series, ns, values, origins, horizons, args.history, args.workers)
+        print(f"{model}: xong sau {results[model]['wall_s']} s", flush=True)
+    print_report(results)
+
+    report = {
+        'source': source,
+        'points': len(series),
+        'config': {'history_days': args.history, 'warmup_days': args.warmup, 'step': args.step,
+                   'workers': args.workers, 'horizons': horizons},
+        'results': results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f'Đã ghi {args.output}')
+    return report
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,298 @@
+"""Microbenchmark cho các hàm xử lý dữ liệu thuần (không gọi mạng).
+
+    python tools/bench.py                          # 1k/10k/100k/1M dòng, ghi bench_results.json
+    python tools/bench.py --sizes 1000,10000 --only predict
+    python tools/bench.py --output new.json --compare bench_results.json
+
+Mỗi trường hợp chạy lặp tới khi đủ --min-time giây (tối thiểu --repeat lần) và
+ghi lại thời gian nhỏ nhất / trung vị / trung bình cùng số dòng mỗi giây. Khi
+một kích thước chạy quá --budget giây, các kích thước lớn hơn của cùng trường
+hợp bị bỏ qua (ghi 'skipped').
+"""
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from datetime import datetime, timedelta, timezone
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC = os.path.join(ROOT, 'src')
+DEFAULT_SIZES = (1_000, 10_000, 100_000, 1_000_000)
+LOCAL_TZ = timezone(timedelta(hours=7))
+
+Case = Tuple[str, Callable[[int, random.Random], Any], Callable[[Any], Any]]
+
+
+def _import_pages():
+    # Các trang gọi API lúc import; trỏ tới cổng không dùng để lỗi nhanh.
+    os.environ.setdefault('URL_API_BASE', 'http://127.0.0.1:9/api/v1')
+    if SRC not in sys.path:
+        sys.path.insert(0, SRC)
+    cwd = os.getcwd()
+    os.chdir(SRC)
+    try:
+        import contextlib
+        import io
+        with contextlib.redirect_stdout(io.StringIO()):
+            from pages import home, predict_data
+            from pages.admin import admin_users, admin_devices
+            from api import forecast, seasonal, sensor_frame
+    finally:
+        os.chdir(cwd)
+    return home, predict_data, admin_users, admin_devices, sensor_frame, forecast, seasonal
+
+
+# ---------------------------------------------------------------- inputs
+
+def _timestamps(n: int, step_seconds: float = 60.0) -> List[datetime]:
+    start = datetime(2025, 1, 1, tzinfo=LOCAL_TZ)
+    return [start + timedelta(seconds=i * step_seconds) for i in range(n)]
+
+
+def make_sensor_body(n: int, rng: random.Random) -> bytes:
+    start = datetime(2025, 1, 1)
+    rows = []
+    for i in range(n):
+        rows.append({
+            'ma_du_lieu': i, 'ma_may_bom': 1 + i % 20, 'ma_nguoi_dung': 1, 'ngay': '2025-01-01',
+            'luu_luong_nuoc': round(rng.uniform(0, 30), 2), 'do_am_dat': round(rng.uniform(20, 80), 2),
+            'nhiet_do': round(rng.uniform(20, 38), 2), 'do_am': round(rng.uniform(40, 95), 2),
+            'mua': rng.randint(0, 1), 'so_xung': rng.randint(0, 500), 'tong_the_tich': round(rng.uniform(0, 99), 2),
+            'thoi_gian_tao': (start + timedelta(seconds=i * 5)).strftime('%Y-%m-%dT%H:%M:%S'), 'ghi_chu': '',
+        })
+    return json.dumps({'data': rows, 'total': n}).encode('utf-8')
+
+
+def make_flow_series(n: int, rng: random.Random) -> List[Dict[str, Any]]:
+    return [{'flow_rate': rng.uniform(5, 25)} for _ in range(n)]
+
+
+def make_forecast_series(n: int, rng: random.Random) -> List[Dict[str, Any]]:
+    return [{'time': t.isoformat(), 'flow_rate': rng.uniform(5, 25)} for t in _timestamps(n)]
+
+
+def make_seasonal_series(n: int, rng: random.Random) -> List[Dict[str, Any]]:
+    return [{'time': t.isoformat(), 'flow_rate': rng.uniform(5, 25)} for t in _timestamps(n, 300.0)]
+
+
+def make_fleet_matrix(n: int, rng: random.Random):
+    # n ô chia cho 200 máy bơm, ~5% ô thiếu dữ liệu.
+    import numpy as np
+    values = np.array([rng.uniform(5, 25) for _ in range(n)]).reshape(200, -1) if n >= 200 else np.empty((0, 0))
+    values[np.array([rng.random() < 0.05 for _ in range(values.size)]).reshape(values.shape)] = np.nan
+    return values
+
+
+def make_values(n: int, rng: random.Random) -> List[float]:
+    return [rng.uniform(5, 25) for _ in range(n)]
+
+
+def make_datetime_strings(n: int, rng: random.Random) -> List[str]:
+    formats = ('%Y-%m-%dT%H:%M:%S', '%Y-%m-%dT%H:%M:%SZ', '%Y-%m-%d %H:%M:%S', '%d/%m/%Y %H:%M:%S', '%Y-%m-%d')
+    start = datetime(2025, 1, 1)
+    return [(start + timedelta(seconds=i * 7)).strftime(formats[i % len(formats)]) for i in range(n)]
+
+
+def make_users(n: int, rng: random.Random) -> List[Dict[str, Any]]:
+    now = datetime.utcnow()
+    return [{
+        'ma_nguoi_dung': i, 'ten_dang_nhap': f'user{i}', 'ho_ten': f'Nguyễn Văn {i}',
+        'so_dien_thoai': f'09{i:08d}', 'dia_chi': rng.choice(['Hà Nội', 'Huế', 'Đà Nẵng', 'TP HCM']),
+        'trang_thai': rng.random() > 0.3, 'quan_tri_vien': i % 50 == 0,
+        'thoi_gian_tao': (now - timedelta(days=rng.randint(0, 400))).isoformat(),
+        'dang_nhap_lan_cuoi': now.isoformat(), 'tong_may_bom': rng.randint(0, 5), 'tong_cam_bien': rng.randint(0, 20),
+    } for i in range(1, n + 1)]
+
+
+def make_user_rows(n: int, rng: random.Random) -> List[Dict[str, Any]]:
+    now = datetime.utcnow()
+    return [{
+        'fullname': f'Nguyễn Văn {i}', 'phone': f'09{i:08d}', 'address': rng.choice(['Hà Nội', 'Huế', 'Đà Nẵng']),
+        'is_admin': i % 50 == 0, 'active': rng.random() > 0.3,
+        'created_at': now - timedelta(days=rng.randint(0, 400)),
+    } for i in range(n)]
+
+
+def make_devices(n: int, rng: random.Random) -> Dict[str, Any]:
+    sensors, pumps = [], []
+    for i in range(1, n + 1):
+        owner = {'ma_nguoi_dung': i % 97, 'ho_ten': f'Người dùng {i % 97}'}
+        pumps.append({'ma_may_bom': i, 'ten_may_bom': f'Máy bơm {i}', 'trang_thai': rng.random() > 0.5,
+                      'nguoi_dung': owner, 'mo_ta': '1000W', 'thoi_gian_tao': '2025-01-01T00:00:00'})
+        sensors.append({
+            'ma_cam_bien': i, 'ten_cam_bien': f'Cảm biến {i}', 'trang_thai': rng.random() > 0.2,
+            'loai_cam_bien': {'ma_loai_cam_bien': 1 + i % 5, 'ten_loai_cam_bien': f'Loại {1 + i % 5}'},
+            'nguoi_dung': owner, 'may_bom': {'ma_may_bom': i, 'ten_may_bom': f'Máy bơm {i}'},
+            'ngay_lap_dat': '2025-01-01', 'thoi_gian_cap_nhat': '2025-01-02T08:30:00.123Z',
+        })
+    return {'sensors': sensors, 'pumps': pumps}
+
+
+def build_cases() -> List[Case]:
+    home, predict_data, admin_users, admin_devices, sensor_frame, forecast, seasonal = _import_pages()
+
+    def fetch_sensor_data(body: bytes):
+        # Thay lời gọi mạng bằng body đã chuẩn bị; xoá memo để đo cả bước giải mã.
+        sensor_frame._memo.clear()
+        original = home.get_frame_by_date
+        home.get_frame_by_date = lambda date_str, token=None: sensor_frame.decode_sensor_body(body)
+        try:
+            return home.fetch_sensor_data(None, '2025-01-01')
+        finally:
+            home.get_frame_by_date = original
+
+    def make_seasonal_state(n: int, rng: random.Random):
+        series = make_seasonal_series(n, rng)
+        state = seasonal.SeasonalModels().update('bench', series[:-12])
+        return state, series
+
+    def seasonal_update(data):
+        state, series = data
+        models = seasonal.SeasonalModels()
+        if state is not None:
+            models._states['bench'] = state.copy()
+        return models.update('bench', series)
+
+    return [
+        ('home.fetch_sensor_data', make_sensor_body, fetch_sensor_data),
+        # Các hàm dự báo đã chuyển sang api.forecast (NumPy); giữ tên case để so sánh với kết quả cũ.
+        ('predict.calculate_series_stats', make_flow_series,
+         lambda series: forecast.series_stats([p['flow_rate'] for p in series])),
+        ('predict.get_linear_coefficients', make_values, forecast.linear_coefficients),
+        ('predict.calculate_ema_and_forecast', make_values,
+         lambda values: forecast.damped_forecast(forecast.ema(values, 0.7), 12)),
+        ('predict.infer_sample_interval_seconds', lambda n, rng: _timestamps(n),
+         lambda times: forecast.sample_interval_seconds(forecast.parse_times(times).asi8)),
+        ('predict.compute_forecast', make_forecast_series,
+         lambda series: forecast.compute_forecast(series, 60)),
+        ('forecast.batch_forecast', make_fleet_matrix,
+         lambda values: forecast.batch_forecast(values, 300, {'60m': 60, '24h': 1440})),
+        # Khớp Holt-Winters từ đầu (lưới 5 phút) và cập nhật tăng dần với 12 điểm mới.
+        ('seasonal.fit', make_seasonal_series, lambda series: seasonal.SeasonalModels().update('bench', series)),
+        ('seasonal.update', make_seasonal_state, seasonal_update),
+        ('predict.parse_any_datetime', make_datetime_strings,
+         lambda values: [predict_data.parse_any_datetime(v) for v in values]),
+        ('admin_users.apply_user_filters', make_user_rows,
+         lambda rows: admin_users.apply_user_filters(rows, 'nguyễn', 'all', 'active', None)),
+        ('admin_users.render_users_dashboard', make_users,
+         lambda users: admin_users.render_users_dashboard(users, {'page': 1}, {'search': '', 'role': 'all',
+                                                                             'status': 'all'})),
+        ('admin_devices.create_sensors_table', make_devices,
+         lambda data: admin_devices.create_sensors_table(data, search_value='cảm')),
+        ('admin_devices.create_pumps_table', make_devices,
+         lambda data: admin_devices.create_pumps_table(data, search_value='máy')),
+    ]
+
+
+# ---------------------------------------------------------------- runner
+
+def time_case(fn: Callable[[Any], Any], data: Any, repeat: int, min_time: float) -> List[float]:
+    timings: List[float] = []
+    total = 0.0
+    while len(timings) < repeat or total < min_time:
+        gc.collect()
+        started = time.perf_counter()
+        fn(data)
+        elapsed = time.perf_counter() - started
+        timings.append(elapsed)
+        total += elapsed
+        if len(timings) >= 1000:
+            break
+    return timings
+
+
+def run(sizes: List[int], only: Optional[str], repeat: int, min_time: float, budget: float,
+        seed: int) -> Dict[str, Dict[str, Any]]:
+    results: Dict[str, Dict[str, Any]] = {}
+    for name, make_input, fn in build_cases():
+        if only and only not in name:
+            continue
+        results[name] = {}
+        too_slow = False
+        for size in sizes:
+            if too_slow:
+                results[name][str(size)] = {'skipped': True}
+                continue
+            data = make_input(size, random.Random(seed))
+            timings = time_case(fn, data, repeat, min_time)
+            best = min(timings)
+            results[name][str(size)] = {
+                'runs': len(timings),
+                'min_s': round(best, 6),
+                'median_s': round(statistics.median(timings), 6),
+                'mean_s': round(statistics.fmean(timings), 6),
+                'rows_per_s': round(size / best, 1) if best else None,
+            }
+            print(f'{name:42s} {size:>9d} rows  min {best * 1000:10.2f} ms  ({len(timings)} runs)', flush=True)
+            too_slow = best > budget
+            del data
+    return results
+
+
+def environment() -> Dict[str, Any]:
+    info = {'python': platform.python_version(), 'platform': platform.platform(),
+            'timestamp': datetime.now(timezone.utc).isoformat()}
+    for module in ('numpy', 'pandas', 'dash'):
+        try:
+            info[module] = __import__(module).__version__
+        except Exception:
+            info[module] = None
+    try:
+        info['commit'] = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                                        text=True, timeout=10).stdout.strip() or None
+    except Exception:
+        info['commit'] = None
+    return info
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]) -> None:
+    print('\nSo sánh với baseline (min_s, <1 là nhanh hơn):')
+    for name, by_size in current['results'].items():
+        for size, stats in by_size.items():
+            base = baseline.get('results', {}).get(name, {}).get(size)
+            if not base or 'min_s' not in base or 'min_s' not in stats or not base['min_s']:
+                continue
+            ratio = stats['min_s'] / base['min_s']
+            print(f'{name:42s} {int(size):>9d}  {ratio:6.2f}x  ({base["min_s"]:.4f}s -> {stats["min_s"]:.4f}s)')
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Microbenchmark các hàm xử lý dữ liệu')
+    parser.add_argument('--sizes', default=','.join(str(s) for s in DEFAULT_SIZES))
+    parser.add_argument('--only', default=None, help='chỉ chạy các trường hợp có tên chứa chuỗi này')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--min-time', type=float, default=0.5)
+    parser.add_argument('--budget', type=float, default=30.0,
+                        help='bỏ qua kích thước lớn hơn khi một lần chạy vượt quá số giây này')
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--compare', default=None, help='file JSON của lần chạy trước để so sánh')
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> Dict[str, Any]:
+    args = parse_args(argv)
+    sizes = [int(s) for s in args.sizes.split(',') if s.strip()]
+    report = {
+        'environment': environment(),
+        'sizes': sizes,
+        'results': run(sizes, args.only, args.repeat, args.min_time, args.budget, args.seed),
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f'\nĐã ghi {args.output}')
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            compare(report, json.load(f))
+    return report
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,498 @@
+"""Backend giả lập cho các endpoint mà src/api sử dụng.
+
+Dùng để đo hiệu năng / chạy thử giao diện khi không có backend thật:
+
+    python tools/fake_backend.py --port 8000 --pumps 20 --rows-per-day 1440 --latency-ms 30
+
+rồi chạy app với URL_API_BASE=http://127.0.0.1:8000/api/v1. Dữ liệu được sinh
+ngẫu nhiên nhưng xác định (theo --seed), khối lượng và độ trễ cấu hình được.
+Hỗ trợ ETag / If-None-Match (trả 304) cho mọi GET; tắt bằng --no-etag.
+GET /__stats trả về số request đã phục vụ (dùng để tính QPS upstream).
+
+GET /api/v1/su-kien là luồng SSE: 'sensor' mỗi khi tới mốc bản ghi mới, 'pump'
+khi máy bơm được cập nhật (PUT /may-bom/<id>), 'notification' khi có thông báo
+mới. POST /__emit {"event": ..., "data": {...}} phát sự kiện thủ công; với
+'notification' một thông báo mới được thêm vào dữ liệu.
+"""
+from typing import Any, Dict, List, Optional
+from datetime import datetime, timedelta, timezone
+import argparse
+import base64
+import functools
+import hashlib
+import hmac
+import json
+import math
+import queue
+import random
+import threading
+import time
+from flask import Flask, Response, jsonify, request
+
+API_PREFIX = '/api/v1'
+JWT_SECRET = b'fake-backend-secret'
+LOCAL_TZ = timezone(timedelta(hours=7))
+
+
+class Config:
+    def __init__(self, pumps: int = 10, sensors_per_pump: int = 4, rows_per_day: int = 288, logs_per_day: int = 6,
+                 users: int = 50, models: int = 8, notifications: int = 20, days: int = 30,
+                 latency_ms: float = 0.0, jitter_ms: float = 0.0, etag: bool = True, seed: int = 42):
+        self.pumps = pumps
+        self.sensors_per_pump = sensors_per_pump
+        self.rows_per_day = rows_per_day
+        self.logs_per_day = logs_per_day
+        self.users = users
+        self.models = models
+        self.notifications = notifications
+        self.days = days
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.etag = etag
+        self.seed = seed
+
+
+# ---------------------------------------------------------------- JWT
+
+def _b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def make_token(user: Dict[str, Any], ttl: int = 3600) -> Dict[str, Any]:
+    exp = int(time.time()) + ttl
+    header = _b64(json.dumps({'alg': 'HS256', 'typ': 'JWT'}).encode())
+    payload = _b64(json.dumps({'sub': user['ma_nguoi_dung'], 'ten_dang_nhap': user['ten_dang_nhap'],
+                               'quan_tri_vien': user['quan_tri_vien'], 'exp': exp}).encode())
+    signature = _b64(hmac.new(JWT_SECRET, f'{header}.{payload}'.encode(), hashlib.sha256).digest())
+    return {'access_token': f'{header}.{payload}.{signature}', 'token_type': 'bearer', 'exp': exp}
+
+
+def check_token(header: Optional[str]) -> bool:
+    if not header or not header.startswith('Bearer '):
+        return False
+    parts = header[7:].split('.')
+    if len(parts) != 3:
+        return False
+    expected = _b64(hmac.new(JWT_SECRET, f'{parts[0]}.{parts[1]}'.encode(), hashlib.sha256).digest())
+    return hmac.compare_digest(expected, parts[2])
+
+
+# ---------------------------------------------------------------- data
+
+class Store:
+    """Dữ liệu tĩnh (máy bơm, cảm biến, ...) và bộ sinh dữ liệu theo ngày."""
+
+    def __init__(self, config: Config):
+        self.config = config
+        self.lock = threading.Lock()
+        rng = random.Random(config.seed)
+        created = (datetime.now(LOCAL_TZ) - timedelta(days=config.days)).replace(microsecond=0)
+
+        self.sensor_types = [
+            {'ma_loai_cam_bien': i + 1, 'ten_loai_cam_bien': name, 'mo_ta': name}
+            for i, name in enumerate(['Lưu lượng', 'Độ ẩm đất', 'Nhiệt độ', 'Độ ẩm không khí', 'Mưa'])
+        ]
+        self.users = {}
+        for i in range(1, config.users + 1):
+            username = 'admin' if i == 1 else f'user{i}'
+            self.users[i] = {
+                'ma_nguoi_dung': i, 'ten_dang_nhap': username, 'ho_ten': f'Người dùng {i}',
+                'email': f'{username}@example.com', 'so_dien_thoai': f'09{i:08d}', 'dia_chi': 'Hà Nội',
+                'quan_tri_vien': i == 1, 'trang_thai': rng.random() > 0.2,
+                'thoi_gian_tao': (created - timedelta(days=rng.randint(0, 365))).isoformat(),
+                'dang_nhap_lan_cuoi': created.isoformat(),
+            }
+        self.pumps = {}
+        for i in range(1, config.pumps + 1):
+            self.pumps[i] = {
+                'ma_may_bom': i, 'ten_may_bom': f'Máy bơm {i}', 'mo_ta': f'Khu vực {i}',
+                'ma_iot_lk': f'IOT-{i:04d}', 'che_do': rng.choice([0, 1, 2]), 'trang_thai': rng.random() > 0.5,
+                'gioi_han_thoi_gian': 30, 'ma_nguoi_dung': rng.randint(1, config.users),
+                'thoi_gian_tao': created.isoformat(),
+            }
+        self.sensors = {}
+        sensor_id = 1
+        for pump_id in self.pumps:
+            for j in range(config.sensors_per_pump):
+                sensor_type = self.sensor_types[j % len(self.sensor_types)]
+                self.sensors[sensor_id] = {
+                    'ma_cam_bien': sensor_id, 'ten_cam_bien': f'{sensor_type["ten_loai_cam_bien"]} {pump_id}',
+                    'ma_may_bom': pump_id, 'ten_may_bom': self.pumps[pump_id]['ten_may_bom'],
+                    'ma_loai_cam_bien': sensor_type['ma_loai_cam_bien'],
+                    'ten_loai_cam_bien': sensor_type['ten_loai_cam_bien'],
+                    'ngay_lap_dat': created.date().isoformat(), 'vi_tri_lap_dat': f'Vị trí {sensor_id}',
+                    'trang_thai': True, 'ma_nguoi_dung': self.pumps[pump_id]['ma_nguoi_dung'],
+                }
+                sensor_id += 1
+        self.models = {}
+        for i in range(1, config.models + 1):
+            self.models[i] = {
+                'ma_mo_hinh': i, 'ten_mo_hinh': f'Mô hình {i}', 'phien_ban': f'1.{i}',
+                'mo_ta': 'Mô hình dự báo lưu lượng', 'trang_thai': i == 1,
+                'do_chinh_xac': round(0.8 + rng.random() * 0.15, 3), 'thoi_gian_tao': created.isoformat(),
+            }
+        self.notifications = {}
+        for i in range(1, config.notifications + 1):
+            self.notifications[i] = {
+                'ma_thong_bao': i, 'tieu_de': f'Thông báo {i}', 'noi_dung': 'Máy bơm đã bật',
+                'loai': rng.choice(['info', 'warning', 'success']), 'da_xem': rng.random() > 0.5,
+                'thoi_gian_tao': (created + timedelta(hours=i)).strftime('%Y-%m-%dT%H:%M:%S'),
+            }
+
+    def next_id(self, table: Dict[int, Any]) -> int:
+        return max(table, default=0) + 1
+
+    @functools.lru_cache(maxsize=4096)
+    def sensor_rows(self, pump_id: int, day: str) -> tuple:
+        """Dữ liệu cảm biến của một máy bơm trong một ngày, tăng dần theo thời gian."""
+        rows_per_day = max(1, self.config.rows_per_day)
+        step = 86400.0 / rows_per_day
+        start = datetime.fromisoformat(day).replace(tzinfo=LOCAL_TZ)
+        rng = random.Random(f'{self.config.seed}-{pump_id}-{day}')
+        rows = []
+        for k in range(rows_per_day):
+            at = start + timedelta(seconds=k * step)
+            hour = at.hour + at.minute / 60
+            daily = math.sin((hour - 6) / 24 * 2 * math.pi)
+            flow = max(0.0, 12 + 6 * daily + rng.gauss(0, 1.5))
+            rows.append({
+                'ma_du_lieu': pump_id * 10_000_000 + int(start.timestamp() // 86400) * rows_per_day + k,
+                'ma_may_bom': pump_id,
+                'ma_nguoi_dung': self.pumps.get(pump_id, {}).get('ma_nguoi_dung', 1),
+                'ngay': day,
+                'luu_luong_nuoc': round(flow, 2),
+                'do_am_dat': round(min(100, max(0, 45 - 10 * daily + rng.gauss(0, 3))), 2),
+                'nhiet_do': round(28 + 5 * daily + rng.gauss(0, 0.5), 2),
+                'do_am': round(min(100, max(0, 70 - 12 * daily + rng.gauss(0, 2))), 2),
+                'mua': 1 if rng.random() < 0.05 else 0,
+                'so_xung': int(flow * 7.5),
+                'tong_the_tich': round(flow * step / 60, 2),
+                'thoi_gian_tao': at.strftime('%Y-%m-%dT%H:%M:%S'),
+                'ghi_chu': '',
+            })
+        return tuple(rows)
+
+    def rows_until_now(self, pump_id: int, day: str) -> List[Dict[str, Any]]:
+        rows = self.sensor_rows(pump_id, day)
+        now = datetime.now(LOCAL_TZ).strftime('%Y-%m-%dT%H:%M:%S')
+        return [r for r in rows if r['thoi_gian_tao'] <= now]
+
+    @functools.lru_cache(maxsize=4096)
+    def pump_logs(self, pump_id: int, day: str) -> tuple:
+        rng = random.Random(f'log-{self.config.seed}-{pump_id}-{day}')
+        start = datetime.fromisoformat(day).replace(tzinfo=LOCAL_TZ)
+        logs = []
+        for k in range(self.config.logs_per_day):
+            on = start + timedelta(hours=24 * k / max(1, self.config.logs_per_day), minutes=rng.randint(0, 60))
+            off = on + timedelta(minutes=rng.randint(5, 90))
+            logs.append({
+                'ma_nhat_ky': hash((pump_id, day, k)) & 0x7FFFFFFF, 'ma_may_bom': pump_id,
+                'thoi_gian_bat': on.strftime('%Y-%m-%dT%H:%M:%S'),
+                'thoi_gian_tat': off.strftime('%Y-%m-%dT%H:%M:%S'),
+                'thoi_gian_tao': on.strftime('%Y-%m-%dT%H:%M:%S'),
+                'ghi_chu': rng.choice(['Tự động', 'Thủ công']),
+            })
+        logs.sort(key=lambda log: log['thoi_gian_bat'], reverse=True)
+        return tuple(logs)
+
+
+def _page(items: List[Any], default_limit: Optional[int] = None) -> Dict[str, Any]:
+    limit = request.args.get('limit', type=int) or default_limit
+    offset = request.args.get('offset', type=int) or 0
+    total = len(items)
+    data = items[offset:offset + limit] if limit else items[offset:]
+    return {'data': data, 'total': total, 'limit': limit, 'offset': offset}
+
+
+def _days_back(days: int) -> List[str]:
+    today = datetime.now(LOCAL_TZ).date()
+    return [(today - timedelta(days=i)).isoformat() for i in range(days)]
+
+
+def create_app(config: Config) -> Flask:
+    app = Flask('fake_backend')
+    store = Store(config)
+    stats = {'requests': 0, 'not_modified': 0, 'bytes': 0, 'started': time.time()}
+    stats_lock = threading.Lock()
+    listeners: List[queue.Queue] = []
+
+    def emit(event: str, data: Dict[str, Any]) -> int:
+        with store.lock:
+            targets = list(listeners)
+        for q in targets:
+            try:
+                q.put_nowait((event, data))
+            except queue.Full:
+                pass
+        return len(targets)
+
+    @app.before_request
+    def _before():
+        if request.path.startswith('/__'):
+            return None
+        if config.latency_ms or config.jitter_ms:
+            time.sleep(max(0.0, config.latency_ms + random.uniform(-config.jitter_ms, config.jitter_ms)) / 1000.0)
+        public = request.path.startswith(API_PREFIX + '/auth/')
+        if not public and not check_token(request.headers.get('Authorization')):
+            return jsonify({'detail': 'Không có quyền truy cập'}), 401
+        return None
+
+    @app.after_request
+    def _after(resp: Response):
+        if request.path == '/__stats':
+            return resp
+        with stats_lock:
+            stats['requests'] += 1
+        if resp.is_streamed:
+            return resp
+        if config.etag and request.method == 'GET' and resp.status_code == 200:
+            body = resp.get_data()
+            etag = '"' + hashlib.md5(body).hexdigest() + '"'
+            resp.headers['ETag'] = etag
+            if etag in request.headers.get('If-None-Match', ''):
+                with stats_lock:
+                    stats['not_modified'] += 1
+                not_modified = Response(status=304)
+                not_modified.headers['ETag'] = etag
+                return not_modified
+        with stats_lock:
+            stats['bytes'] += resp.calculate_content_length() or 0
+        return resp
+
+    @app.get('/__stats')
+    def _stats():
+        with stats_lock:
+            snapshot = dict(stats)
+        snapshot['uptime'] = time.time() - snapshot.pop('started')
+        return jsonify(snapshot)
+
+    # ---- auth
+    @app.post(API_PREFIX + '/auth/dang-nhap')
+    def login():
+        body = request.get_json(silent=True) or {}
+        user = next((u for u in store.users.values() if u['ten_dang_nhap'] == body.get('ten_dang_nhap')), None)
+        if user is None:
+            return jsonify({'detail': 'Sai tên đăng nhập hoặc mật khẩu'}), 401
+        return jsonify({**make_token(user), 'message': 'Đăng nhập thành công'})
+
+    @app.post(API_PREFIX + '/auth/dang-ky')
+    def register():
+        body = request.get_json(silent=True) or {}
+        with store.lock:
+            new_id = store.next_id(store.users)
+            store.users[new_id] = {'ma_nguoi_dung': new_id, 'ten_dang_nhap': body.get('ten_dang_nhap'),
+                                   'ho_ten': body.get('ho_ten'), 'quan_tri_vien': False, 'trang_thai': True,
+                                   'thoi_gian_tao': datetime.now(LOCAL_TZ).isoformat()}
+        return jsonify({'message': 'Đăng ký thành công'}), 201
+
+    @app.post(API_PREFIX + '/auth/<path:action>')
+    def auth_other(action):
+        return jsonify({'message': 'Thành công'})
+
+    # ---- generic CRUD for small tables
+    def crud(name: str, table: Dict[int, Any], key: str, lookup=None, on_update=None):
+        def list_items():
+            return jsonify(_page(list(table.values())))
+
+        def get_item(item_id):
+            item = lookup(item_id) if lookup else table.get(int(item_id)) if str(item_id).isdigit() else None
+            if item is None:
+                return jsonify({'detail': 'Không tìm thấy'}), 404
+            return jsonify(item)
+
+        def create_item():
+            body = request.get_json(silent=True) or {}
+            with store.lock:
+                new_id = store.next_id(table)
+                table[new_id] = {**body, key: new_id}
+            return jsonify({'message': 'Tạo thành công', 'data': table[new_id]}), 201
+
+        def update_item(item_id):
+            body = request.get_json(silent=True) or {}
+            item = lookup(item_id) if lookup else table.get(int(item_id))
+            if item is None:
+                return jsonify({'detail': 'Không tìm thấy'}), 404
+            with store.lock:
+                item.update(body)
+            if on_update:
+                on_update(item)
+            return jsonify({'message': 'Cập nhật thành công', 'data': item})
+
+        def delete_item(item_id):
+            with store.lock:
+                table.pop(int(item_id), None)
+            return jsonify({'message': 'Xóa thành công'})
+
+        base = f'{API_PREFIX}/{name}'
+        app.add_url_rule(base, f'{name}_list', list_items, methods=['GET'])
+        app.add_url_rule(base, f'{name}_create', create_item, methods=['POST'])
+        app.add_url_rule(base + '/', f'{name}_create_slash', create_item, methods=['POST'])
+        app.add_url_rule(base + '/<item_id>', f'{name}_get', get_item, methods=['GET'])
+        app.add_url_rule(base + '/<item_id>', f'{name}_update', update_item, methods=['PUT'])
+        app.add_url_rule(base + '/<item_id>', f'{name}_delete', delete_item, methods=['DELETE'])
+
+    def find_user(item_id):
+        if str(item_id).isdigit():
+            return store.users.get(int(item_id))
+        return next((u for u in store.users.values() if u['ten_dang_nhap'] == item_id), None)
+
+    crud('may-bom', store.pumps, 'ma_may_bom',
+         on_update=lambda pump: emit('pump', {'ids': [str(pump['ma_may_bom'])]}))
+    crud('cam-bien', store.sensors, 'ma_cam_bien')
+    crud('mo-hinh-du-bao', store.models, 'ma_mo_hinh')
+    crud('nguoi-dung', store.users, 'ma_nguoi_dung', lookup=find_user)
+
+    @app.get(API_PREFIX + '/loai-cam-bien')
+    def sensor_types():
+        items = []
+        for st in store.sensor_types:
+            count = sum(1 for s in store.sensors.values() if s['ma_loai_cam_bien'] == st['ma_loai_cam_bien'])
+            items.append({**st, 'tong_cam_bien': count})
+        return jsonify({'data': items, 'total': len(items)})
+
+    @app.route(API_PREFIX + '/loai-cam-bien/', methods=['POST'])
+    @app.route(API_PREFIX + '/loai-cam-bien/<int:item_id>', methods=['PUT', 'DELETE'])
+    def sensor_types_write(item_id=None):
+        return jsonify({'message': 'Thành công'})
+
+    # ---- sensor data
+    def pump_filter() -> List[int]:
+        pump_id = request.args.get('ma_may_bom', type=int)
+        return [pump_id] if pump_id else sorted(store.pumps)
+
+    @app.get(API_PREFIX + '/du-lieu-cam-bien')
+    def sensor_data():
+        # Mới nhất trước, trải trên `days` ngày gần nhất.
+        pumps = pump_filter()
+        limit = request.args.get('limit', type=int) or 20
+        offset = request.args.get('offset', type=int) or 0
+        rows: List[Dict[str, Any]] = []
+        total = 0
+        for day in _days_back(config.days):
+            day_rows = [r for p in pumps for r in store.rows_until_now(p, day)]
+            total += len(day_rows)
+            if len(rows) < offset + limit:
+                day_rows.sort(key=lambda r: r['thoi_gian_tao'], reverse=True)
+                rows.extend(day_rows)
+        return jsonify({'data': rows[offset:offset + limit], 'total': total, 'limit': limit, 'offset': offset})
+
+    @app.get(API_PREFIX + '/du-lieu-cam-bien/ngay/<day>')
+    def sensor_data_by_day(day):
+        rows = [r for p in pump_filter() for r in store.rows_until_now(p, day)]
+        rows.sort(key=lambda r: r['thoi_gian_tao'])
+        return jsonify(_page(rows))
+
+    @app.put(API_PREFIX + '/du-lieu-cam-bien/')
+    def sensor_data_put():
+        return jsonify({'message': 'Cập nhật dữ liệu thành công'})
+
+    # ---- pump logs
+    @app.get(API_PREFIX + '/nhat-ky-may-bom')
+    def pump_logs():
+        logs = [log for day in _days_back(config.days) for p in pump_filter() for log in store.pump_logs(p, day)]
+        return jsonify(_page(logs))
+
+    @app.get(API_PREFIX + '/nhat-ky-may-bom/ngay/<day>')
+    def pump_logs_by_day(day):
+        logs = [log for p in pump_filter() for log in store.pump_logs(p, day)]
+        return jsonify(_page(logs))
+
+    # ---- notifications
+    @app.get(API_PREFIX + '/thong-bao/user/<int:user_id>')
+    def notifications(user_id):
+        items = sorted(store.notifications.values(), key=lambda n: n['thoi_gian_tao'], reverse=True)
+        return jsonify(_page([{**n, 'ma_nguoi_dung': user_id} for n in items]))
+
+    @app.post(API_PREFIX + '/thong-bao/<int:item_id>/mark-as-read')
+    def notification_read(item_id):
+        with store.lock:
+            if item_id in store.notifications:
+                store.notifications[item_id]['da_xem'] = True
+        return jsonify({'id': item_id, 'is_read': True})
+
+    @app.post(API_PREFIX + '/thong-bao/mark-all-as-read')
+    def notification_read_all():
+        with store.lock:
+            for n in store.notifications.values():
+                n['da_xem'] = True
+        return jsonify({'message': 'OK'})
+
+    @app.delete(API_PREFIX + '/thong-bao/<path:item>')
+    def notification_delete(item):
+        return jsonify({'message': 'OK'})
+
+    # ---- events (SSE)
+    @app.get(API_PREFIX + '/su-kien')
+    def events():
+        q: queue.Queue = queue.Queue(maxsize=100)
+        with store.lock:
+            listeners.append(q)
+        step = 86400.0 / max(config.rows_per_day, 1)
+
+        def generate():
+            slot = int(time.time() // step)
+            try:
+                yield 'retry: 3000\n\n'
+                while True:
+                    try:
+                        event, data = q.get(timeout=min(step, 1.0))
+                    except queue.Empty:
+                        current = int(time.time() // step)
+                        if current == slot:
+                            yield ': keepalive\n\n'
+                            continue
+                        slot = current
+                        event, data = 'sensor', {'thoi_gian': datetime.now(LOCAL_TZ).isoformat()}
+                    yield f'event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n'
+            finally:
+                with store.lock:
+                    listeners.remove(q)
+
+        return Response(generate(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+    @app.post('/__emit')
+    def _emit():
+        body = request.get_json(silent=True) or {}
+        event, data = body.get('event', 'sensor'), body.get('data') or {}
+        if event == 'notification':
+            with store.lock:
+                new_id = store.next_id(store.notifications)
+                store.notifications[new_id] = {
+                    'ma_thong_bao': new_id, 'tieu_de': data.get('tieu_de', f'Thông báo {new_id}'),
+                    'noi_dung': data.get('noi_dung', ''), 'loai': data.get('loai', 'info'), 'da_xem': False,
+                    'thoi_gian_tao': datetime.now(LOCAL_TZ).strftime('%Y-%m-%dT%H:%M:%S'),
+                }
+        return jsonify({'listeners': emit(event, data)})
+
+    return app
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Backend giả lập cho predict_water_flow_fe')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--pumps', type=int, default=10)
+    parser.add_argument('--sensors-per-pump', type=int, default=4)
+    parser.add_argument('--rows-per-day', type=int, default=288, help='số bản ghi cảm biến mỗi máy bơm mỗi ngày')
+    parser.add_argument('--logs-per-day', type=int, default=6)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--models', type=int, default=8)
+    parser.add_argument('--notifications', type=int, default=20)
+    parser.add_argument('--days', type=int, default=30, help='số ngày lịch sử của /du-lieu-cam-bien')
+    parser.add_argument('--latency-ms', type=float, default=0.0)
+    parser.add_argument('--jitter-ms', type=float, default=0.0)
+    parser.add_argument('--no-etag', action='store_true')
+    parser.add_argument('--seed', type=int, default=42)
+    return parser.parse_args(argv)
+
+
+def config_from_args(args: argparse.Namespace) -> Config:
+    return Config(pumps=args.pumps, sensors_per_pump=args.sensors_per_pump, rows_per_day=args.rows_per_day,
+                  logs_per_day=args.logs_per_day, users=args.users, models=args.models,
+                  notifications=args.notifications, days=args.days, latency_ms=args.latency_ms,
+                  jitter_ms=args.jitter_ms, etag=not args.no_etag, seed=args.seed)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    create_app(config_from_args(args)).run(host=args.host, port=args.port, threaded=True)
@@ -0,0 +1,368 @@
+"""Bộ tạo tải phát lại lưu lượng `_dash-update-component` của các trang chính.
+
+Ví dụ (tự khởi động backend giả lập và app trong cùng tiến trình):
+
+    python tools/loadgen.py --users 20 --duration 60 --latency-ms 30
+
+hoặc nhắm vào app / backend đang chạy sẵn:
+
+    python tools/loadgen.py --app-url http://127.0.0.1:8050 --backend-url http://127.0.0.1:8000
+
+Mỗi người dùng ảo đăng nhập, chọn một trang (home: tick 5 s, pump_detail:
+tick 1 s, devices: tick 5 s, admin: dashboard + bảng mô hình tick 5 s, kèm
+thông báo 10 s trên navbar), gọi các callback khi mở trang rồi theo chu kỳ
+của dcc.Interval. Kết quả: độ trễ p50/p95/p99 theo callback, số lỗi và QPS
+tới backend (đọc từ /__stats của backend giả lập).
+"""
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from datetime import date
+import argparse
+import json
+import os
+import random
+import socket
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC = os.path.join(ROOT, 'src')
+
+Values = Dict[str, Any]
+
+
+class Call:
+    """Một callback cần gọi: chọn theo chuỗi con của output, chạy khi mở trang và/hoặc theo chu kỳ."""
+
+    def __init__(self, label: str, output_match: str, values: Callable[['VirtualUser', int], Values],
+                 trigger: str, period: Optional[float] = None, on_open: bool = True):
+        self.label = label
+        self.output_match = output_match
+        self.values = values
+        self.trigger = trigger
+        self.period = period
+        self.on_open = on_open
+
+
+def _session_values(user: 'VirtualUser') -> Values:
+    return {'session-store.data': user.session, 'session-store.modified_timestamp': user.session_ts}
+
+
+def _notifications(period: float = 10.0) -> Call:
+    return Call('navbar.notifications', 'notifications-store.data',
+                lambda u, n: {**_session_values(u), 'notifications-refresh-interval.n_intervals': n,
+                              'notifications-offcanvas.is_open': False},
+                trigger='notifications-refresh-interval.n_intervals', period=period)
+
+
+PAGES: Dict[str, Dict[str, Any]] = {
+    'home': {'admin': False, 'calls': [
+        Call('home.sensor_cards', 'flow-rate.children',
+             lambda u, n: {**_session_values(u), 'interval-component.n_intervals': n, 'url.pathname': '/',
+                           'selected-pump-store.data': u.selected_pump},
+             trigger='interval-component.n_intervals', period=5.0),
+        Call('home.pump_control', 'control-selected-pump-name.children',
+             lambda u, n: {**_session_values(u), 'interval-component.n_intervals': n, 'url.pathname': '/',
+                           'selected-pump-store.data': u.selected_pump, 'pump-toggle.value': [],
+                           'auto-mode-btn.value': []},
+             trigger='interval-component.n_intervals', period=5.0),
+        Call('home.pump_history', 'home-pump-history.children',
+             lambda u, n: {**_session_values(u), 'interval-component.n_intervals': n,
+                           'selected-pump-store.data': u.selected_pump},
+             trigger='interval-component.n_intervals', period=5.0),
+        _notifications(),
+    ]},
+    'pump_detail': {'admin': False, 'calls': [
+        Call('pump_detail.info', 'pump-info-container.children',
+             lambda u, n: {'pump-detail-store.data': {'pump_id': u.pump_id}},
+             trigger='pump-detail-store.data'),
+        Call('pump_detail.sensor_data', 'pump-detail-data-container.children',
+             lambda u, n: {**_session_values(u), 'pump-detail-date-picker.date': date.today().isoformat(),
+                           'pump-detail-store.data': {'pump_id': u.pump_id},
+                           'pump-detail-page-store.data': {'page': 1, 'limit': 15},
+                           'pump-detail-showing-details.data': False},
+             trigger='pump-detail-store.data', period=1.0),
+        _notifications(),
+    ]},
+    'devices': {'admin': False, 'calls': [
+        Call('devices.refresh', 'device-pump-data-store.data',
+             lambda u, n: {**_session_values(u), 'device-refresh-interval.n_intervals': n},
+             trigger='device-refresh-interval.n_intervals', period=5.0),
+        Call('devices.sensor_chart', 'device-sensor-detail-chart.figure',
+             lambda u, n: {**_session_values(u), 'device-pump-data-store.data': {'data': [{'ma_may_bom': u.pump_id}]},
+                           'chart-time-filter.value': '24h'},
+             trigger='device-pump-data-store.data'),
+        Call('devices.pump_history', 'device-pump-history-body.children',
+             lambda u, n: {**_session_values(u), 'device-pump-data-store.data': {'data': [{'ma_may_bom': u.pump_id}]}},
+             trigger='device-pump-data-store.data'),
+        _notifications(),
+    ]},
+    'admin': {'admin': True, 'calls': [
+        Call('admin.dashboard', 'admin-dashboard.children',
+             lambda u, n: {**_session_values(u), 'url.pathname': '/admin'},
+             trigger='url.pathname'),
+        Call('admin.models_table', 'admin-models-table.children',
+             lambda u, n: {**_session_values(u), 'admin-models-interval.n_intervals': n,
+                           'admin-models-url.pathname': '/admin/models'},
+             trigger='admin-models-interval.n_intervals', period=5.0),
+        _notifications(),
+    ]},
+}
+DEFAULT_MIX = 'home=4,pump_detail=2,devices=2,admin=1'
+
+
+def load_callback_map() -> Dict[str, Dict[str, Any]]:
+    if SRC not in sys.path:
+        sys.path.insert(0, SRC)
+    cwd = os.getcwd()
+    os.chdir(SRC)
+    try:
+        import app as dash_app
+        from dash import _callback
+    finally:
+        os.chdir(cwd)
+    callback_map = dict(_callback.GLOBAL_CALLBACK_MAP)
+    callback_map.update(dash_app.app.callback_map)
+    return callback_map
+
+
+def resolve_output(callback_map: Dict[str, Any], match: str) -> str:
+    keys = [k for k in callback_map if match in k]
+    if not keys:
+        raise KeyError(f'Không tìm thấy callback có output chứa {match!r}')
+    return min(keys, key=len)
+
+
+def build_payload(output: str, spec: Dict[str, Any], values: Values, trigger: str) -> Dict[str, Any]:
+    def items(deps):
+        return [{'id': d['id'], 'property': d['property'], 'value': values.get(f"{d['id']}.{d['property']}")}
+                for d in deps]
+    return {
+        'output': output,
+        'inputs': items(spec['inputs']),
+        'state': items(spec.get('state', [])),
+        'changedPropIds': [trigger],
+    }
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+
+    def record(self, label: str, elapsed: float, ok: bool) -> None:
+        with self.lock:
+            self.latencies.setdefault(label, []).append(elapsed)
+            if not ok:
+                self.errors[label] = self.errors.get(label, 0) + 1
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(q / 100.0 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def summarize(values: List[float], errors: int) -> Dict[str, Any]:
+    ordered = sorted(values)
+    return {
+        'count': len(ordered),
+        'errors': errors,
+        'p50_ms': round(percentile(ordered, 50) * 1000, 2),
+        'p95_ms': round(percentile(ordered, 95) * 1000, 2),
+        'p99_ms': round(percentile(ordered, 99) * 1000, 2),
+        'max_ms': round((ordered[-1] if ordered else 0.0) * 1000, 2),
+    }
+
+
+class VirtualUser(threading.Thread):
+    def __init__(self, index: int, args: argparse.Namespace, callback_map: Dict[str, Any],
+                 recorder: Recorder, stop_at: float, pages: List[Tuple[str, float]]):
+        super().__init__(daemon=True, name=f'vu-{index}')
+        import requests
+        self.index = index
+        self.args = args
+        self.callback_map = callback_map
+        self.recorder = recorder
+        self.stop_at = stop_at
+        self.pages = pages
+        self.http = requests.Session()
+        self.rng = random.Random(args.seed + index)
+        self.sessions: Dict[bool, Dict[str, Any]] = {}
+        self.session: Dict[str, Any] = {}
+        self.session_ts = int(time.time() * 1000)
+        self.pump_id = 1 + index % max(1, args.pumps)
+        self.selected_pump = {'ma_may_bom': self.pump_id, 'ten_may_bom': f'Máy bơm {self.pump_id}'}
+
+    def login(self, admin: bool) -> Dict[str, Any]:
+        if admin not in self.sessions:
+            username = 'admin' if admin else f'user{2 + self.index % max(1, self.args.backend_users - 1)}'
+            resp = self.http.post(f'{self.args.backend_url}/api/v1/auth/dang-nhap',
+                                  json={'ten_dang_nhap': username, 'mat_khau': 'x'}, timeout=10)
+            token = resp.json().get('access_token')
+            self.sessions[admin] = {'authenticated': True, 'username': username, 'token': token,
+                                    'token_exp': time.time() + 3600, 'is_admin': admin}
+        return self.sessions[admin]
+
+    def fire(self, call: Call, n: int) -> None:
+        output = resolve_output(self.callback_map, call.output_match)
+        payload = build_payload(output, self.callback_map[output], call.values(self, n), call.trigger)
+        started = time.monotonic()
+        ok = False
+        try:
+            resp = self.http.post(f'{self.args.app_url}/_dash-update-component', json=payload, timeout=60)
+            # 204 = PreventUpdate, vẫn là phản hồi hợp lệ
+            ok = resp.status_code in (200, 204)
+        except Exception:
+            ok = False
+        self.recorder.record(call.label, time.monotonic() - started, ok)
+
+    def pick_page(self) -> str:
+        total = sum(w for _, w in self.pages)
+        point = self.rng.uniform(0, total)
+        for name, weight in self.pages:
+            point -= weight
+            if point <= 0:
+                return name
+        return self.pages[-1][0]
+
+    def run(self) -> None:
+        time.sleep(self.rng.uniform(0, min(2.0, self.args.ramp_up)))
+        while time.time() < self.stop_at:
+            page = PAGES[self.pick_page()]
+            self.session = self.login(page['admin'])
+            self.session_ts = int(time.time() * 1000)
+            leave_at = min(self.stop_at, time.time() + self.args.dwell)
+            schedule = []
+            for call in page['calls']:
+                if call.on_open:
+                    self.fire(call, 0)
+                if call.period:
+                    schedule.append([time.time() + call.period, call, 1])
+            while schedule and time.time() < leave_at:
+                schedule.sort(key=lambda item: item[0])
+                due, call, n = schedule[0]
+                wait = due - time.time()
+                if wait > 0:
+                    time.sleep(min(wait, max(0.0, leave_at - time.time())))
+                    continue
+                self.fire(call, n)
+                schedule[0] = [due + call.period, call, n + 1]
+            if not schedule:
+                time.sleep(max(0.0, leave_at - time.time()))
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _serve(app, port: int) -> None:
+    from werkzeug.serving import make_server
+    server = make_server('127.0.0.1', port, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+
+def backend_stats(backend_url: str) -> Optional[Dict[str, Any]]:
+    import requests
+    try:
+        return requests.get(f'{backend_url}/__stats', timeout=5).json()
+    except Exception:
+        return None
+
+
+def parse_mix(mix: str) -> List[Tuple[str, float]]:
+    pages = []
+    for part in mix.split(','):
+        name, _, weight = part.partition('=')
+        if name.strip() not in PAGES:
+            raise SystemExit(f'Trang không hỗ trợ: {name}. Chọn trong {", ".join(PAGES)}')
+        pages.append((name.strip(), float(weight or 1)))
+    return pages
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Phát lại lưu lượng callback Dash và đo độ trễ')
+    parser.add_argument('--users', type=int, default=10, help='số người dùng ảo')
+    parser.add_argument('--duration', type=float, default=60.0, help='thời gian chạy (giây)')
+    parser.add_argument('--dwell', type=float, default=30.0, help='thời gian ở mỗi trang (giây)')
+    parser.add_argument('--ramp-up', type=float, default=2.0)
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='tỉ lệ trang, vd home=4,admin=1')
+    parser.add_argument('--app-url', default=None, help='URL app Dash; bỏ trống để chạy app trong tiến trình')
+    parser.add_argument('--backend-url', default=None, help='URL gốc backend; bỏ trống để chạy backend giả lập')
+    parser.add_argument('--pumps', type=int, default=10)
+    parser.add_argument('--backend-users', type=int, default=50)
+    parser.add_argument('--rows-per-day', type=int, default=288)
+    parser.add_argument('--latency-ms', type=float, default=20.0)
+    parser.add_argument('--jitter-ms', type=float, default=5.0)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', dest='json_path', default=None, help='ghi kết quả ra file JSON')
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> Dict[str, Any]:
+    args = parse_args(argv)
+    pages = parse_mix(args.mix)
+
+    if args.backend_url is None:
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        import fake_backend
+        port = _free_port()
+        config = fake_backend.Config(pumps=args.pumps, users=args.backend_users, rows_per_day=args.rows_per_day,
+                                     latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, seed=args.seed)
+        _serve(fake_backend.create_app(config), port)
+        args.backend_url = f'http://127.0.0.1:{port}'
+    args.backend_url = args.backend_url.rstrip('/')
+    os.environ.setdefault('URL_API_BASE', f'{args.backend_url}/api/v1')
+
+    callback_map = load_callback_map()
+    if args.app_url is None:
+        import app as dash_app
+        port = _free_port()
+        _serve(dash_app.server, port)
+        args.app_url = f'http://127.0.0.1:{port}'
+    args.app_url = args.app_url.rstrip('/')
+
+    recorder = Recorder()
+    before = backend_stats(args.backend_url)
+    started = time.time()
+    stop_at = started + args.duration
+    users = [VirtualUser(i, args, callback_map, recorder, stop_at, pages) for i in range(args.users)]
+    for user in users:
+        user.start()
+    for user in users:
+        user.join(timeout=max(0.0, stop_at - time.time()) + 70)
+    elapsed = time.time() - started
+    after = backend_stats(args.backend_url)
+
+    all_latencies = [v for values in recorder.latencies.values() for v in values]
+    result = {
+        'users': args.users,
+        'duration_s': round(elapsed, 2),
+        'mix': args.mix,
+        'callbacks_per_s': round(len(all_latencies) / elapsed, 2) if elapsed else 0.0,
+        'overall': summarize(all_latencies, sum(recorder.errors.values())),
+        'by_callback': {label: summarize(values, recorder.errors.get(label, 0))
+                        for label, values in sorted(recorder.latencies.items())},
+    }
+    if before and after:
+        upstream = after['requests'] - before['requests']
+        result['upstream'] = {
+            'requests': upstream,
+            'qps': round(upstream / elapsed, 2) if elapsed else 0.0,
+            'not_modified': after['not_modified'] - before['not_modified'],
+            'bytes': after['bytes'] - before['bytes'],
+        }
+
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+    return result
+
+
+if __name__ == '__main__':
+    main()